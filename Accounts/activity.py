@@ -0,0 +1,218 @@
+# Accounts/activity.py
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import UserActivityLog
+
+logger = logging.getLogger(__name__)
+
+# Logs queued before they are written in one bulk_create, see ACTIVITY_LOG_BUFFER_SIZE
+DEFAULT_BUFFER_SIZE = 100
+# Seconds a queued log waits at most before it is written, see ACTIVITY_LOG_FLUSH_INTERVAL
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+# Actions after which the user's profile score is updated, not only analyzed
+PROFILE_SCORE_ACTIONS = ('Uploaded file', 'Deleted file')
+
+SPOOLED_FIELDS = ('user_id', 'action', 'details', 'payload', 'data_file_id', 'project_id', 'task_id')
+
+
+def dispatch_activity(logs: List[UserActivityLog]):
+    """
+    Count a batch of saved logs and schedule the risk analysis of their users.
+
+    Every user of the batch gets one risk update, which also updates the profile score
+    if any of their logs is a file upload or deletion.
+    """
+    from Dataleakage.counters import get_activity_counters
+    from Dataleakage.tasks import schedule_user_risk_update
+
+    # Counted before scheduling, so the anomaly checks already include this batch
+    counters = get_activity_counters()
+    update_profile = {}
+    for log in logs:
+        counters.record(log.user_id, log.action, log.timestamp)
+        update_profile[log.user_id] = update_profile.get(log.user_id, False) or log.action in PROFILE_SCORE_ACTIONS
+
+    for user_id, update in update_profile.items():
+        logger.info(f"Processing activity for user {user_id}")
+        schedule_user_risk_update(user_id, update_profile=update)
+
+
+class ActivityLogBuffer:
+    """
+    Queue of activity logs written to the database in batches.
+
+    Logs are written with one bulk_create once ``max_size`` of them are queued or the
+    oldest has waited ``flush_interval`` seconds, whichever comes first, and each
+    written batch is handed to dispatch_activity. A batch the database refuses is
+    written row by row; rows that still cannot be written, and everything queued when
+    the process exits without a database, are spooled to JSON files in ``spool_dir``
+    and written by the next flush of any process.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_BUFFER_SIZE, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 spool_dir: Optional[str] = None):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.spool_dir = spool_dir
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def add(self, log: UserActivityLog):
+        with self._lock:
+            self._pending.append(log)
+            full = len(self._pending) >= self.max_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write every queued and spooled log now; returns how many were written"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        written = self._write(batch)
+        # Spooled logs wait for the database to take this batch first
+        if written == len(batch):
+            written += self._replay_spool()
+        return written
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Flushing activity logs failed")
+        finally:
+            # The timer thread's connection would otherwise stay open
+            connections.close_all()
+
+    def _write(self, batch: List[UserActivityLog]) -> int:
+        if not batch:
+            return 0
+        try:
+            with transaction.atomic():
+                UserActivityLog.objects.bulk_create(batch)
+            written = batch
+        except IntegrityError:
+            logger.warning(f"Writing {len(batch)} activity logs at once failed; writing them one by one")
+            written = [log for log in batch if self._write_one(log)]
+        except DatabaseError:
+            logger.exception(f"Writing {len(batch)} activity logs failed")
+            self._spool(batch)
+            return 0
+        if written:
+            dispatch_activity(written)
+        return len(written)
+
+    def _write_one(self, log: UserActivityLog) -> bool:
+        try:
+            with transaction.atomic():
+                UserActivityLog.objects.bulk_create([log])
+            return True
+        except IntegrityError:
+            # The file, project or task was deleted before the log was written
+            log.data_file_id = log.project_id = log.task_id = None
+            try:
+                with transaction.atomic():
+                    UserActivityLog.objects.bulk_create([log])
+                return True
+            except DatabaseError:
+                pass
+        except DatabaseError:
+            pass
+        self._spool([log])
+        return False
+
+    def _spool(self, logs: List[UserActivityLog]):
+        if not self.spool_dir:
+            logger.error(f"Dropped {len(logs)} activity logs; ACTIVITY_LOG_SPOOL_DIR is not set")
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Written under a temporary name, so a replay never picks up a half-written file
+        path = os.path.join(self.spool_dir, f'{uuid.uuid4().hex}.jsonl')
+        with open(path + '.tmp', 'w', encoding='utf-8') as spool:
+            for log in logs:
+                record = {field: getattr(log, field) for field in SPOOLED_FIELDS}
+                record['timestamp'] = log.timestamp.isoformat()
+                spool.write(json.dumps(record) + '\n')
+        os.replace(path + '.tmp', path)
+        logger.warning(f"Spooled {len(logs)} activity logs to {path}")
+
+    def _replay_spool(self) -> int:
+        if not self.spool_dir or not os.path.isdir(self.spool_dir):
+            return 0
+        written = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith('.jsonl'):
+                continue
+            # Claim the file, so concurrent flushes of other processes skip it
+            path = os.path.join(self.spool_dir, name)
+            claimed = f'{path}.{os.getpid()}.replaying'
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, encoding='utf-8') as spool:
+                logs = []
+                for line in spool:
+                    record = json.loads(line)
+                    record['timestamp'] = parse_datetime(record['timestamp'])
+                    logs.append(UserActivityLog(**record))
+            written += self._write(logs)  # Rows that fail again are spooled anew
+            os.remove(claimed)
+        return written
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_activity_buffer() -> ActivityLogBuffer:
+    """The activity log buffer of this process, flushed when the process exits"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ActivityLogBuffer(
+                    max_size=getattr(settings, 'ACTIVITY_LOG_BUFFER_SIZE', DEFAULT_BUFFER_SIZE),
+                    flush_interval=getattr(settings, 'ACTIVITY_LOG_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+                    spool_dir=getattr(settings, 'ACTIVITY_LOG_SPOOL_DIR', None)
+                )
+                atexit.register(flush_activity_logs)
+    return _buffer
+
+
+def flush_activity_logs() -> int:
+    """Write the logs queued in this process, e.g. before a worker process exits"""
+    if _buffer is None:
+        return 0
+    return _buffer.flush()
+
+
+def log_activity(user, action: str, details: str = '', **fields) -> UserActivityLog:
+    """
+    Record an action of a user; the log is written by the next flush of the buffer.
+
+    ``fields`` are further UserActivityLog fields such as ``payload`` or ``data_file``.
+    The returned log has no primary key until it is written.
+    """
+    log = UserActivityLog(user=user, action=action, details=details, **fields)
+    get_activity_buffer().add(log)
+    return log
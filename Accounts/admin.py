@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Profile, UserActivityLog, BlockedUser
+from .models import Profile, UserActivityLog, UserActivityRollup, BlockedUser
 
 
 @admin.register(Profile)
@@ -60,14 +60,24 @@ class UserActivityLogAdmin(admin.ModelAdmin):
     list_filter = ('action', 'timestamp')
     # Allow sorting by timestamp
     ordering = ('-timestamp',)  # Sort by timestamp in descending order
+    # Pick the related file, project or task by id rather than from a list of all of them
+    raw_id_fields = ('data_file', 'project', 'task')
 
     # Optional: You can also customize the detail view layout for this model
     fieldsets = (
         (None, {
-            'fields': ('user', 'action', 'timestamp', 'details')
+            'fields': ('user', 'action', 'timestamp', 'details', 'payload', 'data_file', 'project', 'task')
         }),
     )
 
+@admin.register(UserActivityRollup)
+class UserActivityRollupAdmin(admin.ModelAdmin):
+    # Daily counts of activity logs past the retention period
+    list_display = ('user', 'action', 'date', 'count', 'first_timestamp', 'last_timestamp')
+    search_fields = ('user__username', 'action')
+    list_filter = ('action', 'date')
+    ordering = ('-date',)
+
 # Optional: Register the other models
 try:
     admin.site.register(UserActivityLog)
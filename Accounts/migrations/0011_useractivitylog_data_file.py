@@ -0,0 +1,52 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:43
+
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_upload_logs_to_files(apps, schema_editor):
+    # Upload logs recorded the absolute path of the file in their JSON details, as written
+    # on the server that stored it (e.g. a Windows path), so files are matched by their name
+    # under the upload directory instead
+    UserActivityLog = apps.get_model('Accounts', 'UserActivityLog')
+    DataFile = apps.get_model('DataExplorer', 'DataFile')
+    file_ids = dict(DataFile.objects.values_list('file', 'id'))
+
+    linked = []
+    unlinked = 0
+    logs = UserActivityLog.objects.filter(action='Uploaded file', details__contains='file_path')
+    for log in logs.only('id', 'details').iterator(chunk_size=1000):
+        try:
+            file_path = json.loads(log.details).get('file_path')
+        except (ValueError, AttributeError):
+            file_path = None
+        name = None
+        if isinstance(file_path, str) and file_path:
+            name = 'data_files/' + file_path.replace('\\', '/').rsplit('/', 1)[-1]
+        if name in file_ids:
+            log.data_file_id = file_ids[name]
+            linked.append(log)
+        else:
+            unlinked += 1
+    UserActivityLog.objects.bulk_update(linked, ['data_file'], batch_size=1000)
+    if linked or unlinked:
+        print(f"\n  Linked {len(linked)} upload logs to their files; {unlinked} left unlinked")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0010_blockeduser_is_active'),
+        ('DataExplorer', '0008_datafile_scanned_file_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useractivitylog',
+            name='data_file',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='activity_logs', to='DataExplorer.datafile'),
+        ),
+        migrations.RunPython(link_upload_logs_to_files, migrations.RunPython.noop),
+    ]
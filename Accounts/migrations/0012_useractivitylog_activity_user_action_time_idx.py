@@ -0,0 +1,20 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0011_useractivitylog_data_file'),
+        ('DataExplorer', '0008_datafile_scanned_file_state'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useractivitylog',
+            index=models.Index(fields=['user', 'action', 'timestamp'], name='activity_user_action_time_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:48
+
+import json
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+PROJECT_NAME = re.compile(r'(?:created|updated|deleted) project (.+)\.$')
+TASK_NAME = re.compile(r'(?:created|updated|deleted) task "(.+)"\.$')
+
+
+def structure_activity_details(apps, schema_editor):
+    # File actions stored a JSON object in details, the others a sentence naming the project or task
+    UserActivityLog = apps.get_model('Accounts', 'UserActivityLog')
+    Project = apps.get_model('Projects', 'Project')
+    Task = apps.get_model('Tasks', 'Task')
+
+    def ids_by_unique_name(queryset, field):
+        ids = {}
+        for name, object_id in queryset.values_list(field, 'id'):
+            ids[name] = None if name in ids else object_id  # Ambiguous names are not linked
+        return ids
+
+    project_ids = ids_by_unique_name(Project.objects, 'name')
+    task_ids = ids_by_unique_name(Task.objects, 'task_name')
+    task_projects = dict(Task.objects.values_list('id', 'project_id'))
+
+    updated = []
+    logs = UserActivityLog.objects.only('id', 'action', 'details')
+    for log in logs.iterator(chunk_size=1000):
+        details = log.details.strip()
+        if details.startswith('{'):
+            try:
+                data = json.loads(details)
+            except ValueError:
+                continue
+            if not isinstance(data, dict):
+                continue
+            log.details = data.pop('message', '')
+            log.payload = data
+        elif log.action.endswith(' project') and PROJECT_NAME.search(details):
+            name = PROJECT_NAME.search(details).group(1)
+            log.payload = {'project_name': name}
+            if log.action != 'Deleted project':
+                log.project_id = project_ids.get(name)
+        elif log.action.endswith(' task') and TASK_NAME.search(details):
+            name = TASK_NAME.search(details).group(1)
+            log.payload = {'task_name': name}
+            if log.action != 'Deleted task':
+                log.task_id = task_ids.get(name)
+                log.project_id = task_projects.get(log.task_id)
+        else:
+            continue
+        updated.append(log)
+    UserActivityLog.objects.bulk_update(updated, ['details', 'payload', 'project', 'task'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0013_useractivityrollup'),
+        ('Projects', '0001_initial'),
+        ('Tasks', '0004_task_creator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useractivitylog',
+            name='payload',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='useractivitylog',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='activity_logs', to='Projects.project'),
+        ),
+        migrations.AddField(
+            model_name='useractivitylog',
+            name='task',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='activity_logs', to='Tasks.task'),
+        ),
+        migrations.RunPython(structure_activity_details, migrations.RunPython.noop),
+    ]
@@ -7,6 +7,9 @@ import os
 
 
 class Profile(models.Model):
+    # Users whose sensitivity score reaches this are blocked
+    BLOCKING_SCORE = 80.0
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     otp_code = models.CharField(max_length=6, null=True, blank=True)
     otp_expiry = models.DateTimeField(null=True, blank=True)
@@ -41,7 +44,7 @@ class Profile(models.Model):
             print(f"Profile picture saved at: {self.profile_picture.url}")
 
         # Block the user if their sensitivity score crosses the threshold
-        if self.sensitivity_score >= 80.0 and self.user.is_active:
+        if self.sensitivity_score >= self.BLOCKING_SCORE and self.user.is_active:
             self.block_user("Sensitivity score threshold exceeded")
 
     def generate_otp(self):
@@ -70,13 +73,59 @@ class Profile(models.Model):
 class UserActivityLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='account_activities')
     action = models.CharField(max_length=255)  # Description of the action
-    timestamp = models.DateTimeField(auto_now_add=True)  # Time of the action
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)  # Time of the action, not of its write
     details = models.TextField(blank=True)  # Additional details about the action
+    payload = models.JSONField(default=dict, blank=True)  # Structured data of the action, e.g. file name or row
+    data_file = models.ForeignKey('DataExplorer.DataFile', on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='activity_logs')  # File the action was about, if any
+    project = models.ForeignKey('Projects.Project', on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='activity_logs')  # Project the action was about, if any
+    task = models.ForeignKey('Tasks.Task', on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='activity_logs')  # Task the action was about, if any
+
+    class Meta:
+        indexes = [
+            # Per-user activity of given actions within a time window (anomaly and behavior analysis)
+            models.Index(fields=['user', 'action', 'timestamp'], name='activity_user_action_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.action} at {self.timestamp}"
 
 
+class UserActivityRollup(models.Model):
+    """Daily count of one user's logs of one action, kept after the logs themselves are compacted"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_rollups')
+    action = models.CharField(max_length=255)
+    date = models.DateField()  # Day of the logs, in the project time zone
+    count = models.PositiveIntegerField(default=0)
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'action', 'date'], name='unique_activity_rollup_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.action} x{self.count} on {self.date}"
+
+    @classmethod
+    def activity_count(cls, user, since, actions=None):
+        """
+        Number of the user's logs since a time, across compacted and live logs.
+
+        Compacted days are counted whole, so for a ``since`` older than the retention
+        horizon the count starts at the beginning of that day.
+        """
+        rollups = cls.objects.filter(user=user, date__gte=timezone.localdate(since))
+        logs = UserActivityLog.objects.filter(user=user, timestamp__gte=since)
+        if actions is not None:
+            rollups = rollups.filter(action__in=actions)
+            logs = logs.filter(action__in=actions)
+        return (rollups.aggregate(total=models.Sum('count'))['total'] or 0) + logs.count()
+
+
 class BlockedUser(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     reason = models.TextField(blank=True)  # Optional reason for blocking
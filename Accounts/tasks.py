@@ -0,0 +1,104 @@
+# Accounts/tasks.py
+import logging
+import time
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UserActivityLog, UserActivityRollup
+
+logger = logging.getLogger(__name__)
+
+# Logs older than this many days are compacted into daily rollups, see ACTIVITY_LOG_RETENTION_DAYS
+DEFAULT_RETENTION_DAYS = 90
+# Logs compacted and deleted per transaction, see ACTIVITY_COMPACTION_BATCH_SIZE
+DEFAULT_COMPACTION_BATCH_SIZE = 1000
+# A run stops after this many seconds; the next run carries on
+COMPACTION_TIME_LIMIT = 10 * 60
+COMPACTION_LOCK_KEY = 'compact_activity_logs_lock'
+
+
+@shared_task
+def compact_activity_logs():
+    """
+    Fold activity logs older than the retention horizon into per-user, per-action daily rollups.
+
+    Logs are processed oldest first in small batches. Each batch adds its counts to the
+    rollups and deletes its logs in one short transaction, so the database is never
+    locked for long and an interrupted run leaves no log counted twice. The horizon is
+    a day boundary, so a day is only compacted once it is complete.
+    """
+    retention_days = getattr(settings, 'ACTIVITY_LOG_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    batch_size = getattr(settings, 'ACTIVITY_COMPACTION_BATCH_SIZE', DEFAULT_COMPACTION_BATCH_SIZE)
+    horizon = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=retention_days)
+
+    # Overlapping runs would add the same logs to the rollups twice
+    if not cache.add(COMPACTION_LOCK_KEY, True, timeout=COMPACTION_TIME_LIMIT + 60):
+        logger.info("Previous activity log compaction is still running; skipping this run")
+        return None
+
+    try:
+        deadline = time.monotonic() + COMPACTION_TIME_LIMIT
+        compacted = 0
+        while time.monotonic() < deadline:
+            batch_count = _compact_batch(horizon, batch_size)
+            if not batch_count:
+                break
+            compacted += batch_count
+
+        logger.info(f"Compacted {compacted} activity logs older than {horizon:%Y-%m-%d}")
+        return compacted
+    finally:
+        cache.delete(COMPACTION_LOCK_KEY)
+
+
+@transaction.atomic
+def _compact_batch(horizon, batch_size) -> int:
+    # Logs linked to a file, project or task are kept, the scoring and history of those read them
+    logs = list(
+        UserActivityLog.objects.filter(timestamp__lt=horizon, data_file__isnull=True,
+                                       project__isnull=True, task__isnull=True)
+        .order_by('id')
+        .values_list('id', 'user_id', 'action', 'timestamp')[:batch_size]
+    )
+    if not logs:
+        return 0
+
+    # Aggregate the batch per user, action and day
+    totals = {}
+    for _, user_id, action, timestamp in logs:
+        key = (user_id, action, timezone.localdate(timestamp))
+        count, first, last = totals.get(key, (0, timestamp, timestamp))
+        totals[key] = (count + 1, min(first, timestamp), max(last, timestamp))
+
+    # Add to the rollups of those days that already exist, create the others
+    existing = {
+        (rollup.user_id, rollup.action, rollup.date): rollup
+        for rollup in UserActivityRollup.objects.filter(
+            user_id__in={user_id for user_id, _, _ in totals},
+            date__in={date for _, _, date in totals},
+            action__in={action for _, action, _ in totals},
+        )
+    }
+    updated = []
+    created = []
+    for key, (count, first, last) in totals.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            user_id, action, date = key
+            created.append(UserActivityRollup(user_id=user_id, action=action, date=date, count=count,
+                                              first_timestamp=first, last_timestamp=last))
+        else:
+            rollup.count += count
+            rollup.first_timestamp = min(rollup.first_timestamp, first)
+            rollup.last_timestamp = max(rollup.last_timestamp, last)
+            updated.append(rollup)
+    UserActivityRollup.objects.bulk_create(created)
+    UserActivityRollup.objects.bulk_update(updated, ['count', 'first_timestamp', 'last_timestamp'])
+
+    UserActivityLog.objects.filter(id__in=[log_id for log_id, *_ in logs]).delete()
+    return len(logs)
@@ -1,3 +1,329 @@
-from django.test import TestCase
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from DataExplorer.models import DataFile
+from .activity import ActivityLogBuffer
+from .models import UserActivityLog, UserActivityRollup
+from .tasks import compact_activity_logs
+
+
+@skipUnless(connection.vendor == 'sqlite', "Query plans are checked with SQLite's EXPLAIN QUERY PLAN")
+class UserActivityLogIndexTests(TestCase):
+    """The per-user activity queries of the anomaly and behavior analysis must not scan the table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('SCAN Accounts_useractivitylog', plan)
+
+    def test_recent_actions_of_user_use_composite_index(self):
+        queryset = UserActivityLog.objects.filter(
+            user=self.user,
+            action='Uploaded file',
+            timestamp__gte=timezone.now() - timedelta(hours=1)
+        ).order_by('-timestamp')
+        self.assertUsesIndex(queryset, 'activity_user_action_time_idx')
+
+    def test_action_count_of_user_uses_composite_index(self):
+        queryset = UserActivityLog.objects.filter(
+            user=self.user,
+            action='Failed login',
+            timestamp__gte=timezone.now() - timedelta(hours=1)
+        ).values('id')
+        self.assertUsesIndex(queryset, 'activity_user_action_time_idx')
+
+    def test_several_actions_of_user_use_composite_index(self):
+        queryset = UserActivityLog.objects.filter(
+            user=self.user,
+            action__in=['Created task', 'Deleted task']
+        ).order_by('-timestamp')
+        self.assertUsesIndex(queryset, 'activity_user_action_time_idx')
+
+
+class ActivityCompactionTests(TestCase):
+    """Old logs are folded into rollups, except those the file scoring and history still read"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst')
+        cls.data_file = DataFile.objects.create(title='Report', file='data_files/report.csv', file_type='csv',
+                                                uploaded_by=cls.user, user=cls.user)
+        old = timezone.now() - timedelta(days=200)
+        UserActivityLog.objects.bulk_create([
+            UserActivityLog(user=cls.user, action='Logged in', timestamp=old),
+            UserActivityLog(user=cls.user, action='Logged in', timestamp=old),
+            UserActivityLog(user=cls.user, action='Uploaded file', timestamp=old, data_file=cls.data_file),
+        ])
+
+    def test_linked_logs_are_kept(self):
+        self.assertEqual(compact_activity_logs(), 2)
+        self.assertQuerySetEqual(
+            UserActivityLog.objects.values_list('action', 'data_file'), [('Uploaded file', self.data_file.id)]
+        )
+        self.assertQuerySetEqual(UserActivityRollup.objects.values_list('action', 'count'), [('Logged in', 2)])
+        self.assertEqual(
+            UserActivityRollup.activity_count(self.user, timezone.now() - timedelta(days=365)), 3
+        )
+
+
+class ActivityLogBufferTests(TestCase):
+    """Queued logs are written in batches, and kept on disk while the database refuses them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst')
+        cls.other_user = User.objects.create_user('auditor')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool_dir = os.path.join(directory.name, 'spool')
+        # Risk updates are checked on their own below
+        patcher = mock.patch('Dataleakage.tasks.schedule_user_risk_update')
+        self.schedule_user_risk_update = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_buffer(self, max_size=100, flush_interval=60):
+        buffer = ActivityLogBuffer(max_size=max_size, flush_interval=flush_interval, spool_dir=self.spool_dir)
+        self.addCleanup(buffer.flush)
+        return buffer
+
+    def log(self, action='Logged in', user=None, **fields):
+        return UserActivityLog(user=user or self.user, action=action, **fields)
+
+    def spooled_files(self):
+        return sorted(os.listdir(self.spool_dir)) if os.path.isdir(self.spool_dir) else []
+
+    def test_full_buffer_is_written_at_once(self):
+        buffer = self.make_buffer(max_size=3)
+        buffer.add(self.log())
+        buffer.add(self.log())
+        self.assertEqual(UserActivityLog.objects.count(), 0)
+        buffer.add(self.log())
+        self.assertEqual(UserActivityLog.objects.count(), 3)
+        self.assertIsNone(buffer._timer)
+
+    def test_first_queued_log_starts_flush_timer(self):
+        buffer = self.make_buffer(flush_interval=5)
+        buffer.add(self.log())
+        timer = buffer._timer
+        self.assertEqual((timer.interval, timer.function), (5, buffer._flush_on_timer))
+        buffer.add(self.log())
+        self.assertIs(buffer._timer, timer)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertFalse(timer.is_alive())
+
+    def test_refused_batch_is_spooled_and_replayed(self):
+        buffer = self.make_buffer()
+        buffer.add(self.log(payload={'file_name': 'report.csv'}))
+        buffer.add(self.log('Uploaded file'))
+        with mock.patch.object(UserActivityLog.objects, 'bulk_create', side_effect=OperationalError("locked")), \
+                self.assertLogs('Accounts.activity', level='WARNING'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(UserActivityLog.objects.count(), 0)
+        self.assertEqual(len(self.spooled_files()), 1)
+        self.schedule_user_risk_update.assert_not_called()
+
+        # The next batch the database takes brings the spooled logs with it
+        buffer.add(self.log('Deleted file'))
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(self.spooled_files(), [])
+        self.assertQuerySetEqual(
+            UserActivityLog.objects.order_by('id').values_list('action', 'payload'),
+            [('Deleted file', {}), ('Logged in', {'file_name': 'report.csv'}), ('Uploaded file', {})]
+        )
+
+    def test_spooled_logs_wait_while_batch_is_refused(self):
+        buffer = self.make_buffer()
+        buffer.add(self.log())
+        with mock.patch.object(UserActivityLog.objects, 'bulk_create', side_effect=OperationalError("locked")), \
+                self.assertLogs('Accounts.activity', level='WARNING'):
+            buffer.flush()
+            buffer.add(self.log())
+            buffer.flush()
+        self.assertEqual(len(self.spooled_files()), 2)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(self.spooled_files(), [])
+
+    def test_one_risk_update_per_user_per_batch(self):
+        buffer = self.make_buffer(max_size=4)
+        buffer.add(self.log('Logged in'))
+        buffer.add(self.log('Uploaded file'))
+        buffer.add(self.log('Logged in', user=self.other_user))
+        buffer.add(self.log('Created task', user=self.other_user))
+        self.assertEqual(sorted(self.schedule_user_risk_update.call_args_list), sorted([
+            mock.call(self.user.id, update_profile=True),
+            mock.call(self.other_user.id, update_profile=False),
+        ]))
+
+
+class ActivityLogBufferTransactionTests(TransactionTestCase):
+    """Behaviour that needs real commits: deferred foreign key checks and the flush timer's own thread"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('analyst')
+        patcher = mock.patch('Dataleakage.tasks.schedule_user_risk_update')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_log_of_deleted_file_is_written_without_link(self):
+        data_file = DataFile.objects.create(title='Report', file='data_files/report.csv', file_type='csv',
+                                            uploaded_by=self.user, user=self.user)
+        buffer = ActivityLogBuffer(max_size=100, flush_interval=60)
+        buffer.add(UserActivityLog(user=self.user, action='Uploaded file', data_file_id=data_file.id))
+        buffer.add(UserActivityLog(user=self.user, action='Deleted file', data_file_id=data_file.id + 1))
+        with self.assertLogs('Accounts.activity', level='WARNING'):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertQuerySetEqual(UserActivityLog.objects.order_by('id').values_list('action', 'data_file'),
+                                 [('Uploaded file', data_file.id), ('Deleted file', None)])
+
+    def test_queued_logs_are_written_after_flush_interval(self):
+        buffer = ActivityLogBuffer(max_size=100, flush_interval=0.05)
+        buffer.add(UserActivityLog(user=self.user, action='Logged in'))
+        deadline = time.monotonic() + 5
+        while not UserActivityLog.objects.exists() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(UserActivityLog.objects.count(), 1)
+        self.assertIsNone(buffer._timer)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Runs the migrations up to ``migrate_to`` over rows created by ``set_up_before_migration`` at ``migrate_from``"""
+    migrate_from = []
+    migrate_to = []
+
+    def setUp(self):
+        super().setUp()
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        self.addCleanup(self.migrate_to_latest)
+        self.set_up_before_migration(executor.loader.project_state(self.migrate_from).apps)
+        executor = MigrationExecutor(connection)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            executor.migrate(self.migrate_to)
+        self.migration_output = output.getvalue()
+        self.apps = executor.loader.project_state(self.migrate_to).apps
+
+    def set_up_before_migration(self, apps):
+        pass
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+class LinkUploadLogsMigrationTests(MigrationTestCase):
+    """Upload logs are linked to their files by the name under data_files/, whatever path the server wrote"""
+    migrate_from = [('Accounts', '0010_blockeduser_is_active'), ('DataExplorer', '0008_datafile_scanned_file_state')]
+    migrate_to = [('Accounts', '0011_useractivitylog_data_file')]
+
+    def set_up_before_migration(self, apps):
+        user = apps.get_model('auth', 'User').objects.create(username='alice')
+        DataFile = apps.get_model('DataExplorer', 'DataFile')
+        self.file_ids = {
+            name: DataFile.objects.create(title=name, file=f'data_files/{name}', file_type='csv',
+                                          uploaded_by=user, user=user).id
+            for name in ('report.csv', 'report_x7Kq2Lm.csv', 'plain.csv')
+        }
+
+        UserActivityLog = apps.get_model('Accounts', 'UserActivityLog')
+        paths = {
+            'windows': r'C:\Users\alice\SafeNet\media\data_files\report.csv',
+            'renamed': r'D:\srv\media\data_files\report_x7Kq2Lm.csv',
+            'posix': '/var/www/media/data_files/plain.csv',
+            'deleted': r'C:\Users\alice\SafeNet\media\data_files\gone.csv',
+        }
+        self.log_ids = {
+            key: UserActivityLog.objects.create(user=user, action='Uploaded file',
+                                                details=json.dumps({'message': 'm', 'file_path': path})).id
+            for key, path in paths.items()
+        }
+        self.log_ids['other action'] = UserActivityLog.objects.create(
+            user=user, action='Deleted file', details=json.dumps({'file_path': paths['posix']})).id
+
+    def data_file_id(self, key):
+        return self.apps.get_model('Accounts', 'UserActivityLog').objects.get(id=self.log_ids[key]).data_file_id
+
+    def test_logs_are_linked_by_file_name(self):
+        self.assertEqual(self.data_file_id('windows'), self.file_ids['report.csv'])
+        self.assertEqual(self.data_file_id('renamed'), self.file_ids['report_x7Kq2Lm.csv'])
+        self.assertEqual(self.data_file_id('posix'), self.file_ids['plain.csv'])
+
+    def test_unmatched_logs_are_left_and_reported(self):
+        self.assertIsNone(self.data_file_id('deleted'))
+        self.assertIsNone(self.data_file_id('other action'))
+        self.assertIn('Linked 3 upload logs to their files; 1 left unlinked', self.migration_output)
+
+
+class StructureActivityDetailsMigrationTests(MigrationTestCase):
+    """Logs written before the payload, project and task fields get them filled from their details"""
+    migrate_from = [('Accounts', '0013_useractivityrollup'), ('Projects', '0001_initial'), ('Tasks', '0004_task_creator')]
+    migrate_to = [('Accounts', '0014_useractivitylog_payload_project_task')]
+
+    def set_up_before_migration(self, apps):
+        user = apps.get_model('auth', 'User').objects.create(username='alice')
+        Project = apps.get_model('Projects', 'Project')
+        Task = apps.get_model('Tasks', 'Task')
+        dates = {'start_date': '2024-01-01', 'end_date': '2024-02-01'}
+        apollo = Project.objects.create(name='Apollo', description='', status='in_progress', priority='high',
+                                        creator=user, **dates)
+        for _ in range(2):
+            Project.objects.create(name='Twin', description='', status='in_progress', priority='low',
+                                   creator=user, **dates)
+        docs = Task.objects.create(task_name='Write docs', description='', project=apollo, status='not_started',
+                                   priority='low', estimated_time=3, **dates)
+        self.project_id, self.task_id = apollo.id, docs.id
+
+        UserActivityLog = apps.get_model('Accounts', 'UserActivityLog')
+        logs = {
+            'upload': ('Uploaded file', json.dumps({'message': 'User alice uploaded file "a.csv".',
+                                                    'file_path': '/media/data_files/a.csv'})),
+            'row': ('Updated row', json.dumps({'message': 'User alice updated row 3.', 'file_name': 'a', 'row_id': 3})),
+            'project': ('Updated project', 'User alice updated project Apollo.'),
+            'deleted project': ('Deleted project', 'User alice deleted project Apollo.'),
+            'ambiguous project': ('Created project', 'User alice created project Twin.'),
+            'task': ('Created task', 'User alice created task "Write docs".'),
+            'deleted task': ('Deleted task', 'User alice deleted task "Write docs".'),
+            'login': ('Logged in', 'User alice logged in.'),
+            'broken json': ('Uploaded file', '{"message": '),
+        }
+        self.log_ids = {key: UserActivityLog.objects.create(user=user, action=action, details=details).id
+                        for key, (action, details) in logs.items()}
+
+    def log(self, key):
+        log = self.apps.get_model('Accounts', 'UserActivityLog').objects.get(id=self.log_ids[key])
+        return log.details, log.payload, log.project_id, log.task_id
+
+    def test_json_details_become_payloads(self):
+        self.assertEqual(self.log('upload'), ('User alice uploaded file "a.csv".',
+                                              {'file_path': '/media/data_files/a.csv'}, None, None))
+        self.assertEqual(self.log('row'), ('User alice updated row 3.', {'file_name': 'a', 'row_id': 3}, None, None))
+
+    def test_projects_and_tasks_are_linked_by_name(self):
+        self.assertEqual(self.log('project')[1:], ({'project_name': 'Apollo'}, self.project_id, None))
+        self.assertEqual(self.log('task')[1:], ({'task_name': 'Write docs'}, self.project_id, self.task_id))
+
+    def test_deleted_and_ambiguous_names_are_not_linked(self):
+        self.assertEqual(self.log('deleted project')[1:], ({'project_name': 'Apollo'}, None, None))
+        self.assertEqual(self.log('deleted task')[1:], ({'task_name': 'Write docs'}, None, None))
+        self.assertEqual(self.log('ambiguous project')[1:], ({'project_name': 'Twin'}, None, None))
+
+    def test_other_logs_are_left_alone(self):
+        self.assertEqual(self.log('login'), ('User alice logged in.', {}, None, None))
+        self.assertEqual(self.log('broken json'), ('{"message": ', {}, None, None))
@@ -6,7 +6,8 @@ from .forms import ForgotPasswordForm, OTPVerificationForm, ResetPasswordForm, P
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from .models import Profile, UserActivityLog, BlockedUser
+from .activity import log_activity
+from .models import Profile, BlockedUser
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.contrib.sessions.models import Session
@@ -40,7 +41,7 @@ def login_view(request):
                     request.session.set_expiry(0)
 
                 # Log the successful login
-                UserActivityLog.objects.create(
+                log_activity(
                     user=user,
                     action='Logged in',
                     details=f'User {user.username} logged in successfully.'
@@ -70,7 +71,7 @@ def logout_view(request):
         user = request.user
 
         # Log the logout action
-        UserActivityLog.objects.create(
+        log_activity(
             user=user,
             action='Logged out',
             details=f'User {user.username} logged out successfully.'
@@ -100,7 +101,7 @@ def register_view(request):
             Profile.objects.create(user=user, sensitivity_score=0.0, is_blocked=False)
 
             # Log the successful registration
-            UserActivityLog.objects.create(
+            log_activity(
                 user=user,
                 action='Registered account',
                 details=f'User {user.username} registered a new account.'
@@ -124,7 +125,7 @@ def forgot_password(request):
                 messages.success(request, "OTP sent successfully!")
 
                 # Log the action of sending OTP
-                UserActivityLog.objects.create(
+                log_activity(
                     user=user,
                     action='Requested OTP for password reset',
                     details=f'User {user.username} requested OTP for password reset.'
@@ -184,7 +185,7 @@ def reset_password(request):
             user.save()
 
             # Log the password reset action
-            UserActivityLog.objects.create(
+            log_activity(
                 user=user,
                 action='Reset password',
                 details=f'User {user.username} reset their password.'
@@ -209,7 +210,7 @@ def account_settings(request):
             profile.save()
 
             # Log the profile update action
-            UserActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 action='Updated profile settings',
                 details='User updated their account settings.'
@@ -236,7 +237,7 @@ def blocked_users_view(request):
                 user_to_block.save()
 
                 # Log the block action
-                UserActivityLog.objects.create(
+                log_activity(
                     user=request.user,
                     action='Blocked user',
                     details=f'User {request.user.username} blocked {user_to_block.username}.'
@@ -8,6 +8,7 @@ from Notifications.models import Notification
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.auth.models import User
+from Accounts.models import UserActivityRollup
 
 
 @login_required
@@ -135,6 +136,9 @@ def dashboard(request):
         if previous_month_users > 0 else 0
     )
 
+    # User's activity over the last quarter, including logs already folded into rollups
+    recent_activity_count = UserActivityRollup.activity_count(user, timezone.now() - timedelta(days=90))
+
     context = {
         'user': user,
         'total_projects': total_projects,
@@ -155,6 +159,7 @@ def dashboard(request):
         'total_users': total_users,
         'new_users': new_users,
         'user_growth': user_growth,
+        'recent_activity_count': recent_activity_count,
     }
 
     return render(request, 'Dashboard/dashboard.html', context)
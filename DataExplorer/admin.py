@@ -1,6 +1,6 @@
 # admin.py
 from django.contrib import admin
-from .models import DataFile, DataVisualization
+from .models import DataFile, DataVisualization, ScanCacheEntry
 
 
 @admin.register(DataFile)
@@ -24,3 +24,12 @@ class DataVisualizationAdmin(admin.ModelAdmin):
     list_filter = ('chart_type', 'created_at')
     readonly_fields = ('created_at',)
     ordering = ('-created_at',)
+
+
+@admin.register(ScanCacheEntry)
+class ScanCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'rule_set_version', 'sensitivity_score', 'created_at')
+    search_fields = ('content_hash',)
+    list_filter = ('rule_set_version',)
+    readonly_fields = ('created_at',)
+    ordering = ('-created_at',)
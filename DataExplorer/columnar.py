@@ -0,0 +1,324 @@
+# DataExplorer/columnar.py
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# Directory next to an uploaded file that holds its columnar copy
+SIDECAR_SUFFIX = '.columns'
+MANIFEST_NAME = 'manifest.json'
+# Bumped when the layout changes; sidecars of other versions are ignored
+FORMAT_VERSION = 1
+# Rows of a CSV file parsed to size the chunks it is copied in
+CHUNK_SAMPLE_ROWS = 1000
+# Bytes of text copied at a time from a column's raw data into its array
+RAW_COPY_BYTES = 16 * 1024 * 1024
+
+
+def parse_file_data(file_path: str) -> pd.DataFrame:
+    """
+    Parse a CSV or Excel file into a DataFrame.
+    """
+    if file_path.endswith('.csv'):
+        return pd.read_csv(file_path)  # Load CSV files
+    elif file_path.endswith('.xlsx'):
+        return pd.read_excel(file_path)  # Load Excel files
+    else:
+        raise ValueError("Unsupported file type")  # Raise error for unsupported types
+
+
+def sidecar_path(file_path: str) -> str:
+    return file_path + SIDECAR_SUFFIX
+
+
+def write_sidecar(file_path: str, frame: Optional[pd.DataFrame] = None, chunk_budget: Optional[int] = None) -> bool:
+    """
+    Store a columnar copy of a data file next to it, one ``.npy`` array per column.
+
+    Numeric, boolean and datetime columns are stored as they are; text columns as the
+    UTF-8 bytes of all values plus their offsets and a null mask. The manifest records
+    the column names and types and the size and modification time of the file, so a
+    copy outlived by a change to the file is ignored. Returns False, writing nothing,
+    if a column holds values of mixed types that would not read back unchanged.
+
+    With a ``chunk_budget`` a CSV file is read in row chunks of about that many bytes
+    once parsed, each appended to the columns as it arrives, so the copy of a large file
+    is built without loading it whole.
+    """
+    # Taken before parsing, so a change made meanwhile leaves the copy stale
+    file_stat = os.stat(file_path)
+    if frame is not None:
+        chunks = nullcontext([frame])
+    elif chunk_budget and file_path.endswith('.csv'):
+        chunks = read_csv_chunks(file_path, chunk_budget)
+    else:
+        chunks = nullcontext([parse_file_data(file_path)])
+
+    target = sidecar_path(file_path)
+    staging = f'{target}.{uuid.uuid4().hex}.tmp'
+    os.makedirs(staging)
+    try:
+        writers = None
+        rows = 0
+        with chunks as reader:
+            for chunk in reader:
+                if writers is None:
+                    if not chunk.columns.is_unique:
+                        return False
+                    writers = [_ColumnWriter(staging, position) for position in range(len(chunk.columns))]
+                    names = list(chunk.columns)
+                if not isinstance(chunk.index, pd.RangeIndex):
+                    return False
+                for writer, (_, series) in zip(writers, chunk.items()):
+                    if not writer.append(series):
+                        return False
+                rows += len(chunk)
+        if writers is None:
+            return False
+
+        columns = []
+        for name, writer in zip(names, writers):
+            column = writer.finish()
+            if column is None:
+                return False
+            columns.append({'name': name if isinstance(name, (str, int, float)) else str(name), **column})
+        manifest = {
+            'version': FORMAT_VERSION,
+            'source_size': file_stat.st_size,
+            'source_mtime_ns': file_stat.st_mtime_ns,
+            'rows': rows,
+            'columns': columns,
+        }
+        with open(os.path.join(staging, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        remove_sidecar(file_path)
+        os.replace(staging, target)
+        return True
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+@contextmanager
+def read_csv_chunks(file_path: str, chunk_budget: int) -> Iterator[Iterator[pd.DataFrame]]:
+    """Row chunks of a CSV file, sized from a small sample to take about ``chunk_budget`` bytes each"""
+    sample = pd.read_csv(file_path, nrows=CHUNK_SAMPLE_ROWS)
+    row_bytes = max(1, sample.memory_usage(deep=True).sum() // max(1, len(sample)))
+    with pd.read_csv(file_path, chunksize=max(1, chunk_budget // row_bytes)) as reader:
+        yield reader
+
+
+class _ColumnWriter:
+    """
+    Appends the chunks of one column to raw files, then writes its ``.npy`` arrays.
+
+    Chunks are parsed on their own, so their types can differ: integer chunks with
+    float chunks, where some values are missing, are stored as floats, and all-missing
+    chunks of a text column as nulls, as one parse of the whole file would give. Any
+    other mix makes the column unstorable.
+    """
+
+    def __init__(self, directory: str, position: int):
+        self.directory = directory
+        self.position = position
+        # (kind, dtype, rows, all missing) of each chunk, in order
+        self.segments = []
+
+    def _path(self, part: str, extension: str = 'raw') -> str:
+        return os.path.join(self.directory, f'{self.position}.{part}.{extension}')
+
+    def _append_raw(self, part: str, array: np.ndarray):
+        with open(self._path(part), 'ab') as f:
+            array.tofile(f)
+
+    def append(self, series: pd.Series) -> bool:
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufmM':
+            values = series.to_numpy()
+            self._append_raw('values', values)
+            self.segments.append(('array', values.dtype, len(values), bool(series.isna().all())))
+            return True
+        if series.dtype != object or pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+            return False
+
+        nulls = series.isna().to_numpy()
+        encoded = [b'' if null else value.encode('utf-8') for value, null in zip(series.tolist(), nulls)]
+        self._append_raw('data', np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        self._append_raw('lengths', np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+        self._append_raw('nulls', nulls)
+        self.segments.append(('text', np.dtype(object), len(series), bool(nulls.all())))
+        return True
+
+    def finish(self) -> Optional[Dict]:
+        """Write the column's arrays and return its manifest entry, or None if its chunks do not mix"""
+        try:
+            return self._finish()
+        finally:
+            for part in ('values', 'data', 'lengths', 'nulls'):
+                if os.path.exists(self._path(part)):
+                    os.remove(self._path(part))
+
+    def _finish(self) -> Optional[Dict]:
+        if any(kind == 'text' for kind, *_ in self.segments):
+            if not all(kind == 'text' or all_null for kind, _, _, all_null in self.segments):
+                return None
+            self._finish_text()
+            return {'kind': 'text', 'dtype': 'object'}
+
+        dtypes = {dtype for _, dtype, _, _ in self.segments}
+        if len(dtypes) == 1:
+            dtype = dtypes.pop()
+        elif all(dtype.kind in 'iuf' for dtype in dtypes):
+            dtype = np.result_type(*dtypes)
+        else:
+            return None
+        values = self._open_array('values', dtype)
+        row = 0
+        for segment, segment_values in self._read_segments('values'):
+            values[row:row + len(segment_values)] = segment_values
+            row += len(segment_values)
+        return {'kind': 'array', 'dtype': str(dtype)}
+
+    def _finish_text(self):
+        rows = sum(segment_rows for _, _, segment_rows, _ in self.segments)
+        offsets = self._open_array('offsets', np.int64, rows + 1)
+        nulls = self._open_array('nulls', np.bool_, rows)
+        offsets[0] = 0
+        row = 0
+        lengths = self._read_segments('lengths', np.int64)
+        segment_nulls = self._read_segments('nulls', np.bool_)
+        for kind, _, segment_rows, _ in self.segments:
+            if kind == 'text':
+                chunk_lengths, chunk_nulls = next(lengths)[1], next(segment_nulls)[1]
+            else:
+                chunk_lengths, chunk_nulls = np.zeros(segment_rows, np.int64), np.ones(segment_rows, np.bool_)
+            np.cumsum(chunk_lengths, out=offsets[row + 1:row + 1 + segment_rows])
+            offsets[row + 1:row + 1 + segment_rows] += offsets[row]
+            nulls[row:row + segment_rows] = chunk_nulls
+            row += segment_rows
+
+        data = self._open_array('data', np.uint8, int(offsets[-1]))
+        if len(data):
+            with open(self._path('data'), 'rb') as f:
+                for start in range(0, len(data), RAW_COPY_BYTES):
+                    f.readinto(memoryview(data[start:start + RAW_COPY_BYTES]))
+
+    def _open_array(self, part: str, dtype, rows: Optional[int] = None) -> np.ndarray:
+        if rows is None:
+            rows = sum(segment_rows for _, _, segment_rows, _ in self.segments)
+        path = self._path(part, 'npy')
+        if not rows:
+            # An empty file cannot be mapped
+            np.save(path, np.empty(0, dtype=dtype), allow_pickle=False)
+            return np.empty(0, dtype=dtype)
+        # Written through the mapping, so the column is never held in memory whole
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(rows,))
+
+    def _read_segments(self, part: str, dtype=None) -> Iterator[Tuple[Tuple, np.ndarray]]:
+        """The raw values of each chunk that stored the part, one chunk at a time"""
+        offset = 0
+        for segment in self.segments:
+            kind, segment_dtype, segment_rows, _ = segment
+            if (kind == 'text') != (part != 'values'):
+                continue
+            segment_dtype = dtype or segment_dtype
+            values = np.fromfile(self._path(part), dtype=segment_dtype, count=segment_rows, offset=offset)
+            offset += segment_rows * np.dtype(segment_dtype).itemsize
+            yield segment, values
+
+
+def read_manifest(file_path: str) -> Optional[Dict]:
+    """The manifest of the file's columnar copy, or None if there is no current copy"""
+    try:
+        with open(os.path.join(sidecar_path(file_path), MANIFEST_NAME), encoding='utf-8') as f:
+            manifest = json.load(f)
+        file_stat = os.stat(file_path)
+    except (FileNotFoundError, ValueError):
+        return None
+    if (manifest.get('version') != FORMAT_VERSION
+            or manifest['source_size'] != file_stat.st_size
+            or manifest['source_mtime_ns'] != file_stat.st_mtime_ns):
+        return None
+    return manifest
+
+
+def read_sidecar(file_path: str, columns: Optional[Sequence] = None,
+                 rows: Union[slice, Sequence[int], None] = None) -> Optional[pd.DataFrame]:
+    """
+    The file's data from its columnar copy, or None if there is no current copy.
+
+    Only the requested columns are read, in the requested order, and only the given
+    ``rows``: a slice (a step is not supported) or a sequence of row positions. The
+    index keeps the row positions. Array columns are memory-mapped read-only rather
+    than loaded; text columns are decoded.
+    """
+    manifest = read_manifest(file_path)
+    if manifest is None:
+        return None
+    if rows is None or isinstance(rows, slice):
+        start, stop, _ = (rows or slice(None)).indices(manifest['rows'])
+        index = pd.RangeIndex(start, max(start, stop))
+        row_positions = None
+    else:
+        row_positions = np.asarray(rows, dtype=np.int64)
+        index = pd.Index(row_positions)
+
+    positions = {column['name']: position for position, column in enumerate(manifest['columns'])}
+    names = list(positions) if columns is None else list(columns)
+    missing = [name for name in names if name not in positions]
+    if missing:
+        raise KeyError(f"{missing} not in the columns of {os.path.basename(file_path)}")
+
+    directory = sidecar_path(file_path)
+    data = {}
+    for name in names:
+        position = positions[name]
+        column = manifest['columns'][position]
+
+        def load(part):
+            return np.load(os.path.join(directory, f'{position}.{part}.npy'), mmap_mode='r', allow_pickle=False)
+
+        if column['kind'] == 'array' and row_positions is None:
+            data[name] = load('values')[index.start:index.stop].view(np.ndarray)  # Still backed by the mapped file
+        elif column['kind'] == 'array':
+            data[name] = np.asarray(load('values')[row_positions])
+        elif row_positions is None:
+            offsets = load('offsets')[index.start:index.stop + 1]
+            data[name] = _decode_text(load('data')[offsets[0]:offsets[-1]], offsets - offsets[0],
+                                      load('nulls')[index.start:index.stop])
+        else:
+            data[name] = _decode_rows(load('data'), load('offsets'), load('nulls'), row_positions)
+    return pd.DataFrame(data, columns=names, index=index, copy=False)
+
+
+def _decode_text(data: np.ndarray, offsets: np.ndarray, nulls: np.ndarray) -> np.ndarray:
+    raw = data.tobytes()
+    values = np.empty(len(nulls), dtype=object)
+    values[:] = [raw[start:end].decode('utf-8') for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    values[nulls] = np.nan
+    return values
+
+
+def _decode_rows(data: np.ndarray, offsets: np.ndarray, nulls: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    # Each row is sliced out of the mapped bytes on its own, so scattered rows read only their own text
+    values = np.empty(len(rows), dtype=object)
+    values[:] = [data[start:end].tobytes().decode('utf-8')
+                 for start, end in zip(offsets[rows].tolist(), offsets[rows + 1].tolist())]
+    values[nulls[rows]] = np.nan
+    return values
+
+
+def read_column_names(file_path: str) -> Optional[List]:
+    """The file's column names from the manifest of its columnar copy, or None if there is no current copy"""
+    manifest = read_manifest(file_path)
+    if manifest is None:
+        return None
+    return [column['name'] for column in manifest['columns']]
+
+
+def remove_sidecar(file_path: str):
+    shutil.rmtree(sidecar_path(file_path), ignore_errors=True)
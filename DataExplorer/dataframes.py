@@ -0,0 +1,100 @@
+# DataExplorer/dataframes.py
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict
+
+import pandas as pd
+
+# Total size of the cached DataFrames, see DATAFRAME_CACHE_BYTES
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class DataFrameCache:
+    """
+    Parsed DataFrames of uploaded files, kept in memory up to a total size.
+
+    An entry is only used while the file's size and modification time are the ones it
+    was parsed from, so a file changed by any means is parsed again. The least recently
+    used frames are evicted once the cached frames outgrow ``max_bytes``; a frame larger
+    than the whole budget is returned but not kept.
+
+    Cached frames are shared between requests: callers must not modify them in place.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # path -> (mtime_ns, size, frame, frame bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path: str, loader: Callable[[str], pd.DataFrame]) -> pd.DataFrame:
+        file_stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[:2] == (file_stat.st_mtime_ns, file_stat.st_size):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            if entry is not None:
+                self._remove(path)
+
+        frame = loader(path)
+        frame_bytes = int(frame.memory_usage(deep=True).sum())
+        if frame_bytes > self.max_bytes:
+            return frame
+
+        with self._lock:
+            if path in self._entries:  # Parsed by a concurrent request meanwhile
+                self._remove(path)
+            self._entries[path] = (file_stat.st_mtime_ns, file_stat.st_size, frame, frame_bytes)
+            self._bytes += frame_bytes
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return frame
+
+    def invalidate(self, path: str):
+        """Drop the frame of a file, e.g. after writing to it"""
+        with self._lock:
+            if path in self._entries:
+                self._remove(path)
+
+    def _remove(self, path: str):
+        self._bytes -= self._entries.pop(path)[3]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_dataframe_cache() -> DataFrameCache:
+    """The DataFrame cache of this process, sized by DATAFRAME_CACHE_BYTES"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from django.conf import settings
+                _cache = DataFrameCache(getattr(settings, 'DATAFRAME_CACHE_BYTES', DEFAULT_CACHE_BYTES))
+    return _cache
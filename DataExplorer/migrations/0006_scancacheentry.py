@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:21
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DataExplorer', '0005_datavisualization_configuration_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('rule_set_version', models.CharField(max_length=64)),
+                ('sensitivity_score', models.FloatField()),
+                ('type_counts', models.JSONField(default=dict)),
+                ('findings', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_hash', 'rule_set_version'), name='unique_scan_per_content_and_rules')],
+            },
+        ),
+    ]
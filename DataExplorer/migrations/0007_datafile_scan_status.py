@@ -0,0 +1,40 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+def mark_existing_files_scanned(apps, schema_editor):
+    # Files uploaded before background scanning were scanned during the upload
+    DataFile = apps.get_model('DataExplorer', 'DataFile')
+    DataFile.objects.update(scan_status='done', scan_progress=100.0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DataExplorer', '0006_scancacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datafile',
+            name='scan_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='datafile',
+            name='scan_progress',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='datafile',
+            name='scan_status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='datafile',
+            name='scanned_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_existing_files_scanned, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DataExplorer', '0008_datafile_scanned_file_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datafile',
+            name='scan_updated_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+def fill_content_scores(apps, schema_editor):
+    # The scan cache holds the content score of every scanned file, under the rules it was scanned with
+    DataFile = apps.get_model('DataExplorer', 'DataFile')
+    ScanCacheEntry = apps.get_model('DataExplorer', 'ScanCacheEntry')
+    files = DataFile.objects.exclude(content_hash='').only('id', 'content_hash')
+    for data_file in files.iterator():
+        entry = (ScanCacheEntry.objects.filter(content_hash=data_file.content_hash)
+                 .order_by('-created_at').only('sensitivity_score').first())
+        if entry is not None:
+            DataFile.objects.filter(id=data_file.id).update(content_score=entry.sensitivity_score)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DataExplorer', '0009_datafile_scan_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datafile',
+            name='content_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_content_scores, migrations.RunPython.noop),
+    ]
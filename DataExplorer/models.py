@@ -1,7 +1,20 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 
 class DataFile(models.Model):
+    SCAN_QUEUED = 'queued'
+    SCAN_RUNNING = 'running'
+    SCAN_DONE = 'done'
+    SCAN_FAILED = 'failed'
+    SCAN_STATUSES = [
+        (SCAN_QUEUED, 'Queued'),
+        (SCAN_RUNNING, 'Running'),
+        (SCAN_DONE, 'Done'),
+        (SCAN_FAILED, 'Failed'),
+    ]
+
     title = models.CharField(max_length=255)
     file = models.FileField(upload_to='data_files/')  # Creates a folder called 'data_files' inside your media folder
     file_type = models.CharField(max_length=10)  # e.g., csv, xlsx
@@ -12,9 +25,24 @@ class DataFile(models.Model):
 
     # New fields for sensitivity score and findings
     sensitivity_score = models.FloatField(default=0.0)  # Sensitivity score, default to 0.0
+    # Score of the content alone, before the uploader's risk is combined in; None until scanned
+    content_score = models.FloatField(blank=True, null=True)
     sensitivity_notes = models.TextField(blank=True, null=True)  # Notes on why the score was given
     findings = models.TextField(blank=True, null=True)  # Detailed findings from the sensitivity analysis
 
+    # Background sensitivity scan, see DataExplorer.tasks.scan_data_file
+    scan_status = models.CharField(max_length=10, choices=SCAN_STATUSES, default=SCAN_QUEUED)
+    scan_progress = models.FloatField(default=0.0)  # Percentage of the file scanned so far
+    scan_error = models.TextField(blank=True, null=True)
+    # Last change of the scan status or progress; None if queueing the scan failed. The periodic
+    # sweep queues scans that are queued or running but stopped changing again, see SCAN_STALL_TIMEOUT
+    scan_updated_at = models.DateTimeField(default=timezone.now, blank=True, null=True)
+    scanned_at = models.DateTimeField(blank=True, null=True)
+    # File as it was when last scanned, so periodic sweeps only rescan files that changed
+    scanned_size = models.BigIntegerField(blank=True, null=True)
+    scanned_mtime_ns = models.BigIntegerField(blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+
     def get_uploader_initials(self):
         """Returns the initials of the uploader."""
         full_name = self.uploaded_by.get_full_name()
@@ -44,3 +72,31 @@ class DataVisualization(models.Model):
 
     def __str__(self):
         return f"{self.title} - {self.chart_type}"
+
+
+class ScanCacheEntry(models.Model):
+    """Scan results of a file's content, shared by every upload with the same bytes"""
+    content_hash = models.CharField(max_length=64)  # SHA-256 of the scanned content
+    rule_set_version = models.CharField(max_length=64)  # Detector rules the results were produced with
+    sensitivity_score = models.FloatField()  # 100 (safe) to 0 (highly sensitive), before other scores are combined
+    type_counts = models.JSONField(default=dict)  # Validated matches per sensitivity type
+    findings = models.JSONField(default=list, encoder=DjangoJSONEncoder)  # First findings of each type, see SCAN_MAX_FINDINGS_PER_TYPE
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash', 'rule_set_version'], name='unique_scan_per_content_and_rules'),
+        ]
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.rule_set_version})"
+
+
+class TaskCheckpoint(models.Model):
+    """Where a periodic task stopped, so its next run resumes instead of starting over"""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
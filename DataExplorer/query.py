@@ -0,0 +1,237 @@
+# DataExplorer/query.py
+import json
+import operator
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Memory the row orders of recent queries may take per process, see QUERY_CACHE_BYTES
+DEFAULT_QUERY_CACHE_BYTES = 64 * 1024 * 1024
+
+COMPARISONS = {
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'lt': operator.lt,
+    'le': operator.le,
+    'gt': operator.gt,
+    'ge': operator.ge,
+}
+TEXT_MATCHES = ('contains', 'startswith', 'endswith')
+NULL_CHECKS = ('isnull', 'notnull')
+OPERATORS = (*COMPARISONS, *TEXT_MATCHES, *NULL_CHECKS, 'in')
+
+
+class QueryError(ValueError):
+    """A query that cannot run against the file, e.g. naming an unknown column"""
+
+
+@dataclass(frozen=True)
+class RowQuery:
+    """Column predicates, sort keys and a free-text search over the rows of a data file"""
+    filters: Tuple[Tuple, ...] = ()  # (column, operator, value)
+    sort: Tuple[Tuple, ...] = ()  # (column, descending)
+    search: str = ''
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RowQuery':
+        try:
+            filters = tuple(
+                (item['column'], item.get('op', 'eq'), item.get('value'))
+                for item in data.get('filters') or []
+            )
+            sort = tuple(
+                (item['column'], bool(item.get('descending', False)))
+                for item in data.get('sort') or []
+            )
+            search = str(data.get('search') or '').strip()
+        except (TypeError, KeyError, AttributeError):
+            raise QueryError("filters and sort must be lists of objects with a 'column'")
+        for _, op, value in filters:
+            if op not in OPERATORS:
+                raise QueryError(f"Unknown filter operator '{op}'")
+            if op == 'in' and not isinstance(value, list):
+                raise QueryError("The 'in' operator takes a list of values")
+        return cls(filters=filters, sort=sort, search=search)
+
+    @property
+    def cache_key(self) -> str:
+        return json.dumps([self.filters, self.sort, self.search], sort_keys=True, default=str)
+
+    def columns(self, all_columns: Sequence, text_columns: Sequence) -> List:
+        """Columns the query reads: filtered and sorted ones, plus those the search can match"""
+        needed = [column for column, _, _ in self.filters] + [column for column, _ in self.sort]
+        if self.search:
+            needed += list(all_columns if self._search_number is not None else text_columns)
+        unknown = [column for column in needed if column not in all_columns]
+        if unknown:
+            raise QueryError(f"Unknown columns: {sorted(set(map(str, unknown)))}")
+        return list(dict.fromkeys(needed))
+
+    def row_order(self, data: pd.DataFrame) -> np.ndarray:
+        """
+        Positions of the matching rows in sort order.
+
+        ``data`` holds at least the columns the query reads, indexed by row position.
+        Every predicate is evaluated over whole columns; the search matches text columns
+        case-insensitively, and numeric columns equal to it if it is a number.
+        """
+        mask = np.ones(len(data), dtype=bool)
+        for column, op, value in self.filters:
+            mask &= _predicate(data[column], op, value)
+        if self.search:
+            mask &= self._search_mask(data)
+
+        matches = data.loc[mask]
+        if self.sort:
+            by = [column for column, _ in self.sort]
+            ascending = [not descending for _, descending in self.sort]
+            try:
+                matches = matches.sort_values(by, ascending=ascending, kind='mergesort', na_position='last')
+            except TypeError:
+                # Columns mixing numbers and text are ordered by their text
+                matches = matches.sort_values(by, ascending=ascending, kind='mergesort', na_position='last',
+                                              key=lambda series: series.astype(str) if series.dtype == object else series)
+        return matches.index.to_numpy(dtype=np.int64)
+
+    def _search_mask(self, data: pd.DataFrame) -> np.ndarray:
+        mask = np.zeros(len(data), dtype=bool)
+        number = self._search_number
+        for _, series in data.items():
+            if series.dtype == object:
+                mask |= _as_text(series).str.contains(self.search, case=False, regex=False, na=False).to_numpy(dtype=bool)
+            elif number is not None and pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                mask |= (series == number).to_numpy(dtype=bool)
+        return mask
+
+    @property
+    def _search_number(self):
+        try:
+            return float(self.search)
+        except ValueError:
+            return None
+
+
+def _predicate(series: pd.Series, op: str, value) -> np.ndarray:
+    if op == 'isnull':
+        return series.isna().to_numpy()
+    if op == 'notnull':
+        return series.notna().to_numpy()
+    if op in TEXT_MATCHES:
+        text = _as_text(series).str.lower()
+        needle = str(value).lower()
+        if op == 'contains':
+            matched = text.str.contains(needle, regex=False, na=False)
+        else:
+            matched = getattr(text.str, op)(needle, na=False)
+        return matched.to_numpy(dtype=bool)
+    if op == 'in':
+        return series.isin([_coerce(series, item) for item in value]).to_numpy()
+
+    value = _coerce(series, value)
+    if series.dtype == object:
+        # Text is compared as text; missing values only match 'ne'
+        present = series.notna().to_numpy()
+        text = series.where(present, '')
+        if not isinstance(value, str) or pd.api.types.infer_dtype(text, skipna=True) != 'string':
+            text, value = text.astype(str), str(value)
+        result = COMPARISONS[op](text, value).to_numpy(dtype=bool)
+        return result | ~present if op == 'ne' else result & present
+    return COMPARISONS[op](series, value).to_numpy(dtype=bool)
+
+
+def _as_text(series: pd.Series) -> pd.Series:
+    """The column as strings, missing values kept missing"""
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+        return series
+    return series.astype(str).where(series.notna())
+
+
+def _coerce(series: pd.Series, value):
+    """The filter value in the column's type"""
+    try:
+        if pd.api.types.is_bool_dtype(series):
+            return str(value).lower() in ('1', 'true', 'yes') if isinstance(value, str) else bool(value)
+        if pd.api.types.is_numeric_dtype(series):
+            return float(value) if not isinstance(value, (int, float)) else value
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return pd.Timestamp(value)
+    except (TypeError, ValueError):
+        raise QueryError(f"'{value}' is not a valid value for column '{series.name}'")
+    return value if isinstance(value, str) else str(value)
+
+
+class QueryResultCache:
+    """
+    Row orders of recent queries, kept in memory up to a total size.
+
+    Keys include the file's size and modification time, so a changed file never reuses
+    the results of its previous version; those age out as least recently used.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_QUERY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> row positions
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_run(self, key, run: Callable[[], np.ndarray]) -> Tuple[np.ndarray, bool]:
+        """The cached row order for the key, or the one ``run`` computes; and whether it was cached"""
+        with self._lock:
+            positions = self._entries.get(key)
+            if positions is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return positions, True
+            self.misses += 1
+
+        positions = run()
+        positions.flags.writeable = False  # Shared between requests
+        if positions.nbytes <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = positions
+                    self._bytes += positions.nbytes
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= evicted.nbytes
+                    self.evictions += 1
+        return positions, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryResultCache:
+    """The query result cache of this process, sized by QUERY_CACHE_BYTES"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from django.conf import settings
+                _cache = QueryResultCache(getattr(settings, 'QUERY_CACHE_BYTES', DEFAULT_QUERY_CACHE_BYTES))
+    return _cache
@@ -0,0 +1,158 @@
+# DataExplorer/tasks.py
+import logging
+import os
+import time
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from Accounts.activity import log_activity
+from Dataleakage.detection import DEFAULT_CHUNK_BUDGET_BYTES, get_detector
+from .columnar import write_sidecar
+from .models import DataFile
+
+logger = logging.getLogger(__name__)
+
+# Progress is written back at most this often while a file is being scanned
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+
+@shared_task
+def scan_data_file(data_file_id, log_upload=True):
+    """
+    Scan an uploaded file for sensitive data and store the score and findings on it.
+
+    ``log_upload`` records the upload in the user's activity log once the scan is done;
+    rescans of files that changed later pass False.
+    """
+    data_file = DataFile.objects.select_related('uploaded_by').filter(id=data_file_id).first()
+    if data_file is None:
+        return None  # Deleted before the scan started
+
+    user = data_file.uploaded_by
+    DataFile.objects.filter(id=data_file_id).update(scan_status=DataFile.SCAN_RUNNING, scan_progress=0.0,
+                                                    scan_updated_at=timezone.now())
+
+    last_report = [0.0]
+
+    def report_progress(fraction):
+        # Stay below 100 until the results are stored
+        now = time.monotonic()
+        if now - last_report[0] >= PROGRESS_INTERVAL_SECONDS:
+            last_report[0] = now
+            DataFile.objects.filter(id=data_file_id).update(scan_progress=round(min(fraction, 0.99) * 100, 1),
+                                                            scan_updated_at=timezone.now())
+
+    metadata = {
+        'user_id': user.id,  # ID of the user who uploaded the file
+        'filename': data_file.file.name  # Name of the uploaded file
+    }
+    file_stat = None
+    try:
+        # Taken before scanning, so a change made during the scan is picked up by the next sweep
+        file_stat = os.stat(data_file.file.path)
+        result = get_detector().analyze_file(data_file.file.path, metadata, progress=report_progress)
+    except Exception as e:
+        logger.exception(f"Sensitivity scan of file {data_file_id} failed")
+        DataFile.objects.filter(id=data_file_id).update(
+            scan_status=DataFile.SCAN_FAILED,
+            scan_error=str(e),
+            scan_updated_at=timezone.now(),
+            # Recorded on failure too, so periodic sweeps retry the scan only once the file changes
+            scanned_size=file_stat.st_size if file_stat else None,
+            scanned_mtime_ns=file_stat.st_mtime_ns if file_stat else None
+        )
+        if not log_upload:
+            return None
+        log_activity(
+            user=user,
+            action='Uploaded file',
+            data_file_id=data_file_id,
+            details=f'User {user.username} uploaded file "{data_file.title}"; its sensitivity scan failed.',
+            payload={'file_name': data_file.title, 'file_path': data_file.file.path}
+        )
+        return None
+
+    # Store sensitivity score and findings, unless the file was deleted meanwhile
+    now = timezone.now()
+    updated = DataFile.objects.filter(id=data_file_id).update(
+        sensitivity_score=result.score,
+        content_score=result.content_score,
+        findings=str(result.findings),
+        scan_status=DataFile.SCAN_DONE,
+        scan_progress=100.0,
+        scan_error=None,
+        scan_updated_at=now,
+        scanned_at=now,
+        scanned_size=file_stat.st_size,
+        scanned_mtime_ns=file_stat.st_mtime_ns,
+        content_hash=result.metadata['content_hash'],
+        last_modified=now
+    )
+    if not updated:
+        return None
+
+    # Written once the results are stored, so a slow or failed copy never holds up the scan
+    _write_sidecar(data_file.file.path)
+
+    if log_upload:
+        # Log the upload action
+        log_activity(
+            user=user,
+            action='Uploaded file',
+            data_file_id=data_file_id,
+            details=f'User {user.username} uploaded file "{data_file.title}" with a sensitivity score of {result.score}.',
+            payload={'file_name': data_file.title, 'file_path': data_file.file.path,
+                     'sensitivity_score': result.score}
+        )
+    return result.score
+
+
+def schedule_scan(data_file_id, log_upload=True):
+    """
+    Queue scan_data_file for a file whose status is already queued.
+
+    Without a broker the file stays queued with no scan_updated_at, which makes the next
+    periodic sweep queue it again rather than leaving it queued forever.
+    """
+    try:
+        scan_data_file.delay(data_file_id, log_upload=log_upload)
+        return True
+    except Exception as e:
+        logger.error(f"Could not queue sensitivity scan of file {data_file_id}: {str(e)}")
+        DataFile.objects.filter(id=data_file_id, scan_status=DataFile.SCAN_QUEUED).update(scan_updated_at=None)
+        return False
+
+
+@shared_task
+def write_data_file_sidecar(data_file_id):
+    """Rewrite the columnar copy of a data file after it was edited"""
+    data_file = DataFile.objects.filter(id=data_file_id).first()
+    if data_file is None:
+        return False
+    return _write_sidecar(data_file.file.path)
+
+
+def schedule_sidecar_write(data_file_id):
+    """Queue write_data_file_sidecar; without a broker the file is read from its original until the next scan"""
+    try:
+        write_data_file_sidecar.delay(data_file_id)
+    except Exception as e:
+        logger.error(f"Could not queue columnar copy of file {data_file_id}: {str(e)}")
+
+
+def _write_sidecar(file_path):
+    # Reads fall back to the original file, so a missing copy is never fatal
+    if not file_path.endswith(('.csv', '.xlsx')):
+        return False
+    try:
+        # CSV files are copied in chunks within the scan's memory budget
+        written = write_sidecar(file_path, chunk_budget=getattr(settings, 'SCAN_CHUNK_BUDGET_BYTES',
+                                                                DEFAULT_CHUNK_BUDGET_BYTES))
+    except Exception:
+        logger.exception(f"Writing the columnar copy of {file_path} failed")
+        return False
+    if not written:
+        logger.info(f"{file_path} has columns of mixed types; it is read from the original file")
+    return written
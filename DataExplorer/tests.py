@@ -1,3 +1,557 @@
-from django.test import TestCase
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from Accounts.activity import flush_activity_logs
+from Accounts.models import UserActivityLog
+from Dataleakage.detection import AdvancedDataLeakDetector
+from .columnar import read_column_names, read_manifest, read_sidecar, remove_sidecar, write_sidecar
+from .dataframes import DataFrameCache, get_dataframe_cache
+from .models import DataFile
+from .query import QueryError, QueryResultCache, RowQuery, get_query_cache
+from .tasks import scan_data_file, schedule_scan
+from .views import ROW_WINDOW_MAX_LIMIT, ROW_WINDOW_SIZE, load_file_data
+
+
+class MediaRootMixin:
+    """Uploads go to a temporary MEDIA_ROOT that is removed after each test"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    CSV = b'name,email,ssn\nJohn,john.doe@example.com,123-45-6789\nJane,jane@example.org,987-65-4321\n'
+
+    def create_data_file(self, user, name='customers.csv', content=CSV):
+        data_file = DataFile(title=os.path.splitext(name)[0], file_type=os.path.splitext(name)[1][1:],
+                             uploaded_by=user, user=user)
+        data_file.file.save(name, ContentFile(content))
+        return data_file
+
+
+class ColumnarCopyTests(SimpleTestCase):
+    """A columnar copy built chunk by chunk must read back as one parse of the whole file"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_csv(self, lines):
+        path = os.path.join(self.directory, 'data.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_chunked_copy_matches_whole_parse(self):
+        # Missing scores turn one chunk's integers into floats; names are missing from whole chunks
+        path = self.write_csv(['id,name,score,flag'] + [
+            f"{i},{'' if 40 < i < 120 else f'naïve {i}'},{'' if 150 < i < 170 else i * 2},{i % 2 == 0}"
+            for i in range(300)
+        ])
+        with mock.patch('DataExplorer.columnar.parse_file_data', side_effect=AssertionError("file parsed whole")):
+            self.assertTrue(write_sidecar(path, chunk_budget=1000))
+        expected = pd.read_csv(path)
+        pd.testing.assert_frame_equal(read_sidecar(path), expected)
+        pd.testing.assert_frame_equal(read_sidecar(path, rows=[299, 0, 130]),
+                                      expected.iloc[[299, 0, 130]])
+        self.assertEqual(sorted(os.listdir(path + '.columns')), sorted(
+            ['manifest.json', '0.values.npy', '1.data.npy', '1.offsets.npy', '1.nulls.npy',
+             '2.values.npy', '3.values.npy']
+        ))
+
+    def test_chunks_of_mixed_types_are_not_copied(self):
+        path = self.write_csv(['value'] + [str(i) for i in range(200)] + ['text'])
+        self.assertFalse(write_sidecar(path, chunk_budget=100))
+        self.assertIsNone(read_manifest(path))
+        self.assertEqual(os.listdir(self.directory), ['data.csv'])
+
+    def test_header_only_file(self):
+        path = self.write_csv(['a,b'])
+        self.assertTrue(write_sidecar(path, chunk_budget=100))
+        pd.testing.assert_frame_equal(read_sidecar(path), pd.read_csv(path))
+
+
+class ScanColumnarCopyTests(MediaRootMixin, TestCase):
+    """The columnar copy is written after the scan, which it must never hold up or break"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst')
+
+    def test_copy_written_after_scan(self):
+        data_file = self.create_data_file(self.user)
+
+        def write_after_scan(*args, **kwargs):
+            self.assertEqual(DataFile.objects.get(id=data_file.id).scan_status, DataFile.SCAN_DONE)
+            return write_sidecar(*args, **kwargs)
+
+        with mock.patch('DataExplorer.tasks.write_sidecar', side_effect=write_after_scan) as write:
+            scan_data_file(data_file.id, log_upload=False)
+        write.assert_called_once()
+        self.assertEqual(read_column_names(data_file.file.path), ['name', 'email', 'ssn'])
+
+    def test_failed_copy_leaves_scan_done(self):
+        data_file = self.create_data_file(self.user)
+        with mock.patch('DataExplorer.tasks.write_sidecar', side_effect=MemoryError), \
+                self.assertLogs('DataExplorer.tasks', level='ERROR'):
+            self.assertIsNotNone(scan_data_file(data_file.id, log_upload=False))
+        data_file.refresh_from_db()
+        self.assertEqual(data_file.scan_status, DataFile.SCAN_DONE)
+        self.assertIsNone(read_manifest(data_file.file.path))
+
+
+class ScanTaskTests(MediaRootMixin, TestCase):
+    """Uploads return at once and the scan runs as a task, here inline in eager mode"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        # Logs left queued would be written after the test's data is gone
+        self.addCleanup(flush_activity_logs)
+
+    def scan_status(self, data_file):
+        return self.client.get(reverse('data_explorer:scan_status', args=[data_file.id])).json()
+
+    def test_upload_queues_scan_once_committed(self):
+        upload = SimpleUploadedFile('customers.csv', self.CSV, content_type='text/csv')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(reverse('data_explorer:upload_file'), {'file': upload})
+            data_file = DataFile.objects.get()
+            self.assertEqual(self.scan_status(data_file), {'status': DataFile.SCAN_QUEUED, 'progress': 0.0})
+        self.assertRedirects(response, reverse('data_explorer:data_explorer_home'), fetch_redirect_response=False)
+        self.assertEqual(len(callbacks), 1)
+
+        # The callback ran the scan once the upload was committed
+        data_file.refresh_from_db()
+        self.assertEqual(data_file.scan_status, DataFile.SCAN_DONE)
+        self.assertEqual(data_file.scan_progress, 100.0)
+        self.assertIn('123-45-6789', data_file.findings)
+        self.assertLess(data_file.content_score, 100.0)
+        status = self.scan_status(data_file)
+        self.assertEqual((status['status'], status['progress'], status['sensitivity_score']),
+                         (DataFile.SCAN_DONE, 100.0, data_file.sensitivity_score))
+
+        flush_activity_logs()
+        self.assertQuerySetEqual(UserActivityLog.objects.values_list('action', 'data_file'),
+                                 [('Uploaded file', data_file.id)])
+
+    def test_scan_reports_running_and_progress(self):
+        data_file = self.create_data_file(self.user)
+        analyze_file = AdvancedDataLeakDetector.analyze_file
+        seen = []
+
+        def analyze_with_progress(detector, file_content, metadata, progress=None):
+            seen.append(self.scan_status(data_file))
+            progress(0.5)
+            seen.append(self.scan_status(data_file))
+            return analyze_file(detector, file_content, metadata, progress=progress)
+
+        with mock.patch.object(AdvancedDataLeakDetector, 'analyze_file', autospec=True,
+                               side_effect=analyze_with_progress):
+            scan_data_file(data_file.id, log_upload=False)
+        self.assertEqual(seen, [{'status': DataFile.SCAN_RUNNING, 'progress': 0.0},
+                                {'status': DataFile.SCAN_RUNNING, 'progress': 50.0}])
+        self.assertEqual(self.scan_status(data_file)['status'], DataFile.SCAN_DONE)
+
+    def test_failed_scan_reports_error(self):
+        # Not UTF-8, so the text scan fails
+        data_file = self.create_data_file(self.user, 'notes.txt', 'café'.encode('latin-1'))
+        with self.assertLogs('DataExplorer.tasks', level='ERROR'):
+            self.assertIsNone(scan_data_file(data_file.id, log_upload=False))
+        status = self.scan_status(data_file)
+        self.assertEqual(status['status'], DataFile.SCAN_FAILED)
+        self.assertIn('utf-8', status['error'])
+
+    def test_dispatch_failure_leaves_file_for_sweep(self):
+        data_file = self.create_data_file(self.user)
+        with mock.patch.object(scan_data_file, 'delay', side_effect=ConnectionError("broker down")), \
+                self.assertLogs('DataExplorer.tasks', level='ERROR'):
+            self.assertFalse(schedule_scan(data_file.id))
+        data_file.refresh_from_db()
+        self.assertEqual(data_file.scan_status, DataFile.SCAN_QUEUED)
+        self.assertIsNone(data_file.scan_updated_at)
+
+    def test_upload_succeeds_without_broker(self):
+        upload = SimpleUploadedFile('customers.csv', self.CSV, content_type='text/csv')
+        with mock.patch.object(scan_data_file, 'delay', side_effect=ConnectionError("broker down")), \
+                self.assertLogs('DataExplorer.tasks', level='ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('data_explorer:upload_file'), {'file': upload})
+        self.assertEqual([message.level_tag for message in get_messages(response.wsgi_request)], ['success'])
+        data_file = DataFile.objects.get()
+        self.assertEqual(data_file.scan_status, DataFile.SCAN_QUEUED)
+        self.assertIsNone(data_file.scan_updated_at)
+
+
+class DataFrameCacheTests(SimpleTestCase):
+    """Parsed frames are kept within a byte budget and never outlive a change to their file"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.loads = []
+
+    def write_csv(self, name, rows):
+        path = os.path.join(self.directory, name)
+        pd.DataFrame({'value': range(rows)}).to_csv(path, index=False)
+        return path
+
+    def load(self, path):
+        self.loads.append(os.path.basename(path))
+        return pd.read_csv(path)
+
+    def frame_bytes(self, rows):
+        return int(pd.DataFrame({'value': range(rows)}).memory_usage(deep=True).sum())
+
+    def test_repeated_reads_hit(self):
+        cache = DataFrameCache(max_bytes=10 ** 6)
+        path = self.write_csv('a.csv', 10)
+        self.assertIs(cache.get(path, self.load), cache.get(path, self.load))
+        self.assertEqual(self.loads, ['a.csv'])
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries'], stats['bytes']),
+                         (1, 1, 1, self.frame_bytes(10)))
+
+    def test_least_recently_used_frames_are_evicted_within_budget(self):
+        cache = DataFrameCache(max_bytes=2 * self.frame_bytes(100))
+        paths = [self.write_csv(name, 100) for name in ('a.csv', 'b.csv', 'c.csv')]
+        cache.get(paths[0], self.load)
+        cache.get(paths[1], self.load)
+        cache.get(paths[0], self.load)  # b is now the least recently used
+        cache.get(paths[2], self.load)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertLessEqual(cache.stats()['bytes'], cache.max_bytes)
+
+        cache.get(paths[0], self.load)
+        cache.get(paths[2], self.load)
+        cache.get(paths[1], self.load)
+        self.assertEqual(self.loads, ['a.csv', 'b.csv', 'c.csv', 'b.csv'])
+
+    def test_frame_larger_than_budget_is_not_kept(self):
+        cache = DataFrameCache(max_bytes=self.frame_bytes(10))
+        path = self.write_csv('big.csv', 1000)
+        self.assertEqual(len(cache.get(path, self.load)), 1000)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_changed_file_is_parsed_again(self):
+        cache = DataFrameCache(max_bytes=10 ** 6)
+        path = self.write_csv('a.csv', 10)
+        cache.get(path, self.load)
+        self.write_csv('a.csv', 20)
+        self.assertEqual(len(cache.get(path, self.load)), 20)
+        self.assertEqual(cache.stats()['bytes'], self.frame_bytes(20))
+
+    def test_invalidate(self):
+        cache = DataFrameCache(max_bytes=10 ** 6)
+        path = self.write_csv('a.csv', 10)
+        cache.get(path, self.load)
+        cache.invalidate(path)
+        self.assertEqual((cache.stats()['entries'], cache.stats()['bytes']), (0, 0))
+        cache.get(path, self.load)
+        self.assertEqual(self.loads, ['a.csv', 'a.csv'])
+
+
+class RowEditCacheTests(MediaRootMixin, TestCase):
+    """Editing or deleting a row drops the file's cached frame, so the next read sees the edit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.addCleanup(flush_activity_logs)
+        get_dataframe_cache().clear()
+        self.addCleanup(get_dataframe_cache().clear)
+        self.data_file = self.create_data_file(self.user, 'people.csv', b'name,age\nJohn,30\nJane,41\nJim,25\n')
+        # Read from the CSV through the cache, not from a columnar copy
+        remove_sidecar(self.data_file.file.path)
+        with mock.patch('DataExplorer.views.schedule_sidecar_write'):
+            self.cached_frame()
+
+    def cached_frame(self):
+        return load_file_data(self.data_file.file.path)
+
+    def test_update_row_invalidates_cached_frame(self):
+        with mock.patch('DataExplorer.views.schedule_sidecar_write'):
+            response = self.client.post(reverse('data_explorer:update_row', args=[self.data_file.id, 1]),
+                                        {'name': 'Janet'})
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(get_dataframe_cache().stats()['entries'], 0)
+        self.assertEqual(self.cached_frame()['name'].tolist(), ['John', 'Janet', 'Jim'])
+
+    def test_delete_row_invalidates_cached_frame(self):
+        with mock.patch('DataExplorer.views.schedule_sidecar_write'):
+            response = self.client.post(reverse('data_explorer:delete_row', args=[self.data_file.id]),
+                                        data={'row_id': 0}, content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(get_dataframe_cache().stats()['entries'], 0)
+        self.assertEqual(self.cached_frame()['name'].tolist(), ['Jane', 'Jim'])
+
+
+class DataRowsTests(MediaRootMixin, TestCase):
+    """data_rows pages through a file, clamping its window, and reads the same rows with or without a columnar copy"""
+
+    ROWS = 1500
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        get_dataframe_cache().clear()
+        self.addCleanup(get_dataframe_cache().clear)
+        frame = pd.DataFrame({
+            'id': range(self.ROWS),
+            'score': [None if i % 7 == 0 else i / 4 for i in range(self.ROWS)],
+            'name': [None if i % 5 == 0 else f'user {i}' for i in range(self.ROWS)],
+        })
+        self.data_file = self.create_data_file(self.user, 'users.csv', frame.to_csv(index=False).encode())
+
+    def rows(self, **params):
+        response = self.client.get(reverse('data_explorer:data_rows', args=[self.data_file.id]), params)
+        return response.status_code, response.json()
+
+    def test_default_window(self):
+        status, data = self.rows()
+        self.assertEqual(status, 200)
+        self.assertEqual((data['offset'], data['total'], len(data['rows'])), (0, self.ROWS, ROW_WINDOW_SIZE))
+        self.assertEqual(data['columns'], ['id', 'score', 'name'])
+
+    def test_pages_follow_on(self):
+        _, first = self.rows(offset=0, limit=300)
+        _, second = self.rows(offset=300, limit=300)
+        _, whole = self.rows(offset=0, limit=600)
+        self.assertEqual(first['rows'] + second['rows'], whole['rows'])
+
+    def test_limit_is_capped(self):
+        _, data = self.rows(limit=ROW_WINDOW_MAX_LIMIT * 10)
+        self.assertEqual(len(data['rows']), ROW_WINDOW_MAX_LIMIT)
+        _, data = self.rows(limit=-5)
+        self.assertEqual(data['rows'], [])
+
+    def test_offset_bounds(self):
+        _, data = self.rows(offset=-10, limit=3)
+        self.assertEqual(data['offset'], 0)
+        _, first = self.rows(offset=0, limit=3)
+        self.assertEqual(data['rows'], first['rows'])
+
+        _, data = self.rows(offset=self.ROWS - 2, limit=10)
+        self.assertEqual(len(data['rows']), 2)
+        _, data = self.rows(offset=self.ROWS + 10, limit=10)
+        self.assertEqual((data['rows'], data['total']), ([], self.ROWS))
+
+    def test_invalid_window(self):
+        self.assertEqual(self.rows(offset='x')[0], 400)
+        self.assertEqual(self.rows(columns='missing')[0], 400)
+
+    def test_columnar_window_matches_csv_window(self):
+        path = self.data_file.file.path
+        remove_sidecar(path)
+        windows = [dict(offset=0, limit=50), dict(offset=693, limit=ROW_WINDOW_MAX_LIMIT),
+                   dict(offset=1490, limit=20), dict(offset=100, limit=10, columns=['name', 'id'])]
+        from_csv = [self.rows(**window)[1] for window in windows]
+
+        write_sidecar(path)
+        self.assertIsNotNone(read_manifest(path))
+        with mock.patch('DataExplorer.views.get_dataframe_cache') as frame_cache:
+            from_copy = [self.rows(**window)[1] for window in windows]
+        frame_cache.assert_not_called()
+        self.assertEqual(from_copy, from_csv)
+
+
+def people_frame(rows=60):
+    return pd.DataFrame({
+        'id': range(rows),
+        'score': [None if i % 9 == 0 else (i * 37) % 23 for i in range(rows)],
+        'name': [None if i % 8 == 0 else ('Ann', 'bob', 'Dana', 'Frank', 'hannah')[i % 5] + f' {i}'
+                 for i in range(rows)],
+        'city': [('Oslo', 'Lima', 'Kyiv', None)[i % 4] for i in range(rows)],
+    })
+
+
+class RowQueryTests(SimpleTestCase):
+    """Row orders computed by RowQuery agree with the same query written directly in pandas"""
+
+    def setUp(self):
+        self.frame = people_frame()
+
+    def positions(self, **query):
+        return RowQuery.from_dict(query).row_order(self.frame).tolist()
+
+    def expected(self, mask, by=None, ascending=True):
+        matches = self.frame[mask.eq(True)]
+        if by:
+            matches = matches.sort_values(by, ascending=ascending, kind='mergesort', na_position='last')
+        return matches.index.tolist()
+
+    def test_filters(self):
+        frame = self.frame
+        cases = [
+            ({'column': 'score', 'op': 'gt', 'value': 10}, frame.score > 10),
+            ({'column': 'score', 'op': 'le', 'value': '4'}, frame.score <= 4),
+            ({'column': 'id', 'op': 'ne', 'value': 3}, frame.id != 3),
+            ({'column': 'city', 'op': 'eq', 'value': 'Lima'}, frame.city == 'Lima'),
+            ({'column': 'city', 'op': 'ne', 'value': 'Lima'}, frame.city != 'Lima'),
+            ({'column': 'city', 'op': 'in', 'value': ['Oslo', 'Kyiv']}, frame.city.isin(['Oslo', 'Kyiv'])),
+            ({'column': 'name', 'op': 'contains', 'value': 'AN'}, frame.name.str.lower().str.contains('an')),
+            ({'column': 'name', 'op': 'startswith', 'value': 'h'}, frame.name.str.lower().str.startswith('h')),
+            ({'column': 'name', 'op': 'endswith', 'value': '7'}, frame.name.str.endswith('7')),
+            ({'column': 'score', 'op': 'isnull'}, frame.score.isna()),
+            ({'column': 'name', 'op': 'notnull'}, frame.name.notna()),
+        ]
+        for query_filter, mask in cases:
+            with self.subTest(query_filter):
+                self.assertEqual(self.positions(filters=[query_filter]), self.expected(mask))
+
+    def test_filters_combine(self):
+        frame = self.frame
+        filters = [{'column': 'score', 'op': 'ge', 'value': 5}, {'column': 'city', 'op': 'notnull'}]
+        self.assertEqual(self.positions(filters=filters), self.expected((frame.score >= 5) & frame.city.notna()))
+
+    def test_sort(self):
+        frame = self.frame
+        self.assertEqual(
+            self.positions(sort=[{'column': 'city'}, {'column': 'score', 'descending': True}]),
+            self.expected(frame.id >= 0, ['city', 'score'], [True, False]),
+        )
+        self.assertEqual(
+            self.positions(filters=[{'column': 'name', 'op': 'notnull'}], sort=[{'column': 'name', 'descending': True}]),
+            self.expected(frame.name.notna(), ['name'], [False]),
+        )
+
+    def test_search(self):
+        frame = self.frame
+        text = frame[['name', 'city']].apply(lambda column: column.str.lower().str.contains('li'))
+        self.assertEqual(self.positions(search='LI'), self.expected(text.any(axis=1)))
+
+        number = (frame.id == 12) | (frame.score == 12) | frame.name.str.contains('12') | frame.city.str.contains('12')
+        self.assertEqual(self.positions(search='12'), self.expected(number))
+
+    def test_invalid_queries(self):
+        with self.assertRaises(QueryError):
+            RowQuery.from_dict({'filters': [{'column': 'score', 'op': 'like', 'value': 1}]})
+        with self.assertRaises(QueryError):
+            RowQuery.from_dict({'filters': [{'column': 'city', 'op': 'in', 'value': 'Oslo'}]})
+        with self.assertRaises(QueryError):
+            RowQuery.from_dict({'sort': [{'descending': True}]})
+        with self.assertRaises(QueryError):
+            RowQuery.from_dict({'filters': [{'column': 'salary'}]}).columns(self.frame.columns, ['name', 'city'])
+        with self.assertRaises(QueryError):
+            self.positions(filters=[{'column': 'score', 'op': 'gt', 'value': 'high'}])
+
+
+class QueryResultCacheTests(SimpleTestCase):
+    """Row orders are cached within a byte budget, least recently used first out"""
+
+    def run_query(self, rows):
+        return lambda: np.arange(rows, dtype=np.int64)
+
+    def test_hit_and_miss(self):
+        cache = QueryResultCache(max_bytes=10 ** 6)
+        first, cached = cache.get_or_run('a', self.run_query(10))
+        self.assertFalse(cached)
+        second, cached = cache.get_or_run('a', mock.Mock(side_effect=AssertionError))
+        self.assertTrue(cached)
+        self.assertIs(first, second)
+        self.assertFalse(second.flags.writeable)
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses'], cache.stats()['bytes']), (1, 1, 80))
+
+    def test_least_recently_used_results_are_evicted(self):
+        cache = QueryResultCache(max_bytes=160)
+        cache.get_or_run('a', self.run_query(10))
+        cache.get_or_run('b', self.run_query(10))
+        cache.get_or_run('a', self.run_query(10))
+        cache.get_or_run('c', self.run_query(10))
+        self.assertEqual((cache.stats()['evictions'], cache.stats()['bytes']), (1, 160))
+        self.assertTrue(cache.get_or_run('a', self.run_query(10))[1])
+        self.assertTrue(cache.get_or_run('c', self.run_query(10))[1])
+        self.assertFalse(cache.get_or_run('b', self.run_query(10))[1])
+
+    def test_result_larger_than_budget_is_not_kept(self):
+        cache = QueryResultCache(max_bytes=80)
+        positions, cached = cache.get_or_run('a', self.run_query(100))
+        self.assertEqual((len(positions), cached), (100, False))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+
+class QueryRowsTests(MediaRootMixin, TestCase):
+    """query_rows pages through the results of a query and reuses them until the file changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.addCleanup(flush_activity_logs)
+        for cache in (get_dataframe_cache(), get_query_cache()):
+            cache.clear()
+            self.addCleanup(cache.clear)
+        self.frame = people_frame(1200)
+        self.data_file = self.create_data_file(self.user, 'people.csv', self.frame.to_csv(index=False).encode())
+        self.query = {'filters': [{'column': 'score', 'op': 'gt', 'value': 3}],
+                      'sort': [{'column': 'score', 'descending': True}]}
+
+    def query_rows(self, **body):
+        response = self.client.post(reverse('data_explorer:query_rows', args=[self.data_file.id]),
+                                    data=body, content_type='application/json')
+        return response.status_code, response.json()
+
+    def test_pages_follow_the_query_order(self):
+        expected = self.frame[self.frame.score > 3].sort_values('score', ascending=False, kind='mergesort')
+        _, first = self.query_rows(**self.query, offset=0, limit=100)
+        _, second = self.query_rows(**self.query, offset=100, limit=100)
+        self.assertEqual(first['total'], len(expected))
+        self.assertEqual(first['row_ids'] + second['row_ids'], expected.index[:200].tolist())
+        self.assertEqual([row[0] for row in first['rows']], expected.id[:100].tolist())
+
+    def test_window_is_clamped(self):
+        _, data = self.query_rows(limit=ROW_WINDOW_MAX_LIMIT * 10, offset=-3)
+        self.assertEqual((data['offset'], len(data['rows']), data['total']), (0, ROW_WINDOW_MAX_LIMIT, 1200))
+        _, data = self.query_rows(offset=1150, limit=100)
+        self.assertEqual(data['row_ids'], list(range(1150, 1200)))
+        _, data = self.query_rows(offset=5000)
+        self.assertEqual(data['rows'], [])
+
+    def test_results_are_reused_until_the_file_changes(self):
+        self.assertFalse(self.query_rows(**self.query)[1]['cached'])
+        self.assertTrue(self.query_rows(**self.query, offset=200)[1]['cached'])
+
+        _, data = self.query_rows(**self.query, limit=1)
+        row_id = data['row_ids'][0]
+        with mock.patch('DataExplorer.views.schedule_sidecar_write'):
+            remove_sidecar(self.data_file.file.path)
+            self.client.post(reverse('data_explorer:update_row', args=[self.data_file.id, row_id]), {'score': 0})
+        _, data = self.query_rows(**self.query)
+        self.assertFalse(data['cached'])
+        self.assertNotIn(row_id, data['row_ids'])
+        self.assertEqual(data['total'], int((self.frame.score > 3).sum()) - 1)
+
+    def test_invalid_queries(self):
+        self.assertEqual(self.query_rows(filters=[{'column': 'salary', 'op': 'eq', 'value': 1}])[0], 400)
+        self.assertEqual(self.query_rows(filters=[{'column': 'score', 'op': 'like'}])[0], 400)
+        self.assertEqual(self.query_rows(columns=['salary'])[0], 400)
@@ -9,7 +9,10 @@ urlpatterns = [
     path('', views.data_explorer_home, name='data_explorer_home'),  # Home view showing all files
     path('upload/', views.upload_file, name='upload_file'),        # Upload file view
     path('delete_file/<int:file_id>/', views.delete_file, name='delete_file'),
+    path('scan-status/<int:file_id>/', views.scan_status, name='scan_status'),
     path('view/<int:file_id>/', views.view_data, name='view_data'),  # View specific file data
+    path('rows/<int:file_id>/', views.data_rows, name='data_rows'),  # Window of a file's rows as JSON
+    path('query/<int:file_id>/', views.query_rows, name='query_rows'),  # Filtered, sorted and searched rows as JSON
     path('update-row/<int:file_id>/<int:row_id>/', views.update_row, name='update_row'),
     path('delete-row/<int:file_id>/', views.delete_row, name='delete_row'),
     path('visualization/<int:file_id>/', views.create_visualization, name='create_visualization'),  # Create visualization for specific file
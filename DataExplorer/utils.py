@@ -1,5 +1,5 @@
 # utils.py
-from Dataleakage.detection import AdvancedDataLeakDetector
+from Dataleakage.detection import get_detector
 import pandas as pd
 from pathlib import Path
 
@@ -18,10 +18,8 @@ def read_file_content(file):
 
 def scan_file_for_sensitivity(file):
     """Scans a file for sensitive data and returns the sensitivity score."""
-    detector = AdvancedDataLeakDetector()
-    # Read the content of the file
-    content = read_file_content(file)
+    detector = get_detector()
     metadata = {'filename': file.name}  # Add filename metadata
-    # Perform the analysis using the detector
-    scan_result = detector.analyze_file(content, metadata)
+    # Pass the path so the detector can stream large CSV files instead of loading them whole
+    scan_result = detector.analyze_file(str(Path(file)), metadata)
     return scan_result.score
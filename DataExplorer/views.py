@@ -1,16 +1,28 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from .models import DataFile, DataVisualization
-from Accounts.models import UserActivityLog, Profile
+from Accounts.activity import log_activity
+from Accounts.models import Profile
 from .forms import DataFileForm, DataVisualizationForm
 from django.http import JsonResponse
+from django.db import transaction
 import pandas as pd
+import numpy as np
 import json
 from django.contrib import messages
 import os
-from Dataleakage.detection import AdvancedDataLeakDetector , AnomalyDetector , UserBehaviorAnalyzer  # Adjust import based on your app structure
+from Dataleakage.detection import AnomalyDetector , UserBehaviorAnalyzer  # Adjust import based on your app structure
 import logging
+from django.core.serializers.json import DjangoJSONEncoder
+from .tasks import schedule_scan, schedule_sidecar_write
+from .dataframes import get_dataframe_cache
+from .columnar import parse_file_data, read_column_names, read_manifest, read_sidecar, remove_sidecar
+from .query import QueryError, RowQuery, get_query_cache
 
+# Rows the data view fetches per request while scrolling
+ROW_WINDOW_SIZE = 200
+# Most rows data_rows returns at once
+ROW_WINDOW_MAX_LIMIT = 1000
 
 
 @login_required
@@ -39,32 +51,10 @@ def upload_file(request):
 
                 data_file.save()
 
-                # Prepare metadata for the file analysis
-                metadata = {
-                    'user_id': request.user.id,   # ID of the user uploading the file
-                    'filename': data_file.file.name  # Name of the uploaded file
-                }
-
-                # Analyze the uploaded file for sensitivity
-                detector = AdvancedDataLeakDetector()
-                result = detector.analyze_file(data_file.file.path, metadata)
-
-                # Store sensitivity score and findings in the DataFile instance
-                data_file.sensitivity_score = result.score  # Assuming you added this field to your model
-                data_file.findings = result.findings  # Assuming you added this field to your model
-                data_file.save()
+                # Scan in the background; the status endpoint reports its progress
+                transaction.on_commit(lambda: schedule_scan(data_file.id))
 
-                # Log the upload action with details as JSON string
-                UserActivityLog.objects.create(
-                    user=request.user,
-                    action='Uploaded file',
-                    details=json.dumps({
-                        'message': f'User {request.user.username} uploaded file "{original_filename}" with a sensitivity score of {result.score}.',
-                        'file_path': data_file.file.path
-                    })
-                )
-
-                messages.success(request, f'File "{original_filename}" uploaded successfully with a sensitivity score of {result.score}!')
+                messages.success(request, f'File "{original_filename}" uploaded successfully. Its sensitivity scan has been queued.')
             except Exception as e:
                 messages.error(request, f'Error uploading file: {str(e)}')
         else:
@@ -72,22 +62,38 @@ def upload_file(request):
     return redirect('data_explorer:data_explorer_home')
 
 
+@login_required
+def scan_status(request, file_id):
+    data_file = get_object_or_404(DataFile, id=file_id)
+    status = {
+        'status': data_file.scan_status,
+        'progress': data_file.scan_progress,
+    }
+    if data_file.scan_status == DataFile.SCAN_DONE:
+        status['sensitivity_score'] = data_file.sensitivity_score
+        status['scanned_at'] = data_file.scanned_at
+    elif data_file.scan_status == DataFile.SCAN_FAILED:
+        status['error'] = data_file.scan_error
+    return JsonResponse(status)
+
+
 @login_required
 def delete_file(request, file_id):
     file_to_delete = get_object_or_404(DataFile, id=file_id)
     if request.method == 'POST':
         try:
             file_name = file_to_delete.title
+            file_path = file_to_delete.file.path
             file_to_delete.delete()
+            get_dataframe_cache().invalidate(file_path)
+            remove_sidecar(file_path)
 
-            # Log the delete action with JSON format
-            UserActivityLog.objects.create(
+            # Log the delete action; the file itself is gone, so only its name is kept
+            log_activity(
                 user=request.user,
                 action='Deleted file',
-                details=json.dumps({
-                    'message': f'User {request.user.username} deleted file "{file_name}".',
-                    'file_name': file_name
-                })
+                details=f'User {request.user.username} deleted file "{file_name}".',
+                payload={'file_name': file_name}
             )
 
             messages.info(request, f'File "{file_name}" has been deleted.')
@@ -97,35 +103,75 @@ def delete_file(request, file_id):
     return render(request, 'DataExplorer/DataExplorer.html')
 
 
-def load_file_data(file_path):
+def load_file_data(file_path, columns=None):
     """
     Load data from a CSV or Excel file and return it as a DataFrame.
+
+    The file is read from its columnar copy when it has a current one, in which case
+    only the given ``columns`` are read. Whole files are cached until they change; the
+    returned DataFrame is shared, so copy it before modifying it in place.
     """
-    if file_path.endswith('.csv'):
-        return pd.read_csv(file_path)  # Load CSV files
-    elif file_path.endswith('.xlsx'):
-        return pd.read_excel(file_path)  # Load Excel files
-    else:
-        raise ValueError("Unsupported file type")  # Raise error for unsupported types
+    if columns is not None:
+        data = read_sidecar(file_path, columns)
+        if data is not None:
+            return data
+        return get_dataframe_cache().get(file_path, read_file_data)[list(columns)]
+    return get_dataframe_cache().get(file_path, read_file_data)
+
+
+def read_file_data(file_path):
+    data = read_sidecar(file_path)
+    return data if data is not None else parse_file_data(file_path)
+
+
+def load_row_window(file_path, offset, limit, columns=None):
+    """
+    Rows [offset, offset + limit) of a file and its total row count.
+
+    With a current columnar copy only the window is read, however long the file is.
+    """
+    manifest = read_manifest(file_path)
+    if manifest is not None:
+        window = read_sidecar(file_path, columns, rows=slice(offset, offset + limit))
+        if window is not None:
+            return window, manifest['rows']
+    data = get_dataframe_cache().get(file_path, read_file_data)
+    if columns is not None:
+        data = data[list(columns)]
+    return data.iloc[offset:offset + limit], len(data)
+
+
+def load_rows(file_path, rows, columns=None):
+    """The given rows of a file, a slice or row positions; only those are read from a columnar copy"""
+    data = read_sidecar(file_path, columns, rows=rows)
+    if data is not None:
+        return data
+    data = get_dataframe_cache().get(file_path, read_file_data)
+    if columns is not None:
+        data = data[list(columns)]
+    return data.iloc[rows]
 
 @login_required
 def view_data(request, file_id):
     data_file = get_object_or_404(DataFile, id=file_id)
 
-    # Load data from the file
+    # Only the columns and row count; the page fetches the rows it shows from data_rows
     try:
-        data = load_file_data(data_file.file.path)
-
-        # Convert data to a format that can be easily displayed in the template
-        data_dict = {
-            'columns': data.columns.tolist(),
-            'rows': data.values.tolist(),
-        }
+        manifest = read_manifest(data_file.file.path)
+        if manifest is not None:
+            columns = [column['name'] for column in manifest['columns']]
+            total_rows = manifest['rows']
+        else:
+            data = load_file_data(data_file.file.path)
+            columns = data.columns.tolist()
+            total_rows = len(data)
 
         # Include sensitivity score and findings in the context
         return render(request, 'DataExplorer/ViewData.html', {
             'data_file': data_file,
-            'data': data_dict,
+            'columns': columns,
+            'total_rows': total_rows,
+            'row_window_size': ROW_WINDOW_SIZE,
             'sensitivity_score': data_file.sensitivity_score,  # Assuming you added this field to your model
             'findings': data_file.findings  # Assuming you added this field to your model
         })
@@ -140,6 +186,104 @@ def view_data(request, file_id):
             'error': f'Error loading file: {str(e)}'
         })
 
+@login_required
+def data_rows(request, file_id):
+    """
+    A window of a file's rows as JSON, for the virtual scrolling table of view_data.
+
+    Takes ``offset`` and ``limit`` (at most ROW_WINDOW_MAX_LIMIT) and optionally
+    repeated ``columns`` to return only those columns.
+    """
+    data_file = get_object_or_404(DataFile, id=file_id)
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        limit = min(max(int(request.GET.get('limit', ROW_WINDOW_SIZE)), 0), ROW_WINDOW_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'offset and limit must be integers'}, status=400)
+
+    try:
+        window, total_rows = load_row_window(data_file.file.path, offset, limit,
+                                             request.GET.getlist('columns') or None)
+    except KeyError as e:
+        return JsonResponse({'error': f'Unknown columns: {e.args[0] if e.args else e}'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'offset': offset,
+        'total': total_rows,
+        'columns': window.columns.tolist(),
+        'rows': json_rows(window),
+    }, encoder=DjangoJSONEncoder)
+
+
+@login_required
+def query_rows(request, file_id):
+    """
+    A page of a file's rows matching column filters and a free-text search, in the given
+    sort order, with the number of matching rows.
+
+    Takes a JSON body with ``filters`` (objects with ``column``, ``op`` and ``value``),
+    ``sort`` (objects with ``column`` and ``descending``), ``search``, and optionally
+    ``columns``, ``offset`` and ``limit`` (at most ROW_WINDOW_MAX_LIMIT). The query
+    runs over whole columns of the columnar copy or the cached DataFrame, reading only
+    the columns it needs; the resulting row order is cached per file version, so
+    paging through the results or repeating the query skips running it.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid method'}, status=405)
+
+    data_file = get_object_or_404(DataFile, id=file_id)
+    file_path = data_file.file.path
+    try:
+        body = json.loads(request.body or '{}')
+        query = RowQuery.from_dict(body)
+        offset = max(int(body.get('offset', 0)), 0)
+        limit = min(max(int(body.get('limit', ROW_WINDOW_SIZE)), 0), ROW_WINDOW_MAX_LIMIT)
+
+        file_stat = os.stat(file_path)
+        manifest = read_manifest(file_path)
+        if manifest is not None:
+            all_columns = [column['name'] for column in manifest['columns']]
+            text_columns = [column['name'] for column in manifest['columns'] if column['kind'] == 'text']
+            total_rows = manifest['rows']
+        else:
+            data = load_file_data(file_path)
+            all_columns = data.columns.tolist()
+            text_columns = [column for column in all_columns if data[column].dtype == object]
+            total_rows = len(data)
+        columns = body.get('columns') or all_columns
+        if any(column not in all_columns for column in columns):
+            raise QueryError("Unknown columns requested")
+        needed = query.columns(all_columns, text_columns)
+
+        def run_query():
+            if not needed:
+                return np.arange(total_rows, dtype=np.int64)
+            return query.row_order(load_file_data(file_path, columns=needed))
+
+        cache_key = (file_path, file_stat.st_mtime_ns, file_stat.st_size, query.cache_key)
+        row_order, cached = get_query_cache().get_or_run(cache_key, run_query)
+        page = load_rows(file_path, row_order[offset:offset + limit], columns)
+    except (ValueError, TypeError) as e:  # QueryError and malformed JSON included
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Error querying file: {str(e)}'}, status=400)
+
+    return JsonResponse({
+        'offset': offset,
+        'total': len(row_order),
+        'columns': page.columns.tolist(),
+        'row_ids': page.index.tolist(),  # Row positions in the file, for update_row and delete_row
+        'rows': json_rows(page),
+        'cached': cached,
+    }, encoder=DjangoJSONEncoder)
+
+
+def json_rows(data):
+    # Missing values become null rather than NaN, which is not valid JSON
+    return data.astype(object).where(data.notna(), None).values.tolist()
+
 @login_required
 def update_row(request, file_id, row_id):
     if request.method != 'POST':
@@ -148,29 +292,29 @@ def update_row(request, file_id, row_id):
     data_file = get_object_or_404(DataFile, id=file_id)
 
     try:
-        # Load the data
-        df = load_file_data(data_file.file.path)
+        # Load the data; a copy, since the cached frame is shared
+        df = load_file_data(data_file.file.path).copy()
 
         # Update the row with new values
         for column in df.columns:
             if column in request.POST:
                 df.at[row_id, column] = request.POST.get(column)
 
-        # Save the updated DataFrame back to the file
+        # Save the updated DataFrame back to the file; the next load parses it again
         if data_file.file.path.endswith('.csv'):
             df.to_csv(data_file.file.path, index=False)
         else:
             df.to_excel(data_file.file.path, index=False)
+        get_dataframe_cache().invalidate(data_file.file.path)
+        schedule_sidecar_write(data_file.id)
 
-        # Log the update action with JSON format
-        UserActivityLog.objects.create(
+        # Log the update action
+        log_activity(
             user=request.user,
             action='Updated row',
-            details=json.dumps({
-                'message': f'User {request.user.username} updated row {row_id} in file "{data_file.title}".',
-                'file_name': data_file.title,
-                'row_id': row_id
-            })
+            data_file=data_file,
+            details=f'User {request.user.username} updated row {row_id} in file "{data_file.title}".',
+            payload={'file_name': data_file.title, 'row_id': row_id}
         )
 
         # Return the updated values
@@ -202,16 +346,16 @@ def delete_row(request, file_id):
         df.to_csv(data_file.file.path, index=False)
     else:
         df.to_excel(data_file.file.path, index=False)
+    get_dataframe_cache().invalidate(data_file.file.path)
+    schedule_sidecar_write(data_file.id)
 
-    # Log the delete row action with JSON format
-    UserActivityLog.objects.create(
+    # Log the delete row action
+    log_activity(
         user=request.user,
         action='Deleted row',
-        details=json.dumps({
-            'message': f'User {request.user.username} deleted row {row_id} in file "{data_file.title}".',
-            'file_name': data_file.title,
-            'row_id': row_id
-        })
+        data_file=data_file,
+        details=f'User {request.user.username} deleted row {row_id} in file "{data_file.title}".',
+        payload={'file_name': data_file.title, 'row_id': row_id}
     )
 
     return JsonResponse({'success': True})
@@ -224,9 +368,10 @@ def create_visualization(request, file_id):
         
         if form.is_valid():
             try:
-                df = load_file_data(data_file.file.path)
                 x_axis = form.cleaned_data['x_axis']
                 y_axis = form.cleaned_data['y_axis']
+                # Only the plotted columns are read
+                df = load_file_data(data_file.file.path, columns=list(dict.fromkeys([x_axis, y_axis])))
                 
                 chart_data = {
                     'x': df[x_axis].tolist(),
@@ -258,8 +403,10 @@ def create_visualization(request, file_id):
 def get_columns(request, file_id):
     data_file = get_object_or_404(DataFile, id=file_id)
     try:
-        df = load_file_data(data_file.file.path)
-        columns = df.columns.tolist()
+        # The manifest of the columnar copy names the columns without reading any data
+        columns = read_column_names(data_file.file.path)
+        if columns is None:
+            columns = load_file_data(data_file.file.path).columns.tolist()
         return JsonResponse(columns, safe=False)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
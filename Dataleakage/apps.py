@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class DataleakageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Dataleakage'
+
+    def ready(self):
+        # Compile the rule set and load the EDM index once, before the first request
+        from Dataleakage.detection import get_detector
+        get_detector()
@@ -0,0 +1,89 @@
+# Dataleakage/counters.py
+import hashlib
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Width of one counter bucket, see ACTIVITY_COUNTER_BUCKET_SECONDS
+DEFAULT_BUCKET_SECONDS = 10
+# Buckets are kept this long, which bounds the longest window that can be counted
+DEFAULT_RETENTION = timedelta(hours=1)
+
+
+class ActivityCounters:
+    """
+    Sliding-window event counts per user and action, kept in a Django cache.
+
+    Every event increments the counter of the fixed-size time bucket it falls in, and a
+    window is counted by summing the buckets it covers with one ``get_many``, so neither
+    recording nor checking touches the database. Counts are exact to one bucket at the
+    start of the window. Buckets expire from the cache on their own.
+
+    The cache must be shared by the processes that write activity logs and those that
+    run the anomaly checks, such as Redis. ``shared`` is False for per-process caches
+    like ``LocMemCache``, whose counts other processes never see; callers then count
+    from the database instead.
+    """
+
+    def __init__(self, cache, bucket_seconds: int = DEFAULT_BUCKET_SECONDS,
+                 retention: timedelta = DEFAULT_RETENTION):
+        self.cache = cache
+        self.bucket_seconds = bucket_seconds
+        self.timeout = int(retention.total_seconds()) + bucket_seconds
+
+    @property
+    def shared(self) -> bool:
+        """Whether other processes see the counts recorded in this one"""
+        return is_shared_cache(self.cache)
+
+    def record(self, user_id: int, action: str, when: Optional[datetime] = None):
+        key = self._key(user_id, action, self._bucket(when))
+        if not self.cache.add(key, 1, timeout=self.timeout):
+            try:
+                self.cache.incr(key)
+            except ValueError:  # Expired between add and incr
+                self.cache.add(key, 1, timeout=self.timeout)
+
+    def count(self, user_id: int, actions: Iterable[str], window: timedelta,
+              now: Optional[datetime] = None) -> int:
+        return self.count_windows(user_id, [(tuple(actions), window)], now)[0]
+
+    def count_windows(self, user_id: int, windows: Sequence[Tuple[Tuple[str, ...], timedelta]],
+                      now: Optional[datetime] = None) -> List[int]:
+        """Events of any of the actions within each (actions, window) ending now, in one cache round trip"""
+        current = self._bucket(now)
+        window_keys = []
+        for actions, window in windows:
+            buckets = range(current - math.ceil(window.total_seconds() / self.bucket_seconds), current + 1)
+            window_keys.append([self._key(user_id, action, bucket) for action in actions for bucket in buckets])
+
+        counts = self.cache.get_many({key for keys in window_keys for key in keys})
+        return [sum(counts.get(key, 0) for key in keys) for keys in window_keys]
+
+    def _bucket(self, when: Optional[datetime]) -> int:
+        seconds = when.timestamp() if when is not None else time.time()
+        return int(seconds // self.bucket_seconds)
+
+    @staticmethod
+    def _key(user_id: int, action: str, bucket: int) -> str:
+        # Actions contain spaces, which some cache backends reject in keys
+        action_key = hashlib.md5(action.encode('utf-8')).hexdigest()[:12]
+        return f"activity:{user_id}:{action_key}:{bucket}"
+
+
+def is_shared_cache(cache) -> bool:
+    """Whether a Django cache is seen by every process, unlike LocMemCache and DummyCache"""
+    from django.core.cache.backends.dummy import DummyCache
+    from django.core.cache.backends.locmem import LocMemCache
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def get_activity_counters() -> ActivityCounters:
+    """Counters in the cache named by ACTIVITY_COUNTER_CACHE"""
+    from django.conf import settings
+    from django.core.cache import caches
+    return ActivityCounters(
+        caches[getattr(settings, 'ACTIVITY_COUNTER_CACHE', 'default')],
+        bucket_seconds=getattr(settings, 'ACTIVITY_COUNTER_BUCKET_SECONDS', DEFAULT_BUCKET_SECONDS)
+    )
@@ -1,16 +1,73 @@
-from typing import Dict, List, Union, Optional, Tuple
+from typing import Callable, Dict, List, Union, Optional, Tuple
+import hashlib
 import re
+from functools import lru_cache
 import pandas as pd
 from pathlib import Path
 from datetime import datetime, timedelta
 import logging
-from concurrent.futures import ThreadPoolExecutor, Future
+import math
+import os
 from django.core.cache import cache
 from enum import Enum
 from dataclasses import dataclass
+import warnings
 import json  # Ensure this import is present
+import threading
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
 
 from Accounts.models import UserActivityLog
+from DataExplorer.models import DataFile, ScanCacheEntry
+from DataExplorer.columnar import read_sidecar
+from Dataleakage.counters import get_activity_counters
+from Dataleakage.edm import get_edm_index
+from Dataleakage.parallel import get_scan_pool, map_bounded, scan_frame_shard, scan_text_shard
+from Dataleakage.scanner import ColumnClassifier, CompiledRuleSet, KeywordIndex, PatternMatch, iter_string_windows, iter_text_windows
+
+
+# Memory budget for one chunk of a streamed CSV scan, see SCAN_CHUNK_BUDGET_BYTES
+DEFAULT_CHUNK_BUDGET_BYTES = 64 * 1024 * 1024
+CHUNK_SAMPLE_ROWS = 1000
+
+# Characters read per block when streaming a text file, see SCAN_TEXT_BLOCK_CHARS
+DEFAULT_TEXT_BLOCK_CHARS = 1024 * 1024
+
+# Content below this size is scanned in-process, see SCAN_PARALLEL_MIN_BYTES
+DEFAULT_PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+
+# Findings stored per sensitivity type for a scan, see SCAN_MAX_FINDINGS_PER_TYPE
+DEFAULT_MAX_FINDINGS_PER_TYPE = 100
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_detector() -> 'AdvancedDataLeakDetector':
+    """
+    The detector shared by everything in this process.
+
+    The detector holds no per-request state, so one instance serves every thread; the
+    rule set is compiled when this module is imported, which the app registry and the
+    Celery worker hooks do at startup.
+    """
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = AdvancedDataLeakDetector()
+    return _detector
+
+
+def reset_detector():
+    """Drop the shared detector so the next call rebuilds it, e.g. after the EDM index changed"""
+    global _detector
+    with _detector_lock:
+        _detector = None
 
 
 class SensitivityLevel(Enum):
@@ -31,6 +88,15 @@ class ScanResult:
     user_behavior_score: float
     metadata: Dict
     timestamp: datetime
+    content_score: float = 100.0  # Sensitivity of the content alone, before the other scores are combined
+
+
+@dataclass
+class UserRiskResult:
+    score: float  # Combined score for activity without a file involved
+    anomalies: List[str]
+    anomaly_score: float
+    user_behavior_score: float
 
 
 @dataclass
@@ -108,68 +174,74 @@ class AdvancedDataLeakDetector:
         'DOB': ['dob', 'birth_date', 'date_of_birth', 'birthday']
     }
 
+    # Column names compiled once; classifications are cached per schema
+    COLUMN_CLASSIFIER = ColumnClassifier(COLUMN_NAME_PATTERNS)
+
+    # Every pattern above has a digit within its first six characters (e.g. 'ABCDE1234F',
+    # '+1 (555)'), so positions without one nearby can never start a match
+    SCAN_ANCHOR = r'[^\d\s]{0,5}\d'
+
+    # Every pattern compiled once into a single-pass scan engine
+    RULE_SET = CompiledRuleSet(SENSITIVITY_PATTERNS, anchor=SCAN_ANCHOR)
+
+    # Characters on each side of a match searched for context keywords
+    CONTEXT_WINDOW = 100
+
+    # Bump when a scan logic change alters results for the same rules, invalidating cached scans
+    SCAN_LOGIC_VERSION = 2
+
     def __init__(self):
-        self.anomaly_detector = None  # Initialize as None
-        self.behavior_analyzer = None  # Initialize as None
-        self.executor = ThreadPoolExecutor(max_workers=4)  # Adjust based on your server capacity
-        logging.basicConfig(level=logging.INFO)
+        self.workers = getattr(settings, 'SCAN_WORKERS', None) or os.cpu_count() or 1
+        self.parallel_min_bytes = getattr(settings, 'SCAN_PARALLEL_MIN_BYTES', DEFAULT_PARALLEL_MIN_BYTES)
+        self.max_findings_per_type = getattr(settings, 'SCAN_MAX_FINDINGS_PER_TYPE', DEFAULT_MAX_FINDINGS_PER_TYPE)
+        self.edm_index = get_edm_index()
         self.logger = logging.getLogger(__name__)
 
-    def analyze_file(self, file_content: Union[str, pd.DataFrame], metadata: Dict) -> ScanResult:
-        # Removed unnecessary try-except block
-        # If a file path is provided, read it
-        if isinstance(file_content, str) and Path(file_content).exists():
-            file_content = self._read_file(Path(file_content))
-
-        # Convert content to analyzable string format
-        if isinstance(file_content, pd.DataFrame):
-            content_str = self._prepare_dataframe_content(file_content)
-        else:
-            content_str = file_content
+    def analyze_file(self, file_content: Union[str, pd.DataFrame], metadata: Dict,
+                     progress: Optional[Callable[[float], None]] = None) -> ScanResult:
+        """
+        Scan content and combine its sensitivity with the uploading user's risk scores.
 
+        ``progress`` is called with the fraction of the content scanned so far; streamed
+        files report it as they go, everything else once the scan is complete.
+        """
         # Ensure metadata is a dictionary
         if not isinstance(metadata, dict):
             metadata = {'filename': metadata}
 
-        # Initialize detectors with user if available
+        # Initialize detectors with user if available; they are per call since the
+        # detector itself is shared between requests
         user_id = metadata.get('user_id')
-        if user_id:
-            if not self.anomaly_detector:
-                self.anomaly_detector = AnomalyDetector(user=user_id)
-            if not self.behavior_analyzer:
-                self.behavior_analyzer = UserBehaviorAnalyzer(user=user_id)
-
-        # Calculate scores
-        sensitivity_score = self._calculate_sensitivity_score(content_str)
-        context_score = self._analyze_context(content_str, metadata)
+        anomaly_detector = AnomalyDetector(user=user_id) if user_id else None
+        behavior_analyzer = UserBehaviorAnalyzer(user=user_id) if user_id else None
+
+        # Scan once; both the score and the findings come from the same matches.
+        # Content that was already scanned with the current rules is not scanned again.
+        content_hash = self._content_hash(file_content)
+        metadata = {**metadata, 'content_hash': content_hash}
+        findings, type_counts = self._cached_scan(content_hash, file_content, progress)
+        if progress:
+            progress(1.0)
+        sensitivity_score = self._score_from_counts(type_counts)
+        context_score = self._analyze_context(file_content, metadata)
 
         anomaly_score = 0
-        if self.anomaly_detector:
-            _, anomaly_score = self.anomaly_detector.detect_anomalies()
+        if anomaly_detector:
+            _, anomaly_score = anomaly_detector.detect_anomalies()
 
         user_behavior_score = 0
-        if self.behavior_analyzer:
-            user_behavior_score = self.behavior_analyzer.analyze_behavior()
+        if behavior_analyzer:
+            user_behavior_score = behavior_analyzer.analyze_behavior()
 
-        # Calculate total score and generate findings
+        # Calculate total score
         total_score = self._combine_scores(
             sensitivity_score=sensitivity_score,
             context_score=context_score,
             anomaly_score=anomaly_score,
             user_behavior_score=user_behavior_score
         )
-        findings = self._generate_findings(content_str)
         risk_level = self._determine_risk_level(total_score, findings)
 
-        # Cache the result
-        cache_key = f"file_scan_{metadata.get('filename', 'unknown')}"
-        cache_data = {
-            "score": total_score,
-            "findings": findings,
-            "risk_level": risk_level.name
-        }
-        cache.set(cache_key, cache_data, timeout=60 * 60)
-
         return ScanResult(
             score=total_score,
             findings=findings,
@@ -178,63 +250,349 @@ class AdvancedDataLeakDetector:
             anomaly_score=anomaly_score,
             context_score=context_score,
             user_behavior_score=user_behavior_score,
-            metadata=metadata
+            metadata=metadata,
+            content_score=sensitivity_score
         )
 
+    def refresh_edm_index(self):
+        """Switch to the EDM index currently on disk if it was rebuilt since it was loaded"""
+        self.edm_index = get_edm_index()
+
+    @property
+    def rule_set_version(self) -> str:
+        """
+        Fingerprint of everything that shapes scan results; cached scans from other versions are ignored.
+
+        Every scan reads it first, which also picks up a rebuilt EDM index.
+        """
+        self.refresh_edm_index()
+        rules = {
+            'engine': self.RULE_SET.version,
+            'logic': self.SCAN_LOGIC_VERSION,
+            'context_window': self.CONTEXT_WINDOW,
+            'max_findings_per_type': self.max_findings_per_type,
+            'types': {
+                sensitivity_type: [config['score'], config.get('context_keywords', [])]
+                for sensitivity_type, config in self.SENSITIVITY_PATTERNS.items()
+            },
+            'columns': self.COLUMN_NAME_PATTERNS,
+            'edm': self.edm_index.version if self.edm_index is not None else None,
+        }
+        return hashlib.sha256(json.dumps(rules, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+    def _content_hash(self, file_content: Union[str, pd.DataFrame]) -> str:
+        """SHA-256 of the content to scan, prefixed with how it will be read"""
+        digest = hashlib.sha256()
+        if isinstance(file_content, str) and Path(file_content).exists():
+            suffix = Path(file_content).suffix.lower()
+            digest.update(b'csv' if suffix == '.csv' else b'excel' if suffix in ['.xls', '.xlsx'] else b'text')
+            with open(file_content, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+                    digest.update(block)
+        elif isinstance(file_content, pd.DataFrame):
+            digest.update(b'dataframe')
+            digest.update(json.dumps([[str(col), str(dtype)] for col, dtype in file_content.dtypes.items()]).encode('utf-8'))
+            digest.update(pd.util.hash_pandas_object(file_content, index=True).values.tobytes())
+        else:
+            digest.update(b'text')
+            digest.update(file_content.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _cached_scan(self, content_hash: str, file_content: Union[str, pd.DataFrame],
+                     progress: Optional[Callable[[float], None]] = None) -> Tuple[List[Dict], Dict[str, int]]:
+        """
+        Findings and validated counts for the content, scanning it only on a miss.
+
+        Results are stored in the database keyed by content hash and rule set version, so
+        re-uploads of the same bytes under any name reuse them across restarts; the Django
+        cache sits in front to skip the database for hot entries. Only the first findings
+        of each type are kept, see _cap_findings; the counts cover every match.
+        """
+        rule_set_version = self.rule_set_version
+        cache_key = f"file_scan_{content_hash}_{rule_set_version}"
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        entry = ScanCacheEntry.objects.filter(content_hash=content_hash, rule_set_version=rule_set_version).first()
+        if entry:
+            cached = (entry.findings, entry.type_counts)
+        else:
+            findings, type_counts = self._scan_source(file_content, progress)
+            findings = self._cap_findings(findings)
+            ScanCacheEntry.objects.update_or_create(
+                content_hash=content_hash,
+                rule_set_version=rule_set_version,
+                defaults={
+                    'sensitivity_score': self._score_from_counts(type_counts),
+                    'type_counts': type_counts,
+                    'findings': findings,
+                }
+            )
+            cached = (findings, type_counts)
+
+        cache.set(cache_key, cached, timeout=60 * 60)
+        return cached
+
+    def _cap_findings(self, findings: List[Dict]) -> List[Dict]:
+        """The first max_findings_per_type findings of each sensitivity type, in scan order"""
+        kept = {}
+        capped = []
+        for finding in findings:
+            count = kept.get(finding['type'], 0)
+            if count < self.max_findings_per_type:
+                kept[finding['type']] = count + 1
+                capped.append(finding)
+        return capped
+
+    def _scan_source(self, file_content: Union[str, pd.DataFrame],
+                     progress: Optional[Callable[[float], None]] = None) -> Tuple[List[Dict], Dict[str, int]]:
+        """Pick the scan mode for a file path, a DataFrame or raw text"""
+        # If a file path is provided, read it (CSV and text files are streamed)
+        if isinstance(file_content, str) and Path(file_content).exists():
+            file_path = Path(file_content)
+            if file_path.suffix.lower() == '.csv':
+                return self._scan_csv_stream(file_path, progress=progress)
+            if file_path.suffix.lower() not in ['.xls', '.xlsx'] and self.RULE_SET.max_match_length is not None:
+                return self._scan_text_stream(file_path, progress=progress)
+            file_content = self._read_file(file_path)
+
+        if isinstance(file_content, pd.DataFrame):
+            if file_content.memory_usage(deep=True).sum() >= self.parallel_min_bytes:
+                return self._scan_dataframe_parallel(file_content)
+            return self._scan_dataframe(file_content)
+
+        if len(file_content) >= self.parallel_min_bytes:
+            return self._scan_text_parallel(file_content)
+        matches, type_counts = self._scan_content(file_content)
+        return self._findings_from_matches(matches), type_counts
+
+    def _scan_pool(self, size: int):
+        """The shared process pool if content of this size is worth sharding, else None"""
+        if size < self.parallel_min_bytes:
+            return None
+        return get_scan_pool(self.workers)
+
     def _read_file(self, file_path: Path) -> Union[str, pd.DataFrame]:
         # Removed unnecessary try-except block
         if file_path.suffix.lower() == '.csv':
             return pd.read_csv(file_path)
         elif file_path.suffix.lower() in ['.xls', '.xlsx']:
-            return pd.read_excel(file_path)
+            # The columnar copy written by an earlier scan spares parsing the workbook again
+            data = read_sidecar(str(file_path))
+            return data if data is not None else pd.read_excel(file_path)
         else:
             with open(file_path, 'r', encoding='utf-8') as f:
                 return f.read()
 
-    def _prepare_dataframe_content(self, df: pd.DataFrame) -> str:
-        # Removed unnecessary try-except block
-        content_parts = []
-        sensitive_columns = {}
-
-        # Identify potentially sensitive columns
-        for col in df.columns:
-            col_lower = str(col).lower()
-            for data_type, patterns in self.COLUMN_NAME_PATTERNS.items():
-                if any(pattern in col_lower.replace('_', '') for pattern in patterns):
-                    sensitive_columns[col] = data_type
-
-        # Process columns identified as potentially sensitive
-        for col, data_type in sensitive_columns.items():
-            for _, value in df[col].items():
-                if pd.notna(value):
-                    value_str = str(value).strip()
-                    if value_str:
-                        content_parts.append(f"{col}:{value_str}")
-
-        return "\n".join(content_parts)
-
-    def _calculate_sensitivity_score(self, content: str) -> float:
-        """Calculate sensitivity score: 100 (safe) to 0 (highly sensitive)"""
-        total_weight = 0
-        max_weight = 0
-        findings_count = 0
-
-        for sensitivity_type, config in self.SENSITIVITY_PATTERNS.items():
-            max_weight += config['score']  # Sum of all possible scores
-
-        for sensitivity_type, config in self.SENSITIVITY_PATTERNS.items():
-            matches = []
-            for pattern in config['patterns']:
-                found = re.finditer(pattern, content, re.IGNORECASE)
-                for match in found:
-                    if self._validate_match_context(match, content, config):
-                        matches.append(match.group())
-                        findings_count += 1
-
-            if matches:
-                occurrences = len(matches)
-                weight = config['score'] * occurrences
-                total_weight += weight
+    def _classify_columns(self, columns) -> Dict:
+        """Map each column whose name looks sensitive to its data type"""
+        return self.COLUMN_CLASSIFIER.classify(columns)
+
+    def _scan_dataframe(self, df: pd.DataFrame) -> Tuple[List[Dict], Dict[str, int]]:
+        """Scan an in-memory DataFrame, see _scan_dataframe_hits"""
+        hits = []
+        type_counts = {}
+        self._scan_dataframe_hits(df, hits, type_counts)
+        return self._findings_from_hits(hits), type_counts
+
+    def _scan_csv_stream(self, file_path: Path, chunk_budget: Optional[int] = None,
+                         progress: Optional[Callable[[float], None]] = None) -> Tuple[List[Dict], Dict[str, int]]:
+        """
+        Scan a CSV file in row chunks so peak memory follows the chunk budget, not the file size.
+
+        The rows per chunk are sized from the in-memory footprint of a small sample.
+        Each chunk goes through the DataFrame scan and its findings and counts are merged
+        as it completes; pandas keeps the row labels global across chunks.
+        """
+        if chunk_budget is None:
+            chunk_budget = getattr(settings, 'SCAN_CHUNK_BUDGET_BYTES', DEFAULT_CHUNK_BUDGET_BYTES)
+
+        sample = pd.read_csv(file_path, nrows=CHUNK_SAMPLE_ROWS)
+        if sample.empty:
+            return self._scan_dataframe(sample)
+
+        # With a process pool the budget is shared by every chunk in flight
+        file_size = file_path.stat().st_size
+        pool = self._scan_pool(file_size)
+        in_flight = 2 * self.workers if pool else 1
+
+        # Leave room for the string copies of a column made while it is scanned
+        row_bytes = max(1, sample.memory_usage(deep=True).sum() // len(sample))
+        chunk_rows = max(1, chunk_budget // (2 * row_bytes * in_flight))
+
+        # Text columns of the sample stay text in chunks that happen to hold only numbers
+        text_dtypes = {column: str for column in sample.select_dtypes(include=['object', 'string']).columns}
+
+        hits = []
+        type_counts = {}
+        with open(file_path, 'rb') as f, pd.read_csv(f, chunksize=chunk_rows, dtype=text_dtypes) as reader:
+            shards = ((chunk, index * chunk_rows) for index, chunk in enumerate(reader))
+            self._merge_frame_shards(self._track_progress(shards, f, file_size, progress), hits, type_counts, pool)
+        return self._findings_from_hits(hits), type_counts
+
+    def _scan_dataframe_parallel(self, df: pd.DataFrame) -> Tuple[List[Dict], Dict[str, int]]:
+        """Split a large DataFrame into row shards and scan them on the process pool"""
+        pool = get_scan_pool(self.workers)
+        shard_rows = max(1, math.ceil(len(df) / (4 * self.workers)))
+        shards = ((df.iloc[start:start + shard_rows], start) for start in range(0, len(df), shard_rows))
+
+        hits = []
+        type_counts = {}
+        self._merge_frame_shards(shards, hits, type_counts, pool)
+        return self._findings_from_hits(hits), type_counts
+
+    def _merge_frame_shards(self, shards, hits: List[Tuple], type_counts: Dict[str, int], pool=None) -> None:
+        """Scan (DataFrame, row offset) shards, in-process or on the pool, merging as they finish"""
+        if pool is None:
+            for shard, row_offset in shards:
+                self._scan_dataframe_hits(shard, hits, type_counts, row_offset=row_offset)
+            return
+
+        for shard_hits, shard_counts in map_bounded(pool, scan_frame_shard, shards, 2 * self.workers):
+            hits.extend(shard_hits)
+            for sensitivity_type, count in shard_counts.items():
+                type_counts[sensitivity_type] = type_counts.get(sensitivity_type, 0) + count
+
+    def _scan_text_stream(self, file_path: Path, block_size: Optional[int] = None,
+                          progress: Optional[Callable[[float], None]] = None) -> Tuple[List[Dict], Dict[str, int]]:
+        """
+        Scan a text file block by block in constant memory.
+
+        Blocks overlap by the longest possible match plus the context window on each
+        side, so every match is found and validated exactly as in a whole-file scan.
+        """
+        if block_size is None:
+            block_size = getattr(settings, 'SCAN_TEXT_BLOCK_CHARS', DEFAULT_TEXT_BLOCK_CHARS)
+        lookahead = self.RULE_SET.max_match_length + self.CONTEXT_WINDOW + 1
+        lookbehind = self.CONTEXT_WINDOW + 1  # One more character for a leading word boundary
+
+        file_size = file_path.stat().st_size
+        pool = self._scan_pool(file_size)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            windows = iter_text_windows(f, block_size, lookahead, lookbehind)
+            return self._merge_text_windows(self._track_progress(windows, f.buffer, file_size, progress), pool)
+
+    @staticmethod
+    def _track_progress(items, handle, size: int, progress: Optional[Callable[[float], None]]):
+        """Pass items through, reporting how far into the file ``handle`` has read after each one"""
+        for item in items:
+            if progress and size:
+                progress(min(handle.tell() / size, 1.0))
+            yield item
+
+    def _scan_text_parallel(self, content: str) -> Tuple[List[Dict], Dict[str, int]]:
+        """Shard a large in-memory string into overlapping windows and scan them on the process pool"""
+        block_size = getattr(settings, 'SCAN_TEXT_BLOCK_CHARS', DEFAULT_TEXT_BLOCK_CHARS)
+        lookahead = self.RULE_SET.max_match_length + self.CONTEXT_WINDOW + 1
+        lookbehind = self.CONTEXT_WINDOW + 1
+        windows = iter_string_windows(content, block_size, lookahead, lookbehind)
+        return self._merge_text_windows(windows, get_scan_pool(self.workers))
+
+    def _scan_text_candidates(self, buffer: str, base: int, emit_from: int,
+                              emit_until: int) -> List[Tuple[int, int, int, str, bool]]:
+        """
+        Every candidate match starting in one window, validated against the window text.
+
+        Returns (rule, start, end, text, valid) with offsets relative to the whole input.
+        Overlapping candidates are kept: a window cannot know where the previous window's
+        matches ended, so _merge_text_windows applies the per-rule non-overlap rule.
+        """
+        candidates = []
+        keyword_index = KeywordIndex(buffer)
+        for index, start, end in self.RULE_SET.iter_candidates(buffer, emit_from, emit_until):
+            match = PatternMatch(self.RULE_SET.rules[index].type, index, start, end, buffer[start:end])
+            valid = self._validate_match_context(match, buffer, self.SENSITIVITY_PATTERNS[match.type], keyword_index)
+            candidates.append((index, base + start, base + end, match.text, valid))
+        return candidates
+
+    def _merge_text_windows(self, windows, pool=None) -> Tuple[List[Dict], Dict[str, int]]:
+        """Scan text windows in order, in-process or on the pool, keeping global offsets"""
+        if pool is None:
+            results = (self._scan_text_candidates(*window) for window in windows)
+        else:
+            results = map_bounded(pool, scan_text_shard, windows, 2 * self.workers)
+
+        matches = []
+        type_counts = {}
+        last_end = {}
+        for candidates in results:
+            for index, start, end, text, valid in candidates:
+                if start < last_end.get(index, 0):
+                    continue
+                last_end[index] = end
+                match = PatternMatch(self.RULE_SET.rules[index].type, index, start, end, text)
+                matches.append(match)
+                if valid:
+                    type_counts[match.type] = type_counts.get(match.type, 0) + 1
+        return self._findings_from_matches(matches), type_counts
+
+    def _scan_dataframe_hits(self, df: pd.DataFrame, hits: List[Tuple], type_counts: Dict[str, int],
+                             row_offset: int = 0) -> None:
+        """
+        Scan a DataFrame column by column without flattening it into one string.
+
+        Every text column is scanned, plus any column whose name looks sensitive. A
+        vectorized ``str.contains`` over the combined rule pattern picks the candidate
+        cells; only those are matched and validated, with the "column:value" cell text
+        as their context. Findings carry the row label and column of the cell.
+        """
+        sensitive_columns = self._classify_columns(df.columns)
+        text_columns = set(df.select_dtypes(include=['object', 'string']).columns)
+
+        for col_position, col in enumerate(df.columns):
+            if col not in text_columns and col not in sensitive_columns:
+                continue
+
+            values = df.iloc[:, col_position].dropna().astype(str).str.strip()
+            with warnings.catch_warnings():
+                # The combined pattern has named groups, which only matter to the scan engine
+                warnings.simplefilter('ignore', UserWarning)
+                candidates = values[values.str.contains(self.RULE_SET.regex, regex=True)]
+
+            prefix = f"{col}:"
+            for cell_order, (row, value) in enumerate(candidates.items(), start=row_offset):
+                cell = prefix + value
+                keyword_index = KeywordIndex(cell)
+                for match in self.RULE_SET.iter_matches(cell, pos=len(prefix)):
+                    finding = {
+                        "type": match.type,
+                        "match": match.text,
+                        "location": match.start - len(prefix),
+                        "row": row,
+                        "column": str(col)
+                    }
+                    if self._is_exact_match(match.type, match.text):
+                        finding["exact_match"] = True
+                    hits.append((match.rule, col_position, cell_order, finding))
+                    if self._validate_match_context(match, cell, self.SENSITIVITY_PATTERNS[match.type], keyword_index):
+                        type_counts[match.type] = type_counts.get(match.type, 0) + 1
+
+
+    def _findings_from_hits(self, hits: List[Tuple]) -> List[Dict]:
+        """Same ordering as the flattened scan: by pattern, then column, then row"""
+        hits.sort(key=lambda hit: hit[:3])
+        return [finding for *_, finding in hits]
+
+    def _scan_content(self, content: str) -> Tuple[List[PatternMatch], Dict[str, int]]:
+        """Single pass over the content returning all matches and validated counts per type"""
+        matches = []
+        type_counts = {}
+        keyword_index = KeywordIndex(content)
+        for match in self.RULE_SET.iter_matches(content):
+            matches.append(match)
+            if self._validate_match_context(match, content, self.SENSITIVITY_PATTERNS[match.type], keyword_index):
+                type_counts[match.type] = type_counts.get(match.type, 0) + 1
+        return matches, type_counts
+
+    def _score_from_counts(self, type_counts: Dict[str, int]) -> float:
+        """Turn validated match counts per sensitivity type into a 0-100 score"""
+        max_weight = sum(config['score'] for config in self.SENSITIVITY_PATTERNS.values())  # Sum of all possible scores
+        total_weight = sum(
+            self.SENSITIVITY_PATTERNS[sensitivity_type]['score'] * occurrences
+            for sensitivity_type, occurrences in type_counts.items()
+        )
+        findings_count = sum(type_counts.values())
 
         # If no findings, return maximum safety score
         if findings_count == 0:
@@ -254,11 +612,9 @@ class AdvancedDataLeakDetector:
     def _is_numeric_content(self, content: str, column_name: str = None) -> bool:
         """Enhanced check if content appears to be numerical data"""
         if column_name:
-            col_lower = column_name.lower()
             # Skip numeric check for columns that are explicitly marked as sensitive
-            for patterns in self.COLUMN_NAME_PATTERNS.values():
-                if any(pattern in col_lower.replace('_', '') for pattern in patterns):
-                    return False
+            if self.COLUMN_CLASSIFIER.classify_name(column_name) is not None:
+                return False
 
         try:
             # Check if line contains mostly numbers or decimal values
@@ -268,35 +624,56 @@ class AdvancedDataLeakDetector:
         except:
             return False
 
-    def _validate_match_context(self, match: re.Match, content: str, pattern_config: Dict) -> bool:
-        """Enhanced context validation with column name awareness"""
+    def _validate_match_context(self, match: PatternMatch, content: str, pattern_config: Dict,
+                                keyword_index: Optional[KeywordIndex] = None) -> bool:
+        """
+        Enhanced context validation with column name awareness.
+
+        ``keyword_index`` should be shared by every match in the same content; the checks
+        are ordered cheapest first, so the numeric-content heuristic only runs for matches
+        that already have a keyword nearby and pass the validators.
+        """
         if not pattern_config.get('context_keywords'):
             return True
+        # A registered value needs no surrounding evidence
+        if self._is_exact_match(match.type, match.text):
+            return True
+        if keyword_index is None:
+            keyword_index = KeywordIndex(content)
 
         # Get surrounding context
-        start = max(0, match.start() - 100)
-        end = min(len(content), match.end() + 100)
-        context = content[start:end].lower()
-        
+        start = max(0, match.start - self.CONTEXT_WINDOW)
+        end = min(len(content), match.end + self.CONTEXT_WINDOW)
+
+        # Check context keywords
+        if not keyword_index.contains_any(self._context_keywords(pattern_config), start, end):
+            return False
+
+        # Run custom validators if defined
+        validators = pattern_config.get('validators', [])
+        if not all(v(match.text) for v in validators):
+            return False
+
         # Extract column name if present (format: "column_name:value")
-        column_name = None
-        context_parts = context.split(':')
-        if len(context_parts) > 1:
-            column_name = context_parts[0].strip()
-        
+        colon = keyword_index.find(':', start, end)
+        if colon == -1:
+            return True
+        column_name = content[start:colon].lower().strip()
+
         # Skip numeric check if column name indicates sensitive data
-        if not column_name or not self._is_numeric_content(context, column_name):
-            # Check context keywords
-            keyword_count = sum(1 for keyword in pattern_config['context_keywords'] 
-                              if keyword.lower() in context)
-            
-            # Run custom validators if defined
-            validators = pattern_config.get('validators', [])
-            validation_passed = all(v(match.group()) for v in validators)
-            
-            return keyword_count >= 1 and validation_passed
-        
-        return False
+        return not column_name or not self._is_numeric_content(content[start:end].lower(), column_name)
+
+    def _is_exact_match(self, sensitivity_type: str, text: str) -> bool:
+        """Whether the matched text is a registered value in the Exact Data Match index"""
+        return self.edm_index is not None and self.edm_index.contains(sensitivity_type, text)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _lowercase_keywords(keywords: Tuple[str, ...]) -> Tuple[str, ...]:
+        return tuple(keyword.lower() for keyword in keywords)
+
+    def _context_keywords(self, pattern_config: Dict) -> Tuple[str, ...]:
+        return self._lowercase_keywords(tuple(pattern_config['context_keywords']))
 
     def _analyze_context(self, content: str, metadata: Dict) -> float:
         """Analyze file context based on indicators in filename"""
@@ -310,18 +687,18 @@ class AdvancedDataLeakDetector:
 
         return score
 
-    def _generate_findings(self, content: str) -> List[Dict]:
-        """Generate findings from patterns"""
+    def _findings_from_matches(self, matches: List[PatternMatch]) -> List[Dict]:
+        """Findings ordered by sensitivity type and pattern, then by position"""
         findings = []
-        for sensitivity_type, config in self.SENSITIVITY_PATTERNS.items():
-            for pattern in config['patterns']:
-                matches = re.finditer(pattern, content, re.IGNORECASE)
-                for match in matches:
-                    findings.append({
-                        "type": sensitivity_type,
-                        "match": match.group(),
-                        "location": match.start()
-                    })
+        for match in sorted(matches, key=lambda m: (m.rule, m.start)):
+            finding = {
+                "type": match.type,
+                "match": match.text,
+                "location": match.start
+            }
+            if self._is_exact_match(match.type, match.text):
+                finding["exact_match"] = True
+            findings.append(finding)
         return findings
 
     def _combine_scores(self, sensitivity_score: float, context_score: float,
@@ -349,6 +726,18 @@ class AdvancedDataLeakDetector:
         )
         return round(combined_score, 2)
 
+    def analyze_user(self, user) -> UserRiskResult:
+        """Anomaly and behavior analysis of a user's recent activity, combined into one score"""
+        anomalies, anomaly_score = AnomalyDetector(user=user).detect_anomalies()
+        behavior_score = UserBehaviorAnalyzer(user=user).analyze_behavior()
+        combined_score = self._combine_scores(
+            sensitivity_score=100,  # Default to safe when no file is involved
+            context_score=0,  # No context score for user activity
+            anomaly_score=anomaly_score,
+            user_behavior_score=behavior_score
+        )
+        return UserRiskResult(combined_score, anomalies, anomaly_score, behavior_score)
+
     def _determine_risk_level(self, score: float, findings: List[Dict]) -> SensitivityLevel:
         """Determine risk level with consideration for number of findings"""
         if len(findings) == 0:
@@ -366,6 +755,12 @@ class AdvancedDataLeakDetector:
         else:
             return SensitivityLevel.CRITICAL
 
+    def metrics(self) -> Dict:
+        """Cache statistics of the shared scan components"""
+        return {
+            'column_classifier': self.COLUMN_CLASSIFIER.stats(),
+        }
+
     def get_recent_sensitivity_scans(self):
         scans = [
             {'type': 'Personal Information', 'risk': 'High'},
@@ -375,93 +770,79 @@ class AdvancedDataLeakDetector:
         return scans
 
 
+@dataclass(frozen=True)
+class AnomalyRule:
+    """Flags ``count`` or more of the ``actions`` within the last ``window``"""
+    actions: Tuple[str, ...]
+    count: int
+    window: timedelta
+    points: int
+    message: str
+
+
 class AnomalyDetector:
+    RULES = [
+        AnomalyRule(('Logged in',), 2, timedelta(minutes=2), 20,
+                    "Rapid login attempts detected."),
+        AnomalyRule(('Deleted file',), 3, timedelta(minutes=5), 10,
+                    "Suspicious file deletion spree detected."),
+        AnomalyRule(('Uploaded file',), 3, timedelta(minutes=10), 10,
+                    "Multiple file uploads in a short time detected."),
+        AnomalyRule(('Created task', 'Deleted task'), 3, timedelta(minutes=15), 10,
+                    "Rapid task creation or deletion detected."),
+        AnomalyRule(('Created project', 'Deleted project'), 3, timedelta(minutes=15), 10,
+                    "Suspicious project creation or deletion detected."),
+        AnomalyRule(('Requested OTP for password reset',), 2, timedelta(minutes=2), 10,
+                    "Multiple OTP requests detected."),
+        AnomalyRule(('Reset password',), 2, timedelta(minutes=5), 10,
+                    "Multiple password resets detected."),
+    ]
+
+    RULE_ACTIONS = sorted({action for rule in RULES for action in rule.actions})
+    LONGEST_WINDOW = max(rule.window for rule in RULES)
+
+    # Maximum possible score (based on the number of checks and severity)
+    MAX_ANOMALY_SCORE = 70
+
     def __init__(self, user):
         from django.contrib.auth.models import User
         self.user = user if isinstance(user, User) else User.objects.get(id=user)
         self.logger = logging.getLogger(__name__)
 
     def detect_anomalies(self) -> Tuple[List[str], float]:
-        # Removed unnecessary try-except block
         anomalies = []
         risk_points = 0
 
-        # Example: Rapid login attempts
-        login_logs = UserActivityLog.objects.filter(
-            user=self.user, action='Logged in'
-        ).order_by('-timestamp')[:5]
-        if len(login_logs) > 1:
-            time_diff = login_logs[0].timestamp - login_logs[1].timestamp
-            if time_diff < timedelta(minutes=2):
-                anomalies.append("Rapid login attempts detected.")
-                risk_points += 20
-
-        # Check for suspicious file deletion spree
-        delete_logs = list(UserActivityLog.objects.filter(
-            user=self.user, action='Deleted file'
-        ).order_by('-timestamp')[:5])
-        if len(delete_logs) >= 3:
-            time_diff = delete_logs[0].timestamp - delete_logs[-1].timestamp
-            if time_diff < timedelta(minutes=5):  # Multiple deletions within 5 minutes
-                anomalies.append("Suspicious file deletion spree detected.")
-                risk_points += 10  # Assign score for this anomaly
-
-        # Check for rapid uploads
-        upload_logs = list(UserActivityLog.objects.filter(
-            user=self.user, action='Uploaded file'
-        ).order_by('-timestamp')[:5])
-        if len(upload_logs) >= 3:
-            time_diff = upload_logs[0].timestamp - upload_logs[-1].timestamp
-            if time_diff < timedelta(minutes=10):  # Multiple uploads in under 10 minutes
-                anomalies.append("Multiple file uploads in a short time detected.")
-                risk_points += 10  # Assign score for this anomaly
-
-        # Check for sudden activity spikes in task creation or deletion
-        task_logs = list(UserActivityLog.objects.filter(
-            user=self.user, action__in=['Created task', 'Deleted task']
-        ).order_by('-timestamp')[:5])
-        if len(task_logs) >= 3:
-            time_diff = task_logs[0].timestamp - task_logs[-1].timestamp
-            if time_diff < timedelta(minutes=15):  # Task creation/deletion spree in 15 minutes
-                anomalies.append("Rapid task creation or deletion detected.")
-                risk_points += 10  # Assign score for this anomaly
-
-        # Check for project creation and deletion spikes
-        project_logs = list(UserActivityLog.objects.filter(
-            user=self.user, action__in=['Created project', 'Deleted project']
-        ).order_by('-timestamp')[:5])
-        if len(project_logs) >= 3:
-            time_diff = project_logs[0].timestamp - project_logs[-1].timestamp
-            if time_diff < timedelta(minutes=15):  # Multiple project actions within 15 minutes
-                anomalies.append("Suspicious project creation or deletion detected.")
-                risk_points += 10  # Assign score for this anomaly
-
-        # Check for multiple OTP requests or password resets
-        otp_logs = UserActivityLog.objects.filter(
-            user=self.user, action='Requested OTP for password reset'
-        ).order_by('-timestamp')[:5]
-        if len(otp_logs) >= 2:
-            time_diff = otp_logs[0].timestamp - otp_logs[1].timestamp
-            if time_diff < timedelta(minutes=2):  # OTP requests in under 2 minutes
-                anomalies.append("Multiple OTP requests detected.")
-                risk_points += 10  # Assign score for this anomaly
-
-        # Check for multiple password resets in a short time
-        reset_logs = UserActivityLog.objects.filter(
-            user=self.user, action='Reset password'
-        ).order_by('-timestamp')[:5]
-        if len(reset_logs) >= 2:
-            time_diff = reset_logs[0].timestamp - reset_logs[1].timestamp
-            if time_diff < timedelta(minutes=5):  # Multiple password resets within 5 minutes
-                anomalies.append("Multiple password resets detected.")
-                risk_points += 10  # Assign score for this anomaly
+        # Sliding-window counters kept up to date as activity logs are written; no queries.
+        # Counters in a per-process cache miss the activity recorded by other processes.
+        counters = get_activity_counters()
+        if counters.shared:
+            counts = counters.count_windows(self.user.id, [(rule.actions, rule.window) for rule in self.RULES])
+        else:
+            counts = self._count_windows_in_database()
+        for rule, count in zip(self.RULES, counts):
+            if count >= rule.count:
+                anomalies.append(rule.message)
+                risk_points += rule.points
 
         # Normalize the anomaly score out of 100
-        max_anomaly_score = 70  # Maximum possible score (based on the number of checks and severity)
-        normalized_anomaly_score = min((risk_points / max_anomaly_score) * 100, 100)
+        normalized_anomaly_score = min((risk_points / self.MAX_ANOMALY_SCORE) * 100, 100)
 
         return anomalies, normalized_anomaly_score
 
+    def _count_windows_in_database(self) -> List[int]:
+        """Events of each rule within its window ending now, counted in one query"""
+        now = timezone.now()
+        counts = UserActivityLog.objects.filter(
+            user=self.user,
+            action__in=self.RULE_ACTIONS,
+            timestamp__gte=now - self.LONGEST_WINDOW
+        ).aggregate(**{
+            f'rule_{position}': Count('id', filter=Q(action__in=rule.actions, timestamp__gte=now - rule.window))
+            for position, rule in enumerate(self.RULES)
+        })
+        return [counts[f'rule_{position}'] for position in range(len(self.RULES))]
+
     def get_anomalous_users(self):
         from Accounts.models import Profile
         anomalous_users = Profile.objects.filter(sensitivity_score__gte=50.0)
@@ -480,27 +861,21 @@ class UserBehaviorAnalyzer:
         username = self.user.username
 
         # Example: Multiple uploads of sensitive files
-        recent_uploads = UserActivityLog.objects.filter(
+        recent_uploads = list(UserActivityLog.objects.filter(
             user=self.user,
             action='Uploaded file',
             timestamp__gte=datetime.now() - timedelta(hours=1)
-        )
-        for log in recent_uploads:
-            # Process upload logs without unnecessary try-except
-            if log.details:
-                try:
-                    details_dict = json.loads(log.details)
-                    file_path = details_dict.get('file_path')
-                except json.JSONDecodeError:
-                    # Handle non-JSON details
-                    file_path = None
-                    self.logger.warning(f"Could not parse JSON from details: {log.details}")
-
-                if file_path:
-                    file_content = self._read_file(Path(file_path))
-                    file_score = self._get_file_sensitivity_score(file_content)
-                    if file_score < 50:
-                        risk_points += (50 - file_score) * 0.2
+        ).order_by('-timestamp').values_list(
+            'timestamp', 'data_file__scan_status', 'data_file__content_hash', 'data_file__content_score'
+        ))
+        scanned_files = [
+            (content_hash, content_score)
+            for _, scan_status, content_hash, content_score in recent_uploads
+            if scan_status == DataFile.SCAN_DONE
+        ]
+        for file_score in self._file_sensitivity_scores(scanned_files):
+            if file_score < 50:
+                risk_points += (50 - file_score) * 0.2
 
         # Example: Multiple failed login attempts
         failed_logins = UserActivityLog.objects.filter(
@@ -512,9 +887,8 @@ class UserBehaviorAnalyzer:
             risk_points += (failed_logins - 2) * 10  # Add risk points for each failed attempt beyond 2
 
         # Check time between uploads
-        if recent_uploads.count() >= 2:
-            latest_uploads = list(recent_uploads[:2])
-            time_diff = latest_uploads[0].timestamp - latest_uploads[1].timestamp
+        if len(recent_uploads) >= 2:
+            time_diff = recent_uploads[0][0] - recent_uploads[1][0]
             if time_diff < timedelta(minutes=5):
                 risk_points += 10  # Additional score for rapid successive uploads
                 self.logger.warning(f"Rapid successive uploads detected for {username}")
@@ -526,25 +900,19 @@ class UserBehaviorAnalyzer:
         self.logger.info(f"Final behavior score for {username}: {normalized_behavior_score}")
         return round(normalized_behavior_score, 2)
 
-    def _read_file(self, file_path: Path) -> str:
-        # Removed unnecessary try-except block
-        if file_path.suffix.lower() == '.csv':
-            df = pd.read_csv(file_path)
-            return self._prepare_dataframe_content(df)
-        elif file_path.suffix.lower() in ['.xls', '.xlsx']:
-            df = pd.read_excel(file_path)
-            return self._prepare_dataframe_content(df)
-        else:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-    
-    def _prepare_dataframe_content(self, df: pd.DataFrame) -> str:
-        """Convert DataFrame to searchable string format."""
-        # Reuse the method from AdvancedDataLeakDetector
-        detector = AdvancedDataLeakDetector()
-        return detector._prepare_dataframe_content(df)
-    
-    def _get_file_sensitivity_score(self, content: str) -> float:
-        """Compute the sensitivity score of the file content."""
-        detector = AdvancedDataLeakDetector()
-        return detector._calculate_sensitivity_score(content)
+    def _file_sensitivity_scores(self, scanned_files: List[Tuple[Optional[str], Optional[float]]]) -> List[float]:
+        """
+        Content sensitivity of each uploaded file that has been scanned, without reading it.
+
+        Takes the (content hash, stored content score) of each file. The score comes from
+        the scan cache entry of the file's content; files scanned with older rules fall
+        back to the content score stored on the file, which is on the same scale. Files
+        with neither are skipped rather than mixed with their combined score.
+        """
+        content_hashes = {content_hash for content_hash, _ in scanned_files if content_hash}
+        cached_scores = dict(ScanCacheEntry.objects.filter(
+            content_hash__in=content_hashes,
+            rule_set_version=get_detector().rule_set_version
+        ).values_list('content_hash', 'sensitivity_score')) if content_hashes else {}
+        scores = [cached_scores.get(content_hash, content_score) for content_hash, content_score in scanned_files]
+        return [score for score in scores if score is not None]
@@ -0,0 +1,132 @@
+# Dataleakage/edm.py
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Iterable, Optional, Tuple, Union
+
+import numpy as np
+
+_NOT_ALPHANUMERIC = re.compile(r'[^0-9A-Za-z]')
+
+_index = None
+_index_stamp = None  # (inode, size, mtime_ns) of the file _index was loaded from
+_index_lock = threading.Lock()
+
+
+class ExactDataMatchIndex:
+    """
+    Salted 64-bit hashes of registered sensitive values, for Exact Data Match (EDM).
+
+    Values are normalized (separators dropped, uppercased), hashed together with their
+    sensitivity type using keyed BLAKE2b and kept in one sorted ``uint64`` array, so a
+    lookup is a binary search and the raw values are never stored. Ten million values
+    take 80 MB, and the chance that an unregistered value collides with one of them is
+    about ``len(index) / 2**64``.
+
+    Saved indexes are plain ``.npy`` files and are memory-mapped when loaded, so every
+    worker process on a host shares one copy of the pages. Saving replaces the file
+    rather than rewriting it, so processes still mapping the old index keep reading it
+    until they load the new one.
+    """
+
+    def __init__(self, hashes: np.ndarray, salt: Union[str, bytes]):
+        self.hashes = hashes
+        self._key = _derive_key(salt)
+        self._version = None
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    @staticmethod
+    def normalize(value: str) -> str:
+        return _NOT_ALPHANUMERIC.sub('', str(value)).upper()
+
+    @classmethod
+    def build(cls, values: Iterable[Tuple[str, str]], salt: Union[str, bytes]) -> 'ExactDataMatchIndex':
+        """Index (sensitivity type, value) pairs"""
+        key = _derive_key(salt)
+        hashes = np.fromiter(
+            (_hash_value(key, sensitivity_type, cls.normalize(value)) for sensitivity_type, value in values),
+            dtype=np.uint64
+        )
+        return cls(np.unique(hashes), salt)
+
+    @classmethod
+    def load(cls, path: Union[str, Path], salt: Union[str, bytes]) -> 'ExactDataMatchIndex':
+        return cls(np.load(path, mmap_mode='r'), salt)
+
+    def save(self, path: Union[str, Path]):
+        staging = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(staging, 'wb') as f:
+                np.save(f, np.asarray(self.hashes, dtype=np.uint64))
+            os.replace(staging, path)
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+
+    def contains(self, sensitivity_type: str, value: str) -> bool:
+        normalized = self.normalize(value)
+        if not normalized or not len(self.hashes):
+            return False
+        digest = np.uint64(_hash_value(self._key, sensitivity_type, normalized))
+        position = int(np.searchsorted(self.hashes, digest))
+        return position < len(self.hashes) and self.hashes[position] == digest
+
+    @property
+    def version(self) -> str:
+        """Fingerprint of the indexed hashes, so cached scans are redone when the index changes"""
+        if self._version is None:
+            self._version = hashlib.sha256(np.ascontiguousarray(self.hashes).tobytes()).hexdigest()[:16]
+        return self._version
+
+
+def _derive_key(salt: Union[str, bytes]) -> bytes:
+    if isinstance(salt, str):
+        salt = salt.encode('utf-8')
+    return hashlib.sha256(salt).digest()
+
+
+def _hash_value(key: bytes, sensitivity_type: str, normalized: str) -> int:
+    digest = hashlib.blake2b(f'{sensitivity_type}\x1f{normalized}'.encode('utf-8'), digest_size=8, key=key)
+    return int.from_bytes(digest.digest(), 'little')
+
+
+def get_edm_index() -> Optional[ExactDataMatchIndex]:
+    """
+    The index configured by EDM_INDEX_PATH, or None.
+
+    The index is loaded once per process and loaded again when the file is replaced,
+    e.g. by build_edm_index, so running processes pick up a rebuilt index without a
+    restart. Every call costs one ``stat`` of the file.
+    """
+    global _index, _index_stamp
+    from django.conf import settings
+    path = getattr(settings, 'EDM_INDEX_PATH', None)
+    try:
+        file_stat = os.stat(path) if path else None
+    except FileNotFoundError:
+        file_stat = None
+    with _index_lock:
+        if file_stat is None:
+            _index = _index_stamp = None
+            return None
+        stamp = (file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+        if _index is None or stamp != _index_stamp:
+            _index = ExactDataMatchIndex.load(path, edm_salt())
+            _index_stamp = stamp
+        return _index
+
+
+def reset_edm_index():
+    """Forget the loaded index, so the next get_edm_index loads it again"""
+    global _index, _index_stamp
+    with _index_lock:
+        _index = _index_stamp = None
+
+
+def edm_salt() -> str:
+    from django.conf import settings
+    return getattr(settings, 'EDM_SALT', None) or settings.SECRET_KEY
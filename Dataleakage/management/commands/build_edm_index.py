@@ -0,0 +1,46 @@
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Dataleakage.detection import AdvancedDataLeakDetector, reset_detector
+from Dataleakage.edm import ExactDataMatchIndex, edm_salt, reset_edm_index
+
+
+class Command(BaseCommand):
+    help = "Build the Exact Data Match index from a CSV file of registered sensitive values"
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="CSV file with 'type' and 'value' columns")
+        parser.add_argument('--output', default=None, help="Index file to write (defaults to EDM_INDEX_PATH)")
+        parser.add_argument('--chunk-rows', type=int, default=1_000_000)
+
+    def handle(self, *args, **options):
+        output = options['output'] or getattr(settings, 'EDM_INDEX_PATH', None)
+        if not output:
+            raise CommandError("No output path given and EDM_INDEX_PATH is not set")
+
+        known_types = set(AdvancedDataLeakDetector.SENSITIVITY_PATTERNS)
+        unknown_types = set()
+
+        def values():
+            for chunk in pd.read_csv(options['source'], usecols=['type', 'value'], dtype=str,
+                                     chunksize=options['chunk_rows']):
+                for sensitivity_type, value in chunk.dropna().itertuples(index=False):
+                    sensitivity_type = sensitivity_type.strip().upper()
+                    if sensitivity_type not in known_types:
+                        unknown_types.add(sensitivity_type)
+                        continue
+                    yield sensitivity_type, value
+
+        index = ExactDataMatchIndex.build(values(), edm_salt())
+        if unknown_types:
+            self.stderr.write(f"Skipped values of unknown types: {', '.join(sorted(unknown_types))}")
+        index.save(output)
+        reset_edm_index()
+        reset_detector()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {len(index)} values into {output}"))
+        if output == getattr(settings, 'EDM_INDEX_PATH', None):
+            self.stdout.write("Running web and Celery processes use the new index from their next scan; "
+                              "scans cached with the previous index are redone as files are scanned again.")
+        else:
+            self.stdout.write(f"Set EDM_INDEX_PATH to {output} and restart the web and Celery processes to use it.")
@@ -0,0 +1,100 @@
+# Dataleakage/parallel.py
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_scan_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """
+    The process pool shared by every scan in this process, or None when scanning serially.
+
+    Daemonic processes, such as the pool processes of a prefork Celery worker, may not
+    start children, so scans running in one are always serial.
+    """
+    global _pool
+    if workers <= 1:
+        return None
+    if is_daemon_process():
+        logger.debug("Scanning serially; daemonic processes cannot start a scan pool")
+        return None
+    with _pool_lock:
+        if _pool is None:
+            from django.conf import settings
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_scan_worker,
+                initargs=(settings.SETTINGS_MODULE,)
+            )
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def is_daemon_process() -> bool:
+    """Whether this process is daemonic, for the standard library or for Celery's billiard"""
+    if multiprocessing.current_process().daemon:
+        return True
+    try:
+        import billiard
+    except ImportError:
+        return False
+    return bool(billiard.current_process().daemon)
+
+
+def init_scan_worker(settings_module: str):
+    """Make sure Django is set up in a worker started with the spawn method, and build its detector"""
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+        django.setup()
+    _detector()
+
+
+def _detector():
+    from Dataleakage.detection import get_detector
+    return get_detector()
+
+
+def _current_detector():
+    # The pool outlives rebuilds of the EDM index; shards must check against the one the scan uses
+    detector = _detector()
+    detector.refresh_edm_index()
+    return detector
+
+
+def scan_text_shard(buffer: str, base: int, emit_from: int, emit_until: int):
+    return _current_detector()._scan_text_candidates(buffer, base, emit_from, emit_until)
+
+
+def scan_frame_shard(df: pd.DataFrame, row_offset: int):
+    hits = []
+    type_counts = {}
+    _current_detector()._scan_dataframe_hits(df, hits, type_counts, row_offset=row_offset)
+    return hits, type_counts
+
+
+def map_bounded(executor: Executor, fn: Callable, iterable: Iterable[Tuple],
+                max_in_flight: int) -> Iterator:
+    """
+    Like ``executor.map(fn, *zip(*iterable))`` but submits lazily, keeping at most
+    ``max_in_flight`` tasks (and their arguments) alive. Results are yielded in order.
+    """
+    pending = deque()
+    for args in iterable:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
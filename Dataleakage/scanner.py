@@ -0,0 +1,287 @@
+# Dataleakage/scanner.py
+import hashlib
+import json
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse
+
+
+@dataclass(frozen=True)
+class PatternMatch:
+    type: str  # Sensitivity type, e.g. 'AADHAAR'
+    rule: int  # Index of the pattern in CompiledRuleSet.rules
+    start: int
+    end: int
+    text: str
+
+
+@dataclass(frozen=True)
+class Rule:
+    type: str
+    pattern: str
+    regex: re.Pattern
+
+
+class CompiledRuleSet:
+    """
+    All sensitivity patterns compiled once into a single alternation.
+
+    Every pattern becomes a named lookahead branch ``(?=(?P<rN>pattern))``, so one
+    ``finditer`` pass over the text stops only at positions where at least one rule
+    matches. The remaining rules are then tried at that position only, which keeps the
+    results identical to running ``re.finditer`` once per pattern.
+
+    ``anchor`` is an optional lookahead every match must satisfy at its start. It lets
+    the regex engine reject most positions before trying any of the branches.
+    """
+
+    def __init__(self, sensitivity_patterns: Dict[str, Dict], flags: int = re.IGNORECASE,
+                 anchor: Optional[str] = None):
+        self.rules: List[Rule] = []
+        branches = []
+        for sensitivity_type, config in sensitivity_patterns.items():
+            for pattern in config['patterns']:
+                index = len(self.rules)
+                self.rules.append(Rule(sensitivity_type, pattern, re.compile(pattern, flags)))
+                branches.append(f'(?=(?P<r{index}>{pattern}))')
+
+        combined = '|'.join(branches)
+        if anchor:
+            combined = f'(?={anchor})(?:{combined})'
+        self._combined = re.compile(combined, flags)
+        self._group_rules = {
+            self._combined.groupindex[f'r{index}']: index for index in range(len(self.rules))
+        }
+        # Longest text any rule can match, or None if some pattern is unbounded
+        widths = [sre_parse.parse(rule.pattern, flags).getwidth()[1] for rule in self.rules]
+        self.max_match_length = max(widths, default=0) if max(widths, default=0) < sre_parse.MAXREPEAT else None
+
+        self.version = hashlib.sha256(json.dumps(
+            [(rule.type, rule.pattern) for rule in self.rules] + [flags, anchor]
+        ).encode('utf-8')).hexdigest()[:16]
+
+    @property
+    def regex(self) -> re.Pattern:
+        """The combined pattern; ``search`` succeeds wherever any rule would match."""
+        return self._combined
+
+    def iter_candidates(self, text: str, pos: int = 0,
+                        stop: Optional[int] = None) -> Iterator[Tuple[int, int, int]]:
+        """Yield (rule index, start, end) for every position where a rule matches."""
+        rule_count = len(self.rules)
+        for combined_match in self._combined.finditer(text, pos):
+            start = combined_match.start()
+            if stop is not None and start >= stop:
+                break
+
+            # Branches are tried in order, so earlier rules cannot match here
+            first = self._group_rules[combined_match.lastindex]
+            yield first, start, combined_match.end(combined_match.lastindex)
+            for index in range(first + 1, rule_count):
+                other = self.rules[index].regex.match(text, start)
+                if other:
+                    yield index, start, other.end()
+
+    def iter_matches(self, text: str, pos: int = 0, stop: Optional[int] = None,
+                     state: Optional[Dict[int, int]] = None, base: int = 0) -> Iterator[PatternMatch]:
+        """
+        Yield non-overlapping matches per rule, in position order.
+
+        ``state`` maps rule index to the end of its last accepted match (offset by
+        ``base``) and can be carried between calls that scan consecutive windows.
+        """
+        last_end = {} if state is None else state
+        for index, start, end in self.iter_candidates(text, pos, stop):
+            if base + start < last_end.get(index, 0):
+                continue
+            last_end[index] = base + end
+            yield PatternMatch(self.rules[index].type, index, start, end, text[start:end])
+
+    def scan(self, text: str) -> List[PatternMatch]:
+        return list(self.iter_matches(text))
+
+
+class ColumnClassifier:
+    """
+    Maps column names to the sensitivity type their name suggests.
+
+    The name fragments of each type are compiled into one literal alternation, and
+    the result for a whole column list is cached under its fingerprint (the tuple of
+    column names), so a schema that was seen before is not classified again. Like the
+    original nested loops, a name matching several types gets the last one.
+    """
+
+    def __init__(self, column_name_patterns: Dict[str, List[str]], max_schemas: int = 1024):
+        # Later types win, so they are tried first
+        self._type_patterns = [
+            (data_type, re.compile('|'.join(re.escape(pattern) for pattern in patterns)))
+            for data_type, patterns in reversed(list(column_name_patterns.items()))
+            if patterns
+        ]
+        self.max_schemas = max_schemas
+        self._schemas = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @lru_cache(maxsize=4096)
+    def classify_name(self, name: str) -> Optional[str]:
+        """Sensitivity type suggested by one column name, or None"""
+        normalized = name.lower().replace('_', '')
+        for data_type, pattern in self._type_patterns:
+            if pattern.search(normalized):
+                return data_type
+        return None
+
+    def classify(self, columns: Sequence[Hashable]) -> Dict[Hashable, str]:
+        """Map each column whose name looks sensitive to its data type"""
+        columns = list(columns)
+        fingerprint = tuple(str(col) for col in columns)
+        with self._lock:
+            positions = self._schemas.get(fingerprint)
+            if positions is not None:
+                self._schemas.move_to_end(fingerprint)
+                self.hits += 1
+        if positions is None:
+            classified = [(position, self.classify_name(name)) for position, name in enumerate(fingerprint)]
+            positions = tuple((position, data_type) for position, data_type in classified if data_type)
+            with self._lock:
+                self.misses += 1
+                self._schemas[fingerprint] = positions
+                while len(self._schemas) > self.max_schemas:
+                    self._schemas.popitem(last=False)
+        return {columns[position]: data_type for position, data_type in positions}
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'schemas': len(self._schemas),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._schemas.clear()
+            self.hits = self.misses = 0
+        self.classify_name.cache_clear()
+
+
+class KeywordIndex:
+    """
+    Positions of context keywords in one text, for "keyword within N characters" checks.
+
+    The text is lowercased once. A keyword's sorted positions are collected with one
+    literal search over the whole text once it has been looked up often enough to pay
+    for it; after that every check is a bisect. Rarely used keywords are checked with a
+    bounded ``str.find`` on the lowercased text, which never copies the window.
+    """
+
+    # Index a keyword once it has been looked up this many times, and at least once per
+    # 2 KB of text; short texts such as DataFrame cells are never indexed
+    INDEX_MIN_LOOKUPS = 64
+    INDEX_AFTER_LOOKUPS_PER_CHAR = 1 / 2048
+
+    def __init__(self, text: str):
+        lowered = text.lower()
+        # A few characters change length when lowercased (e.g. 'İ'); keep offsets aligned
+        # by searching the original text case-insensitively instead
+        self._aligned = len(lowered) == len(text)
+        self._text = lowered if self._aligned else text
+        self._index_after = max(self.INDEX_MIN_LOOKUPS, int(len(text) * self.INDEX_AFTER_LOOKUPS_PER_CHAR))
+        self._lookups = {}
+        self._positions = {}
+
+    def find(self, keyword: str, start: int, end: int) -> int:
+        """Offset of the first occurrence of a lowercase keyword lying entirely within [start, end), or -1"""
+        positions = self._positions.get(keyword)
+        if positions is None:
+            lookups = self._lookups.get(keyword, 0) + 1
+            self._lookups[keyword] = lookups
+            if lookups < self._index_after:
+                if self._aligned:
+                    return self._text.find(keyword, start, end)
+                found = _keyword_pattern(keyword, re.IGNORECASE).search(self._text, start, end)
+                return found.start() if found else -1
+            positions = self._positions[keyword] = self._collect(keyword)
+
+        index = bisect_left(positions, start)
+        if index < len(positions) and positions[index] + len(keyword) <= end:
+            return positions[index]
+        return -1
+
+    def contains(self, keyword: str, start: int, end: int) -> bool:
+        return self.find(keyword, start, end) != -1
+
+    def contains_any(self, keywords: Iterable[str], start: int, end: int) -> bool:
+        find = self.find
+        for keyword in keywords:
+            if find(keyword, start, end) != -1:
+                return True
+        return False
+
+    def _collect(self, keyword: str) -> List[int]:
+        pattern = _keyword_pattern(keyword, 0 if self._aligned else re.IGNORECASE)
+        return [found.start() for found in pattern.finditer(self._text)]
+
+
+@lru_cache(maxsize=None)
+def _keyword_pattern(keyword: str, flags: int) -> re.Pattern:
+    pattern = re.escape(keyword)
+    if any(keyword[:size] == keyword[-size:] for size in range(1, len(keyword))):
+        pattern = f'(?={pattern})'  # Occurrences of this keyword can overlap each other
+    return re.compile(pattern, flags)
+
+
+def iter_text_windows(stream: TextIO, block_size: int, lookahead: int,
+                      lookbehind: int) -> Iterator[Tuple[str, int, int, int]]:
+    """
+    Read a text stream in fixed-size blocks and yield overlapping scan windows.
+
+    Each item is ``(buffer, base, emit_from, emit_until)``: ``buffer`` starts at offset
+    ``base`` of the stream, and only matches starting in ``[emit_from, emit_until)`` belong
+    to this window. At least ``lookahead`` characters follow ``emit_until`` and
+    ``lookbehind`` characters precede ``emit_from`` (except at the ends of the stream),
+    so a match and its surrounding context are never cut at a block boundary.
+    """
+    carry = ''
+    base = 0
+    emit_from = 0
+    while True:
+        block = stream.read(block_size)
+        buffer = carry + block
+        if not block:
+            yield buffer, base, emit_from, len(buffer)
+            return
+
+        emit_until = len(buffer) - lookahead
+        if emit_until <= emit_from:
+            carry = buffer  # Not enough text past the boundary yet
+            continue
+
+        yield buffer, base, emit_from, emit_until
+
+        keep_from = max(0, emit_until - lookbehind)
+        carry = buffer[keep_from:]
+        base += keep_from
+        emit_from = emit_until - keep_from
+
+
+def iter_string_windows(text: str, block_size: int, lookahead: int,
+                        lookbehind: int) -> Iterator[Tuple[str, int, int, int]]:
+    """Split an in-memory string into the same kind of windows as ``iter_text_windows``"""
+    for block_start in range(0, max(len(text), 1), block_size):
+        block_end = min(block_start + block_size, len(text))
+        base = max(0, block_start - lookbehind)
+        yield text[base:block_end + lookahead], base, block_start - base, block_end - base
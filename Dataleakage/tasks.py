@@ -0,0 +1,300 @@
+# Dataleakage/tasks.py
+import logging
+import os
+import time
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from Accounts.activity import PROFILE_SCORE_ACTIONS
+from Accounts.models import Profile, UserActivityLog
+from DataExplorer.models import DataFile, TaskCheckpoint
+from DataExplorer.tasks import schedule_scan
+from Dataleakage.counters import is_shared_cache
+from Dataleakage.detection import get_detector
+
+logger = logging.getLogger(__name__)
+
+# Files checked per database round trip, see SCAN_SWEEP_BATCH_SIZE
+DEFAULT_SWEEP_BATCH_SIZE = 500
+# A sweep stops after this many seconds and resumes from its checkpoint, see SCAN_SWEEP_TIME_LIMIT
+DEFAULT_SWEEP_TIME_LIMIT = 240
+# Queued or running scans unchanged for this many seconds are queued again, see SCAN_STALL_TIMEOUT
+DEFAULT_SCAN_STALL_TIMEOUT = 60 * 60
+
+SWEEP_CHECKPOINT = 'scan_all_files'
+SWEEP_LOCK_KEY = 'scan_all_files_lock'
+
+SCORES_CHECKPOINT = 'update_all_user_sensitivity_scores'
+SCORES_LOCK_KEY = 'update_all_user_sensitivity_scores_lock'
+SCORES_LOCK_TIMEOUT = 10 * 60
+# Profiles recomputed and written back per bulk_update
+SCORES_BATCH_SIZE = 500
+
+# A user's risk is recomputed at most this many seconds after their activity, see RISK_UPDATE_MAX_STALENESS
+DEFAULT_RISK_UPDATE_MAX_STALENESS = 30
+
+
+@shared_task
+def scan_all_files_async():
+    """
+    Rescan the uploaded files whose content changed since their last scan.
+
+    Files are walked in id order in batches. A file whose size and modification time
+    match the ones recorded by its last scan, failed or not, is skipped without being
+    read; otherwise its content hash decides whether it really changed. Changed files
+    are queued for scan_data_file. The position is checkpointed after every batch, so a
+    sweep that runs out of time resumes where it stopped on the next run.
+
+    Queued and running scans are left alone unless they stalled: those whose queueing
+    failed or whose status and progress did not change within SCAN_STALL_TIMEOUT, e.g.
+    because the worker died, are queued again first.
+
+    Every run also logs the cache statistics of this worker process's detector and
+    returns them with its summary.
+    """
+    batch_size = getattr(settings, 'SCAN_SWEEP_BATCH_SIZE', DEFAULT_SWEEP_BATCH_SIZE)
+    time_limit = getattr(settings, 'SCAN_SWEEP_TIME_LIMIT', DEFAULT_SWEEP_TIME_LIMIT)
+
+    # Overlapping runs would queue the same files twice
+    if not cache.add(SWEEP_LOCK_KEY, True, timeout=time_limit + 60):
+        logger.info("Previous file sweep is still running; skipping this run")
+        return None
+
+    try:
+        deadline = time.monotonic() + time_limit
+        checkpoint, _ = TaskCheckpoint.objects.get_or_create(name=SWEEP_CHECKPOINT)
+        last_id = checkpoint.position.get('last_id', 0)
+        summary = {'checked': 0, 'changed': 0, 'stalled': _requeue_stalled_scans(batch_size)}
+
+        while time.monotonic() < deadline:
+            batch = list(
+                DataFile.objects.filter(id__gt=last_id)
+                .exclude(scan_status__in=[DataFile.SCAN_QUEUED, DataFile.SCAN_RUNNING])
+                .order_by('id')
+                .values_list('id', 'file', 'scanned_size', 'scanned_mtime_ns', 'content_hash')[:batch_size]
+            )
+            if not batch:
+                last_id = 0  # Swept every file; the next run starts over
+                break
+
+            summary['checked'] += len(batch)
+            summary['changed'] += _rescan_changed_files(batch)
+            last_id = batch[-1][0]
+            checkpoint.position = {'last_id': last_id}
+            checkpoint.save(update_fields=['position', 'updated_at'])
+
+        checkpoint.position = {'last_id': last_id}
+        checkpoint.save(update_fields=['position', 'updated_at'])
+        logger.info(f"File sweep checked {summary['checked']} files, {summary['changed']} changed, "
+                    f"queued {summary['stalled']} stalled scans again")
+
+        summary['metrics'] = get_detector().metrics()
+        logger.info(f"Detector cache statistics of worker process {os.getpid()}: {summary['metrics']}")
+        return summary
+    finally:
+        cache.delete(SWEEP_LOCK_KEY)
+
+
+def _requeue_stalled_scans(limit) -> int:
+    """Queue again up to ``limit`` scans that stalled; returns how many were queued"""
+    stall_timeout = getattr(settings, 'SCAN_STALL_TIMEOUT', DEFAULT_SCAN_STALL_TIMEOUT)
+    cutoff = timezone.now() - timedelta(seconds=stall_timeout)
+    stalled = list(
+        DataFile.objects.filter(scan_status__in=[DataFile.SCAN_QUEUED, DataFile.SCAN_RUNNING])
+        .filter(Q(scan_updated_at__isnull=True) | Q(scan_updated_at__lt=cutoff))
+        .order_by('id')
+        .values_list('id', 'scanned_at')[:limit]
+    )
+    if not stalled:
+        return 0
+
+    DataFile.objects.filter(id__in=[file_id for file_id, _ in stalled]).update(
+        scan_status=DataFile.SCAN_QUEUED, scan_progress=0.0, scan_updated_at=timezone.now()
+    )
+    for file_id, scanned_at in stalled:
+        logger.warning(f"Scan of file {file_id} stalled; queueing it again")
+        # A file that was never scanned is an upload whose scan never ran, so it is still to be logged
+        schedule_scan(file_id, log_upload=scanned_at is None)
+    return len(stalled)
+
+
+def _rescan_changed_files(batch) -> int:
+    """Queue the files of one batch whose content changed; returns how many were queued"""
+    detector = get_detector()
+    touched = []
+    changed_ids = []
+    for file_id, name, scanned_size, scanned_mtime_ns, content_hash in batch:
+        try:
+            path = default_storage.path(name)
+            file_stat = os.stat(path)
+        except (FileNotFoundError, NotImplementedError):
+            continue
+        if file_stat.st_size == scanned_size and file_stat.st_mtime_ns == scanned_mtime_ns:
+            continue
+
+        # Touched or copied but identical: remember the new size and time, don't rescan
+        if content_hash and detector._content_hash(path) == content_hash:
+            touched.append(DataFile(id=file_id, scanned_size=file_stat.st_size,
+                                    scanned_mtime_ns=file_stat.st_mtime_ns))
+        else:
+            changed_ids.append(file_id)
+
+    if touched:
+        DataFile.objects.bulk_update(touched, ['scanned_size', 'scanned_mtime_ns'])
+    if changed_ids:
+        DataFile.objects.filter(id__in=changed_ids).update(scan_status=DataFile.SCAN_QUEUED, scan_progress=0.0,
+                                                           scan_updated_at=timezone.now())
+        for file_id in changed_ids:
+            schedule_scan(file_id, log_upload=False)
+    return len(changed_ids)
+
+
+@shared_task
+def update_all_user_sensitivity_scores():
+    """
+    Recompute the sensitivity score of every user who uploaded or deleted files since the last run.
+
+    Like recompute_user_risk, only PROFILE_SCORE_ACTIONS update a profile's score;
+    other activity is analyzed but leaves it alone. This run catches up on updates
+    whose recompute_user_risk was lost. The id of the newest UserActivityLog row seen
+    is checkpointed, so a run only reads the log rows added since and recomputes the
+    users who wrote them; idle accounts cost nothing. Scores are written back with
+    bulk_update, and users crossing the blocking threshold are blocked just like
+    Profile.save does. The lock lives in the shared default cache, so runs of
+    different workers never overlap.
+    """
+    if not cache.add(SCORES_LOCK_KEY, True, timeout=SCORES_LOCK_TIMEOUT):
+        logger.info("Previous score update is still running; skipping this run")
+        return None
+
+    try:
+        checkpoint, _ = TaskCheckpoint.objects.get_or_create(name=SCORES_CHECKPOINT)
+        last_log_id = checkpoint.position.get('last_log_id', 0)
+        latest_log_id = UserActivityLog.objects.aggregate(latest=Max('id'))['latest'] or 0
+        if latest_log_id <= last_log_id:
+            return {'users': 0, 'updated': 0}
+
+        dirty_user_ids = (
+            UserActivityLog.objects.filter(id__gt=last_log_id, id__lte=latest_log_id,
+                                           action__in=PROFILE_SCORE_ACTIONS)
+            .values_list('user_id', flat=True)
+            .distinct()
+        )
+        profiles = Profile.objects.filter(user_id__in=dirty_user_ids).select_related('user').order_by('id')
+
+        summary = {'users': 0, 'updated': 0}
+        batch = []
+        for profile in profiles.iterator(chunk_size=SCORES_BATCH_SIZE):
+            batch.append(profile)
+            if len(batch) >= SCORES_BATCH_SIZE:
+                _update_profile_scores(batch, summary)
+                batch = []
+        _update_profile_scores(batch, summary)
+
+        checkpoint.position = {'last_log_id': latest_log_id}
+        checkpoint.save(update_fields=['position', 'updated_at'])
+        logger.info(f"Recomputed sensitivity scores of {summary['users']} users, {summary['updated']} changed")
+        return summary
+    finally:
+        cache.delete(SCORES_LOCK_KEY)
+
+
+def _update_profile_scores(profiles, summary):
+    """Recompute one batch of profiles and write the changed scores back in one query"""
+    detector = get_detector()
+    changed = []
+    for profile in profiles:
+        try:
+            score = detector.analyze_user(profile.user).score
+        except Exception as e:
+            logger.error(f"Error computing sensitivity score for {profile.user.username}: {str(e)}")
+            continue
+        summary['users'] += 1
+        if score != profile.sensitivity_score:
+            profile.sensitivity_score = score
+            changed.append(profile)
+
+    if changed:
+        Profile.objects.bulk_update(changed, ['sensitivity_score'])
+        summary['updated'] += len(changed)
+
+    # bulk_update skips Profile.save, which blocks users crossing the threshold
+    for profile in changed:
+        if profile.sensitivity_score >= Profile.BLOCKING_SCORE and profile.user.is_active:
+            profile.block_user("Sensitivity score threshold exceeded")
+
+
+def schedule_user_risk_update(user_id, update_profile=False):
+    """
+    Queue a recomputation of the user's risk unless one is already pending.
+
+    The first activity of a burst schedules recompute_user_risk to run after the maximum
+    staleness; later activity before it runs only marks whether the profile score must
+    be updated, so a burst of events costs one recomputation. The markers live in the
+    default cache, which the worker running the task must share; with a per-process
+    cache every call schedules its own run instead.
+    """
+    max_staleness = getattr(settings, 'RISK_UPDATE_MAX_STALENESS', DEFAULT_RISK_UPDATE_MAX_STALENESS)
+    if is_shared_cache(caches['default']):
+        # The markers expire on their own in case the task is lost
+        marker_timeout = max_staleness + 60
+        if update_profile:
+            cache.set(f'risk_update_profile_{user_id}', True, timeout=marker_timeout)
+        if not cache.add(f'risk_update_pending_{user_id}', True, timeout=marker_timeout):
+            return
+
+    try:
+        recompute_user_risk.apply_async((user_id, update_profile), countdown=max_staleness)
+    except Exception as e:
+        # Without a broker, recompute now rather than not at all
+        logger.error(f"Could not queue risk update for user {user_id}: {str(e)}")
+        recompute_user_risk(user_id, update_profile)
+
+
+@shared_task
+def recompute_user_risk(user_id, update_profile=False):
+    """
+    Run the anomaly and behavior analysis of one user and update their profile score if needed.
+
+    The profile score is updated if ``update_profile`` is set or later activity of the
+    same burst asked for it, see schedule_user_risk_update.
+    """
+    from django.contrib.auth.models import User
+
+    # Activity from now on schedules a new run
+    cache.delete(f'risk_update_pending_{user_id}')
+    update_profile = cache.get(f'risk_update_profile_{user_id}', False) or update_profile
+    cache.delete(f'risk_update_profile_{user_id}')
+
+    user = User.objects.select_related('profile').filter(id=user_id).first()
+    if user is None:
+        return None
+    username = user.username
+
+    # Get the anomalies and scores, combined using the detector's method
+    risk = get_detector().analyze_user(user)
+    combined_score = risk.score
+    logger.info(f"Activity scores - Anomaly: {risk.anomaly_score}, Behavior: {risk.user_behavior_score}, Combined: {combined_score}")
+
+    # Log all anomalies detected
+    if risk.anomalies:
+        logger.warning(f"Anomalies for {username}: {risk.anomalies}")
+
+    # Update the profile score with the combined score
+    if update_profile:
+        try:
+            if hasattr(user, 'profile'):
+                profile = user.profile
+                previous_score = profile.sensitivity_score
+                profile.sensitivity_score = combined_score  # Removed max() to allow score to decrease
+                profile.save(update_fields=['sensitivity_score'])  # Blocks the user past the threshold
+                logger.info(f"Updated {username}'s sensitivity score: {previous_score} -> {combined_score}")
+        except Exception as e:
+            logger.error(f"Error updating sensitivity score for {username}: {str(e)}")
+    return combined_score
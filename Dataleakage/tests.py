@@ -0,0 +1,740 @@
+import multiprocessing
+import os
+import random
+import re
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from Accounts.models import UserActivityLog
+from DataExplorer.models import DataFile, ScanCacheEntry, TaskCheckpoint
+from DataExplorer.tasks import scan_data_file
+from Dataleakage import parallel
+from Dataleakage.counters import ActivityCounters
+from Dataleakage.detection import AdvancedDataLeakDetector, AnomalyDetector, UserBehaviorAnalyzer, get_detector
+from Dataleakage.edm import ExactDataMatchIndex, edm_salt, reset_edm_index
+from Dataleakage.scanner import KeywordIndex, PatternMatch, iter_string_windows
+from Dataleakage.tasks import (
+    SCORES_CHECKPOINT, SCORES_LOCK_KEY, recompute_user_risk, scan_all_files_async, schedule_user_risk_update,
+    update_all_user_sensitivity_scores,
+)
+
+
+def sensitive_text(seed, lines=400):
+    """Text mixing values of every sensitivity type with their context keywords and noise"""
+    rng = random.Random(seed)
+
+    def digits(count):
+        return ''.join(rng.choice('0123456789') for _ in range(count))
+
+    values = [
+        lambda: f"{rng.choice('23456789')}{digits(3)} {digits(4)} {digits(4)}",
+        lambda: f"{rng.choice('23456789')}{digits(11)}",
+        lambda: ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(5)) + digits(4) + 'Z',
+        lambda: f"{rng.choice('ABCPRSWY')}{rng.choice('123456789')}{digits(1)} {digits(4)}{rng.choice('123456789')}",
+        lambda: f"{rng.choice(['DL', 'K', 'MH'])}{digits(rng.randint(4, 9))}",
+        lambda: f"{digits(3)}-{digits(2)}-{digits(4)}",
+        lambda: f"+1 ({digits(3)}) {digits(3)}-{digits(4)}",
+        lambda: f"{digits(2)}/{digits(2)}/{digits(4)}",
+        lambda: f"{digits(4)}-{digits(2)}-{digits(2)}",
+        lambda: digits(rng.randint(1, 14)),
+    ]
+    words = ['ssn', 'phone', 'passport', 'dob', 'tax', 'id', 'license', 'birth', 'contact', 'uid',
+             'the', 'order', 'total', 'note', 'İstanbul', 'straße', 'value', 'ref']
+    out = []
+    for _ in range(lines):
+        parts = [rng.choice(words) if rng.random() < 0.6 else rng.choice(values)()
+                 for _ in range(rng.randint(1, 12))]
+        prefix = f"{rng.choice(words)}:" if rng.random() < 0.3 else ''
+        out.append(prefix + rng.choice([' ', ', ', '\t', ' - ']).join(parts))
+    return '\n'.join(out)
+
+
+def _pool_in_daemon(results):
+    results.put(parallel.get_scan_pool(2) is None)
+
+
+class ScanPoolTests(SimpleTestCase):
+    """Scans in daemonic processes, such as Celery's prefork pool, must not try to start a pool"""
+
+    FRAME = pd.DataFrame({
+        'email': ['john.doe@example.com', 'jane@example.org'] * 100,
+        'ssn': ['123-45-6789', '987-65-4321'] * 100,
+        'note': ['call 555-123-4567', 'nothing here'] * 100,
+    })
+
+    @skipUnless('fork' in multiprocessing.get_all_start_methods(), "Needs the fork start method")
+    def test_no_pool_in_daemonic_process(self):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        process = context.Process(target=_pool_in_daemon, args=(results,), daemon=True)
+        process.start()
+        process.join(timeout=30)
+        self.assertEqual(process.exitcode, 0)
+        self.assertTrue(results.get(timeout=5))
+
+    def test_large_content_is_scanned_serially_in_daemonic_process(self):
+        serial = AdvancedDataLeakDetector()
+        serial.workers = 1
+        expected = serial._scan_source(self.FRAME)
+
+        detector = AdvancedDataLeakDetector()
+        detector.workers = 4
+        detector.parallel_min_bytes = 0  # Every content is large enough for the pool
+        with mock.patch.object(parallel, 'is_daemon_process', return_value=True), \
+                mock.patch.object(parallel, 'ProcessPoolExecutor', side_effect=AssertionError("pool started")):
+            self.assertIsNone(parallel.get_scan_pool(detector.workers))
+            self.assertEqual(detector._scan_source(self.FRAME), expected)
+
+
+class DetectorMetricsTests(TestCase):
+    """The column classifier's cache hit rate must show up in the periodic sweep's log and summary"""
+
+    def setUp(self):
+        get_detector().COLUMN_CLASSIFIER.clear()
+        self.addCleanup(get_detector().COLUMN_CLASSIFIER.clear)
+
+    def test_metrics_count_repeated_schemas(self):
+        detector = get_detector()
+        for _ in range(3):
+            detector._classify_columns(['customer_email', 'phone_number', 'notes'])
+        stats = detector.metrics()['column_classifier']
+        self.assertEqual((stats['hits'], stats['misses'], stats['schemas']), (2, 1, 1))
+        self.assertEqual(stats['hit_rate'], round(2 / 3, 4))
+
+    def test_sweep_logs_and_returns_metrics(self):
+        get_detector()._classify_columns(['email'])
+        get_detector()._classify_columns(['email'])
+        with self.assertLogs('Dataleakage.tasks', level='INFO') as logs:
+            summary = scan_all_files_async()
+        self.assertEqual(summary['metrics']['column_classifier']['hit_rate'], 0.5)
+        self.assertTrue(any('Detector cache statistics' in line and "'hit_rate': 0.5" in line for line in logs.output))
+
+
+class EdmIndexReloadTests(SimpleTestCase):
+    """A rebuilt EDM index must reach detectors that were built before it"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'edm_index.npy')
+        settings_override = override_settings(EDM_INDEX_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_edm_index()
+        self.addCleanup(reset_edm_index)
+
+    def build(self, values):
+        ExactDataMatchIndex.build(values, edm_salt()).save(self.path)
+
+    def test_detector_picks_up_rebuilt_index(self):
+        self.build([('PAN', 'ABCDE1234F')])
+        detector = AdvancedDataLeakDetector()
+        version = detector.rule_set_version
+        self.assertTrue(detector._is_exact_match('PAN', 'ABCDE1234F'))
+        self.assertFalse(detector._is_exact_match('PAN', 'ZZZZZ9999Z'))
+
+        self.build([('PAN', 'ZZZZZ9999Z')])
+        self.assertNotEqual(detector.rule_set_version, version)
+        self.assertTrue(detector._is_exact_match('PAN', 'ZZZZZ9999Z'))
+        self.assertFalse(detector._is_exact_match('PAN', 'ABCDE1234F'))
+
+    def test_removed_index_is_dropped(self):
+        self.build([('PAN', 'ABCDE1234F')])
+        detector = AdvancedDataLeakDetector()
+        os.remove(self.path)
+        detector.refresh_edm_index()
+        self.assertIsNone(detector.edm_index)
+
+
+class AnomalyCountTests(TestCase):
+    """Anomaly rules must see every process's activity, whichever cache holds the counters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst')
+        UserActivityLog.objects.bulk_create(
+            [UserActivityLog(user=cls.user, action='Deleted file') for _ in range(3)]
+            + [UserActivityLog(user=cls.user, action='Logged in')]
+        )
+
+    def test_per_process_counters_fall_back_to_database(self):
+        # Nothing was recorded in this process's counters, as if another process wrote the logs
+        counters = ActivityCounters(LocMemCache('anomaly-count-tests-empty', {}))
+        self.assertFalse(counters.shared)
+        with mock.patch('Dataleakage.detection.get_activity_counters', return_value=counters):
+            anomalies, score = AnomalyDetector(self.user).detect_anomalies()
+        self.assertEqual(anomalies, ["Suspicious file deletion spree detected."])
+        self.assertEqual(score, 10 / AnomalyDetector.MAX_ANOMALY_SCORE * 100)
+
+    def test_database_counts_match_counters(self):
+        counters = ActivityCounters(LocMemCache('anomaly-count-tests', {}))
+        for log in UserActivityLog.objects.filter(user=self.user):
+            counters.record(self.user.id, log.action, log.timestamp)
+        detector = AnomalyDetector(self.user)
+        self.assertEqual(
+            detector._count_windows_in_database(),
+            counters.count_windows(self.user.id, [(rule.actions, rule.window) for rule in AnomalyDetector.RULES])
+        )
+
+
+class FailedScanSweepTests(TestCase):
+    """A file whose scan failed is scanned again by the sweep only once it changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # Not UTF-8, so the text scan fails
+        self.data_file = DataFile(title='notes', file_type='txt', uploaded_by=self.user, user=self.user)
+        self.data_file.file.save('notes.txt', ContentFile('café 555-123-4567'.encode('latin-1')))
+        with self.assertLogs('DataExplorer.tasks', level='ERROR'):
+            scan_data_file(self.data_file.id, log_upload=False)
+        self.data_file.refresh_from_db()
+        self.assertEqual(self.data_file.scan_status, DataFile.SCAN_FAILED)
+
+    def test_unchanged_failed_file_is_not_rescanned(self):
+        for _ in range(2):
+            summary = scan_all_files_async()
+            self.assertEqual((summary['checked'], summary['changed']), (1, 0))
+
+    def test_changed_failed_file_is_rescanned(self):
+        with open(self.data_file.file.path, 'w', encoding='utf-8') as f:
+            f.write('café 555-123-4567')
+        summary = scan_all_files_async()
+        self.assertEqual((summary['checked'], summary['changed']), (1, 1))
+        self.data_file.refresh_from_db()
+        self.assertEqual(self.data_file.scan_status, DataFile.SCAN_DONE)
+
+
+@override_settings(EDM_INDEX_PATH=os.path.join(tempfile.gettempdir(), 'no-edm-index.npy'))
+class ScanEngineEquivalenceTests(SimpleTestCase):
+    """The single-pass rule set must find exactly what one re.finditer per pattern finds"""
+
+    def setUp(self):
+        reset_edm_index()
+        self.addCleanup(reset_edm_index)
+        self.detector = AdvancedDataLeakDetector()
+
+    def per_pattern_matches(self, text):
+        return sorted(
+            (index, found.start(), found.end(), found.group())
+            for index, rule in enumerate(self.detector.RULE_SET.rules)
+            for found in re.finditer(rule.pattern, text, re.IGNORECASE)
+        )
+
+    def test_single_pass_matches_per_pattern_finditer(self):
+        for seed in range(5):
+            text = sensitive_text(seed)
+            matches = self.detector.RULE_SET.scan(text)
+            self.assertEqual(sorted((m.rule, m.start, m.end, m.text) for m in matches),
+                             self.per_pattern_matches(text))
+            self.assertEqual([m.type for m in matches],
+                             [self.detector.RULE_SET.rules[m.rule].type for m in matches])
+
+    def test_findings_and_counts_match_per_pattern_scan(self):
+        for seed in range(5):
+            text = sensitive_text(seed)
+            expected_findings = []
+            expected_counts = {}
+            for index, start, end, match_text in self.per_pattern_matches(text):
+                rule = self.detector.RULE_SET.rules[index]
+                expected_findings.append({"type": rule.type, "match": match_text, "location": start})
+                match = PatternMatch(rule.type, index, start, end, match_text)
+                if self.detector._validate_match_context(match, text, self.detector.SENSITIVITY_PATTERNS[rule.type]):
+                    expected_counts[rule.type] = expected_counts.get(rule.type, 0) + 1
+
+            matches, type_counts = self.detector._scan_content(text)
+            self.assertEqual(self.detector._findings_from_matches(matches), expected_findings)
+            self.assertEqual(type_counts, expected_counts)
+            self.assertTrue(expected_counts)
+
+
+@override_settings(EDM_INDEX_PATH=os.path.join(tempfile.gettempdir(), 'no-edm-index.npy'))
+class TextStreamScanTests(SimpleTestCase):
+    """Scanning text in overlapping blocks must give the findings and counts of one whole-text scan"""
+
+    # Far smaller than a match plus its context, so matches and context cross block boundaries
+    BLOCK_SIZES = (1, 7, 64, 333, 4096)
+
+    def setUp(self):
+        reset_edm_index()
+        self.addCleanup(reset_edm_index)
+        self.detector = AdvancedDataLeakDetector()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def whole_text_scan(self, text):
+        matches, type_counts = self.detector._scan_content(text)
+        return self.detector._findings_from_matches(matches), type_counts
+
+    def test_streamed_file_matches_whole_text(self):
+        text = sensitive_text(seed=7, lines=150)
+        path = os.path.join(self.directory, 'notes.txt')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        expected = self.whole_text_scan(text)
+        for block_size in self.BLOCK_SIZES:
+            with self.subTest(block_size=block_size):
+                self.assertEqual(self.detector._scan_text_stream(Path(path), block_size=block_size), expected)
+
+    def test_string_windows_match_whole_text(self):
+        text = sensitive_text(seed=8, lines=150)
+        expected = self.whole_text_scan(text)
+        lookahead = self.detector.RULE_SET.max_match_length + self.detector.CONTEXT_WINDOW + 1
+        lookbehind = self.detector.CONTEXT_WINDOW + 1
+        for block_size in self.BLOCK_SIZES:
+            with self.subTest(block_size=block_size):
+                windows = iter_string_windows(text, block_size, lookahead, lookbehind)
+                self.assertEqual(self.detector._merge_text_windows(windows), expected)
+
+
+@override_settings(EDM_INDEX_PATH=os.path.join(tempfile.gettempdir(), 'no-edm-index.npy'))
+class CsvStreamScanTests(SimpleTestCase):
+    """Scanning a CSV in row chunks must give the findings, rows and counts of one whole-frame scan"""
+
+    # Chunk budgets from one row per chunk up to the whole file in one chunk
+    CHUNK_BUDGETS = (1, 5000, 40000, 10 ** 9)
+
+    def setUp(self):
+        reset_edm_index()
+        self.addCleanup(reset_edm_index)
+        self.detector = AdvancedDataLeakDetector()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'records.csv'
+        rng = random.Random(3)
+        notes = sensitive_text(seed=9, lines=300).split('\n')
+        pd.DataFrame({
+            'id': range(len(notes)),
+            'ssn': [f"{rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}" for _ in notes],
+            'notes': notes,
+        }).to_csv(self.path, index=False)
+
+    def test_chunked_scan_matches_whole_frame_scan(self):
+        frame = pd.read_csv(self.path)
+        expected = self.detector._scan_dataframe(frame)
+        self.assertTrue(expected[1])
+        for chunk_budget in self.CHUNK_BUDGETS:
+            with self.subTest(chunk_budget=chunk_budget):
+                self.assertEqual(self.detector._scan_csv_stream(self.path, chunk_budget=chunk_budget), expected)
+
+    def test_chunks_carry_their_row_offsets(self):
+        frame = pd.read_csv(self.path)
+        scan_chunk = mock.patch.object(self.detector, '_scan_dataframe_hits', wraps=self.detector._scan_dataframe_hits)
+        with scan_chunk as scanned:
+            findings, _ = self.detector._scan_csv_stream(self.path, chunk_budget=5000)
+
+        offsets = [call.kwargs['row_offset'] for call in scanned.call_args_list]
+        chunks = [call.args[0] for call in scanned.call_args_list]
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(offsets, [chunk.index[0] for chunk in chunks])
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(frame))
+        for finding in findings:
+            self.assertIn(finding['match'], str(frame.loc[finding['row'], finding['column']]))
+
+
+@override_settings(EDM_INDEX_PATH=os.path.join(tempfile.gettempdir(), 'no-edm-index.npy'))
+class ScanCacheTests(TestCase):
+    """Content is scanned once per content hash and rule set version, whatever the file is called"""
+
+    def setUp(self):
+        reset_edm_index()
+        self.addCleanup(reset_edm_index)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.detector = AdvancedDataLeakDetector()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content, encoding='utf-8')
+        return str(path)
+
+    def analyze(self, path):
+        with mock.patch.object(self.detector, '_scan_source', wraps=self.detector._scan_source) as scan:
+            result = self.detector.analyze_file(path, {'filename': os.path.basename(path)})
+        return result, scan.call_count
+
+    def test_same_content_is_scanned_once(self):
+        content = 'name,ssn\nJohn,123-45-6789\nJane,987-65-4321\n'
+        first, scans = self.analyze(self.write('a.csv', content))
+        self.assertEqual(scans, 1)
+        entry = ScanCacheEntry.objects.get()
+        self.assertEqual((entry.content_hash, entry.rule_set_version),
+                         (first.metadata['content_hash'], self.detector.rule_set_version))
+
+        second, scans = self.analyze(self.write('copy of a.csv', content))
+        self.assertEqual(scans, 0)
+        self.assertEqual(second.findings, first.findings)
+        self.assertEqual(second.content_score, first.content_score)
+
+        # Without the Django cache the stored entry is used
+        cache.clear()
+        third, scans = self.analyze(self.write('b.csv', content))
+        self.assertEqual(scans, 0)
+        self.assertEqual(third.findings, first.findings)
+
+    def test_changed_content_is_scanned(self):
+        self.analyze(self.write('a.csv', 'name,ssn\nJohn,123-45-6789\n'))
+        _, scans = self.analyze(self.write('a.csv', 'name,ssn\nJohn,123-45-6780\n'))
+        self.assertEqual(scans, 1)
+        self.assertEqual(ScanCacheEntry.objects.count(), 2)
+
+    def test_new_rule_set_version_is_scanned(self):
+        path = self.write('a.csv', 'name,ssn\nJohn,123-45-6789\n')
+        self.analyze(path)
+        with mock.patch.object(AdvancedDataLeakDetector, 'SCAN_LOGIC_VERSION', AdvancedDataLeakDetector.SCAN_LOGIC_VERSION + 1):
+            _, scans = self.analyze(path)
+            self.assertEqual(scans, 1)
+            _, scans = self.analyze(path)
+            self.assertEqual(scans, 0)
+        self.assertEqual(ScanCacheEntry.objects.values('rule_set_version').distinct().count(), 2)
+
+    def test_stored_findings_are_capped_per_type(self):
+        path = self.write('notes.txt', '\n'.join(
+            f'ssn {index}-45-6789, phone +1 (555) 010-{index:04d}' for index in range(100, 110)))
+        full_findings, full_counts = self.detector._scan_source(path)
+        seen = {}
+        expected = []
+        for finding in full_findings:
+            seen[finding['type']] = seen.get(finding['type'], 0) + 1
+            if seen[finding['type']] <= 3:
+                expected.append(finding)
+        self.assertGreater(len(seen), 1)
+        self.assertLess(len(expected), len(full_findings))
+
+        with override_settings(SCAN_MAX_FINDINGS_PER_TYPE=3):
+            detector = AdvancedDataLeakDetector()
+            result = detector.analyze_file(path, {'filename': 'notes.txt'})
+        self.assertNotEqual(detector.rule_set_version, self.detector.rule_set_version)
+        self.assertEqual(result.findings, expected)
+        entry = ScanCacheEntry.objects.get(rule_set_version=detector.rule_set_version)
+        self.assertEqual(entry.findings, expected)
+        self.assertEqual(entry.type_counts, full_counts)
+        self.assertEqual(result.content_score, detector._score_from_counts(full_counts))
+
+
+class UserScoreUpdateTests(TestCase):
+    """The periodic score update recomputes only users with new uploads or deletions, resuming from its checkpoint"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.uploader = User.objects.create_user('uploader')
+        cls.browser = User.objects.create_user('browser')
+        cls.idle = User.objects.create_user('idle')
+
+    def setUp(self):
+        detector = mock.patch('Dataleakage.tasks.get_detector')
+        self.analyze_user = detector.start().return_value.analyze_user
+        self.addCleanup(detector.stop)
+        self.analyze_user.return_value.score = 42.0
+        self.addCleanup(cache.delete, SCORES_LOCK_KEY)
+
+    def log(self, user, action):
+        # bulk_create skips the post_save handler, which would schedule a risk update of its own
+        return UserActivityLog.objects.bulk_create([UserActivityLog(user=user, action=action)])[0]
+
+    def recomputed_users(self):
+        return sorted(call.args[0].username for call in self.analyze_user.call_args_list)
+
+    def test_only_users_with_score_actions_are_recomputed(self):
+        self.log(self.uploader, 'Uploaded file')
+        self.log(self.uploader, 'Viewed file')
+        self.log(self.browser, 'Viewed file')
+        summary = update_all_user_sensitivity_scores()
+        self.assertEqual(summary, {'users': 1, 'updated': 1})
+        self.assertEqual(self.recomputed_users(), ['uploader'])
+        self.uploader.profile.refresh_from_db()
+        self.browser.profile.refresh_from_db()
+        self.assertEqual((self.uploader.profile.sensitivity_score, self.browser.profile.sensitivity_score), (42.0, 0.0))
+
+    def test_runs_resume_from_the_checkpoint(self):
+        self.log(self.uploader, 'Uploaded file')
+        update_all_user_sensitivity_scores()
+        self.analyze_user.reset_mock()
+
+        self.assertEqual(update_all_user_sensitivity_scores(), {'users': 0, 'updated': 0})
+        self.analyze_user.assert_not_called()
+
+        latest = self.log(self.browser, 'Deleted file')
+        self.assertEqual(update_all_user_sensitivity_scores(), {'users': 1, 'updated': 1})
+        self.assertEqual(self.recomputed_users(), ['browser'])
+        self.assertEqual(TaskCheckpoint.objects.get(name=SCORES_CHECKPOINT).position, {'last_log_id': latest.id})
+
+    def test_logs_before_a_stored_checkpoint_are_skipped(self):
+        seen = self.log(self.uploader, 'Uploaded file')
+        TaskCheckpoint.objects.create(name=SCORES_CHECKPOINT, position={'last_log_id': seen.id})
+        self.log(self.idle, 'Uploaded file')
+        update_all_user_sensitivity_scores()
+        self.assertEqual(self.recomputed_users(), ['idle'])
+
+    def test_unchanged_scores_are_not_written(self):
+        self.analyze_user.return_value.score = 0.0
+        self.log(self.uploader, 'Uploaded file')
+        self.assertEqual(update_all_user_sensitivity_scores(), {'users': 1, 'updated': 0})
+
+    def test_overlapping_run_is_skipped(self):
+        self.log(self.uploader, 'Uploaded file')
+        cache.add(SCORES_LOCK_KEY, True)
+        self.assertIsNone(update_all_user_sensitivity_scores())
+        self.analyze_user.assert_not_called()
+        self.assertFalse(TaskCheckpoint.objects.filter(name=SCORES_CHECKPOINT).exists())
+
+
+@override_settings(RISK_UPDATE_MAX_STALENESS=30)
+class RiskUpdateDebounceTests(TestCase):
+    """A burst of activity schedules one risk recomputation, which updates the profile if any event asked for it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('uploader')
+        cls.other = User.objects.create_user('browser')
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # The test process stands in for the web and worker processes sharing one cache
+        shared = mock.patch('Dataleakage.tasks.is_shared_cache', return_value=True)
+        self.is_shared_cache = shared.start()
+        self.addCleanup(shared.stop)
+        apply_async = mock.patch.object(recompute_user_risk, 'apply_async')
+        self.apply_async = apply_async.start()
+        self.addCleanup(apply_async.stop)
+        detector = mock.patch('Dataleakage.tasks.get_detector')
+        detector.start().return_value.analyze_user.return_value = mock.Mock(
+            score=55.0, anomalies=[], anomaly_score=0.0, user_behavior_score=0.0)
+        self.addCleanup(detector.stop)
+
+    def test_burst_schedules_one_recomputation(self):
+        for update_profile in (False, False, True, False):
+            schedule_user_risk_update(self.user.id, update_profile=update_profile)
+        schedule_user_risk_update(self.other.id)
+        self.assertEqual(self.apply_async.call_args_list, [
+            mock.call((self.user.id, False), countdown=30),
+            mock.call((self.other.id, False), countdown=30),
+        ])
+
+    def test_profile_update_asked_for_during_the_burst_is_applied(self):
+        schedule_user_risk_update(self.user.id)
+        schedule_user_risk_update(self.user.id, update_profile=True)
+        self.assertEqual(recompute_user_risk(self.user.id, False), 55.0)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.sensitivity_score, 55.0)
+
+    def test_burst_without_profile_actions_leaves_the_score(self):
+        schedule_user_risk_update(self.user.id)
+        schedule_user_risk_update(self.user.id)
+        recompute_user_risk(self.user.id, False)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.sensitivity_score, 0.0)
+
+    def test_activity_after_the_run_schedules_again(self):
+        schedule_user_risk_update(self.user.id, update_profile=True)
+        recompute_user_risk(self.user.id, False)
+        schedule_user_risk_update(self.user.id)
+        self.assertEqual(self.apply_async.call_count, 2)
+        self.assertFalse(cache.get(f'risk_update_profile_{self.user.id}', False))
+
+    def test_per_process_cache_schedules_every_call(self):
+        self.is_shared_cache.return_value = False
+        schedule_user_risk_update(self.user.id)
+        schedule_user_risk_update(self.user.id, update_profile=True)
+        self.assertEqual(self.apply_async.call_args_list, [
+            mock.call((self.user.id, False), countdown=30),
+            mock.call((self.user.id, True), countdown=30),
+        ])
+
+    def test_recomputes_inline_without_a_broker(self):
+        self.apply_async.side_effect = ConnectionError('broker down')
+        with self.assertLogs('Dataleakage.tasks', level='ERROR'):
+            schedule_user_risk_update(self.user.id, update_profile=True)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.sensitivity_score, 55.0)
+
+
+@override_settings(EDM_INDEX_PATH=os.path.join(tempfile.gettempdir(), 'no-edm-index.npy'))
+class DataFrameScanTests(SimpleTestCase):
+    """A column-wise DataFrame scan must find what scanning each "column:value" cell as text finds"""
+
+    def setUp(self):
+        reset_edm_index()
+        self.addCleanup(reset_edm_index)
+        self.detector = AdvancedDataLeakDetector()
+        rng = random.Random(5)
+        cells = sensitive_text(seed=11, lines=240).split('\n')
+        self.frame = pd.DataFrame({
+            'ssn': [f"{rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}" for _ in range(80)],
+            'col_7': cells[:80],  # Named like nothing sensitive
+            'notes': cells[80:160],
+            'amount': [rng.randint(0, 10 ** 9) for _ in range(80)],
+        })
+
+    def cell_scan(self):
+        findings = set()
+        type_counts = {}
+        for column in ('ssn', 'col_7', 'notes'):
+            prefix = f"{column}:"
+            for row, value in self.frame[column].items():
+                cell = prefix + str(value).strip()
+                matches, counts = self.detector._scan_content(cell)
+                findings.update((match.type, match.text, match.start - len(prefix), row, column) for match in matches)
+                for sensitivity_type, count in counts.items():
+                    type_counts[sensitivity_type] = type_counts.get(sensitivity_type, 0) + count
+        return findings, type_counts
+
+    def test_findings_are_cells_of_every_text_column(self):
+        findings, type_counts = self.detector._scan_dataframe(self.frame)
+        expected_findings, expected_counts = self.cell_scan()
+        self.assertEqual({(f['type'], f['match'], f['location'], f['row'], f['column']) for f in findings},
+                         expected_findings)
+        self.assertEqual(len(findings), len(expected_findings))
+        self.assertEqual(type_counts, expected_counts)
+        self.assertEqual({f['column'] for f in findings}, {'ssn', 'col_7', 'notes'})
+
+    def test_numeric_columns_are_scanned_only_when_named_sensitive(self):
+        frame = pd.DataFrame({'amount': [123456789012] * 3, 'aadhaar': [234567890123] * 3})
+        findings, _ = self.detector._scan_dataframe(frame)
+        self.assertTrue(findings)
+        self.assertEqual({f['column'] for f in findings}, {'aadhaar'})
+
+
+class KeywordIndexTests(SimpleTestCase):
+    """Keyword lookups, indexed or not, must agree with a search of the lowercased window"""
+
+    KEYWORDS = ('ssn', 'phone', 'tax', 'dob', 'contact', ':')
+
+    def windows(self, text, count=400):
+        rng = random.Random(len(text))
+        for _ in range(count):
+            start = rng.randrange(len(text))
+            yield start, min(len(text), start + rng.randint(0, 250))
+
+    def expected(self, text, keyword, start, end):
+        for position in range(start, end - len(keyword) + 1):
+            if text[position:position + len(keyword)].lower() == keyword:
+                return position
+        return -1
+
+    def assertFindsLikeWindowSearch(self, text):
+        for min_lookups in (10 ** 9, 1):  # Never indexed, then indexed almost at once
+            with self.subTest(min_lookups=min_lookups), \
+                    mock.patch.object(KeywordIndex, 'INDEX_MIN_LOOKUPS', min_lookups):
+                index = KeywordIndex(text)
+                for start, end in self.windows(text):
+                    for keyword in self.KEYWORDS:
+                        self.assertEqual(index.find(keyword, start, end), self.expected(text, keyword, start, end))
+
+    def test_matches_window_search(self):
+        self.assertFindsLikeWindowSearch(sensitive_text(seed=12, lines=60).upper())
+
+    def test_offsets_stay_aligned_when_lowercasing_changes_length(self):
+        # 'İ' lowercases to two characters
+        text = sensitive_text(seed=13, lines=60).replace('straße', 'İSTANBUL')
+        self.assertIn('İ', text)
+        self.assertFindsLikeWindowSearch(text)
+
+    def test_contains_any(self):
+        index = KeywordIndex('Contact: +1 (555) 010-0199')
+        self.assertTrue(index.contains_any(('ssn', 'contact'), 0, 10))
+        self.assertFalse(index.contains_any(('ssn', 'contact'), 1, 10))
+
+
+class AnomalyRuleWindowTests(TestCase):
+    """Each anomaly rule fires once its events within its window reach the rule's count, read in one query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst')
+
+    def setUp(self):
+        counters = ActivityCounters(LocMemCache('anomaly-rule-window-tests', {}))
+        patcher = mock.patch('Dataleakage.detection.get_activity_counters', return_value=counters)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def log(self, actions, age):
+        now = timezone.now()
+        UserActivityLog.objects.bulk_create([UserActivityLog(user=self.user, action=action, timestamp=now - age)
+                                             for action in actions])
+
+    def detect(self):
+        with self.assertNumQueries(1):
+            return AnomalyDetector(self.user).detect_anomalies()
+
+    def test_each_rule(self):
+        for rule in AnomalyDetector.RULES:
+            with self.subTest(rule.message):
+                UserActivityLog.objects.all().delete()
+                events = [rule.actions[position % len(rule.actions)] for position in range(rule.count)]
+                # Just outside the window: not counted
+                self.log(events[:-1], rule.window * 0.9)
+                self.log(events[-1:], rule.window + timedelta(minutes=1))
+                self.assertEqual(self.detect(), ([], 0))
+
+                self.log(events[-1:], rule.window * 0.5)
+                anomalies, score = self.detect()
+                self.assertEqual(anomalies, [rule.message])
+                self.assertEqual(score, rule.points / AnomalyDetector.MAX_ANOMALY_SCORE * 100)
+
+    def test_rules_add_up(self):
+        for rule in AnomalyDetector.RULES:
+            self.log(list(rule.actions) * rule.count, timedelta(seconds=30))
+        self.log(['Viewed file'] * 10, timedelta(seconds=30))
+        anomalies, score = self.detect()
+        self.assertEqual(anomalies, [rule.message for rule in AnomalyDetector.RULES])
+        self.assertEqual(score, 100)
+
+
+class UploadBehaviorScoreTests(TestCase):
+    """Recent uploads are scored from their stored scan results; the files themselves are never read"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('uploader')
+
+    def upload(self, minutes_ago, **fields):
+        # The file is never written, so reading it would fail the scoring
+        data_file = DataFile.objects.create(title='upload', file='data_files/missing.csv', file_type='csv',
+                                            uploaded_by=self.user, user=self.user, **fields)
+        UserActivityLog.objects.bulk_create([UserActivityLog(
+            user=self.user, action='Uploaded file', data_file=data_file,
+            timestamp=timezone.now() - timedelta(minutes=minutes_ago))])
+
+    def test_scores_come_from_scan_cache_or_stored_content_score(self):
+        ScanCacheEntry.objects.create(content_hash='current', rule_set_version=get_detector().rule_set_version,
+                                      sensitivity_score=20.0)
+        ScanCacheEntry.objects.create(content_hash='old rules', rule_set_version='0' * 16, sensitivity_score=0.0)
+        self.upload(1, scan_status=DataFile.SCAN_DONE, content_hash='current', content_score=90.0)
+        self.upload(20, scan_status=DataFile.SCAN_DONE, content_hash='old rules', content_score=30.0)
+        # Still scanning, or scanned before content scores were stored: skipped
+        self.upload(30, scan_status=DataFile.SCAN_QUEUED, content_score=0.0)
+        self.upload(40, scan_status=DataFile.SCAN_DONE, content_score=None)
+        # (50 - 20) * 0.2 + (50 - 30) * 0.2 points out of 60
+        self.assertEqual(UserBehaviorAnalyzer(self.user).analyze_behavior(), round(10 / 60 * 100, 2))
+
+    def test_rapid_uploads_compare_the_two_latest(self):
+        self.upload(50, scan_status=DataFile.SCAN_DONE, content_score=100.0)
+        self.upload(10, scan_status=DataFile.SCAN_DONE, content_score=100.0)
+        self.assertEqual(UserBehaviorAnalyzer(self.user).analyze_behavior(), 0)
+        self.upload(7, scan_status=DataFile.SCAN_DONE, content_score=100.0)
+        self.assertEqual(UserBehaviorAnalyzer(self.user).analyze_behavior(), round(10 / 60 * 100, 2))
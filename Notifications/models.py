@@ -50,3 +50,12 @@ class Notification(models.Model):
         verbose_name = 'Notification'
         verbose_name_plural = 'Notifications'
         ordering = ['-timestamp']
+        indexes = [
+            # All notifications of a user, newest first
+            models.Index(fields=['user', '-timestamp'], name='notification_user_time_idx'),
+            # Unread notifications of a user, newest first. Partial, since is_read=False
+            # compiles to "NOT is_read" on SQLite, which no column of an index can match;
+            # declared last so the planner prefers it when both indexes cost the same
+            models.Index(fields=['user', '-timestamp'], condition=models.Q(is_read=False),
+                         name='notification_user_unread_idx'),
+        ]
@@ -1,3 +1,44 @@
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Notification
+
+
+@skipUnless(connection.vendor == 'sqlite', "Query plans are checked with SQLite's EXPLAIN QUERY PLAN")
+class NotificationIndexTests(TestCase):
+    """Notification lists are read newest first per user; neither a table scan nor a sort is allowed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('SCAN Notifications_notification', plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_unread_notifications_use_read_index(self):
+        self.assertUsesIndex(Notification.unread_notifications(self.user), 'notification_user_unread_idx')
+
+    def test_unread_notifications_use_read_index_with_statistics(self):
+        # Most notifications have been read, as in production once ANALYZE has run
+        Notification.objects.bulk_create([
+            Notification(user=self.user, notification_type='system', severity='info',
+                         message=f'Notification {index}', is_read=index % 10 != 0)
+            for index in range(200)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertUsesIndex(Notification.unread_notifications(self.user), 'notification_user_unread_idx')
+
+    def test_notification_list_uses_time_index(self):
+        queryset = Notification.objects.filter(user=self.user).order_by('-timestamp')
+        self.assertUsesIndex(queryset, 'notification_user_time_idx')
+
+    def test_recent_alerts_use_time_index(self):
+        queryset = Notification.objects.filter(user=self.user).order_by('-timestamp')[:3]
+        self.assertUsesIndex(queryset, 'notification_user_time_idx')
@@ -6,7 +6,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from Accounts.models import Profile
 from .models import Project
-from Accounts.models import UserActivityLog
+from Accounts.activity import log_activity
 from .forms import ProjectForm
 
 
@@ -25,10 +25,12 @@ def create_project(request):
                 messages.success(request, 'Project created successfully!')
 
                 # Log the creation of the project
-                UserActivityLog.objects.create(
+                log_activity(
                     user=request.user,
                     action='Created project',
-                    details=f'User {request.user.username} created project {project.name}.'
+                    project=project,
+                    details=f'User {request.user.username} created project {project.name}.',
+                    payload={'project_name': project.name}
                 )
 
                 return redirect('project_list')  # Replace with your success URL
@@ -73,10 +75,12 @@ def edit_project(request, project_id):
             messages.success(request, 'Project updated successfully!')
 
             # Log the update of the project
-            UserActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 action='Updated project',
-                details=f'User {request.user.username} updated project {project.name}.'
+                project=project,
+                details=f'User {request.user.username} updated project {project.name}.',
+                payload={'project_name': project.name}
             )
 
             return redirect('project_list')
@@ -102,10 +106,11 @@ def delete_project(request, project_id):
     messages.success(request, 'Project deleted successfully!')
 
     # Log the deletion of the project
-    UserActivityLog.objects.create(
+    log_activity(
         user=request.user,
         action='Deleted project',
-        details=f'User {request.user.username} deleted project {project_name}.'
+        details=f'User {request.user.username} deleted project {project_name}.',
+        payload={'project_name': project_name}
     )
 
     return redirect('project_list')  # Redirect after deletion
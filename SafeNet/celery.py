@@ -3,6 +3,7 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SafeNet.settings')
@@ -18,6 +19,20 @@ app.config_from_object('django.conf.settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_process_init.connect
+def warm_up_detector(**kwargs):
+    # Build the shared detector in each worker process before it takes a task
+    from Dataleakage.detection import get_detector
+    get_detector()
+
+
+@worker_process_shutdown.connect
+def flush_activity_logs(**kwargs):
+    # Pool processes may exit without running atexit handlers
+    from Accounts.activity import flush_activity_logs
+    flush_activity_logs()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print('Request: {0!r}'.format(self.request))
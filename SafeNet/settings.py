@@ -1,11 +1,15 @@
 from pathlib import Path
 import os
+import sys
 
 from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Test runs use local stand-ins for the broker and the shared caches
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -135,11 +139,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # your_project/settings.py
 
 # Celery Configuration
-CELERY_BROKER_URL = 'redis://127.0.0.1:6379'  # Use Redis as the broker
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379')
+CELERY_BROKER_URL = REDIS_URL  # Use Redis as the broker
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_BACKEND = 'django-db'  # For result storage
 CELERY_TIMEZONE = 'Asia/Kolkata'  # Set your preferred timezone
+# Run tasks inline instead of through the broker, e.g. for tests or local development without Redis
+CELERY_TASK_ALWAYS_EAGER = TESTING or os.environ.get('CELERY_TASK_ALWAYS_EAGER') == '1'
 
 # Celery Beat configuration (if you want to use periodic tasks)
 from celery.schedules import crontab
@@ -156,6 +163,80 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'Dataleakage.tasks.update_all_user_sensitivity_scores',
         'schedule': crontab(minute='*/3'),  # This will run every 5 minutes
     },
+
+    # Fold old activity logs into daily rollups every night
+    'compact_activity_logs_nightly': {
+        'task': 'Accounts.tasks.compact_activity_logs',
+        'schedule': crontab(hour=2, minute=30),
+    },
+}
+
+# Data leakage scanning
+SCAN_CHUNK_BUDGET_BYTES = 64 * 1024 * 1024  # Memory budget for one chunk of a streamed CSV scan
+SCAN_TEXT_BLOCK_CHARS = 1024 * 1024  # Characters read per block when streaming a text file
+SCAN_WORKERS = None  # Processes used for large scans; None uses every core
+SCAN_PARALLEL_MIN_BYTES = 32 * 1024 * 1024  # Smaller content is scanned in the calling process
+SCAN_MAX_FINDINGS_PER_TYPE = 100  # Findings stored per sensitivity type; the per-type counts cover every match
+EDM_INDEX_PATH = os.path.join(BASE_DIR, 'edm_index.npy')  # Exact Data Match index; ignored if the file is missing
+EDM_SALT = os.environ.get('EDM_SALT')  # Key for the index hashes; falls back to SECRET_KEY
+SCAN_SWEEP_BATCH_SIZE = 500  # Files checked per batch by the periodic rescan
+SCAN_SWEEP_TIME_LIMIT = 240  # Seconds a periodic rescan runs before resuming from its checkpoint next time
+SCAN_STALL_TIMEOUT = 60 * 60  # Seconds a queued or running scan may go without progress before the sweep queues it again
+RISK_UPDATE_MAX_STALENESS = 30  # Seconds after a user's activity within which their risk is recomputed
+
+# DataExplorer
+DATAFRAME_CACHE_BYTES = 512 * 1024 * 1024  # Memory the parsed DataFrames of recently viewed files may take per process
+QUERY_CACHE_BYTES = 64 * 1024 * 1024  # Memory the row orders of recent DataExplorer queries may take per process
+
+# Activity log writes
+ACTIVITY_LOG_BUFFER_SIZE = 100  # Logs queued per process before they are written in one batch
+ACTIVITY_LOG_FLUSH_INTERVAL = 2.0  # Seconds a queued log waits at most before it is written
+ACTIVITY_LOG_SPOOL_DIR = os.path.join(BASE_DIR, 'activity_spool')  # Logs that could not be written wait here
+
+# Activity log retention
+ACTIVITY_LOG_RETENTION_DAYS = 90  # Older logs are folded into per-user, per-action daily rollups
+ACTIVITY_COMPACTION_BATCH_SIZE = 1000  # Logs compacted and deleted per transaction
+
+# Caches
+# Web and Celery processes share task locks, risk update markers and the sliding-window
+# activity counters of the anomaly rules through these caches, so they live in Redis
+# next to the broker. Per-process LocMemCache stands in for tests, and with LOCAL_CACHES=1
+# for a single development process without Redis.
+if TESTING or os.environ.get('LOCAL_CACHES') == '1':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'activity': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'activity-counters',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': f'{REDIS_URL}/1',
+        },
+        'activity': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': f'{REDIS_URL}/2',
+        },
+    }
+ACTIVITY_COUNTER_CACHE = 'activity'
+ACTIVITY_COUNTER_BUCKET_SECONDS = 10  # Counter granularity; windows are exact to one bucket
+
+# Logging
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': 'INFO',
+    },
 }
 
 # Authentication settings
@@ -7,7 +7,7 @@ from Accounts.models import Profile
 from .models import Task
 from .forms import TaskForm
 from Notifications.models import Notification
-from Accounts.models import UserActivityLog  # Ensure this is imported
+from Accounts.activity import log_activity
 
 @login_required
 def task_list(request):
@@ -40,10 +40,13 @@ def create_task(request):
             messages.success(request, 'Task created and notifications sent successfully!')
 
             # Log task creation activity
-            UserActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 action='Created task',
-                details=f'User {request.user.username} created task "{task.task_name}".'
+                task=task,
+                project_id=task.project_id,
+                details=f'User {request.user.username} created task "{task.task_name}".',
+                payload={'task_name': task.task_name}
             )
 
             return redirect('tasks:task_list')
@@ -78,10 +81,13 @@ def edit_task(request, task_id):
                 )
 
             # Log task update activity
-            UserActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 action='Updated task',
-                details=f'User {request.user.username} updated task "{updated_task.task_name}".'
+                task=updated_task,
+                project_id=updated_task.project_id,
+                details=f'User {request.user.username} updated task "{updated_task.task_name}".',
+                payload={'task_name': updated_task.task_name}
             )
 
             return redirect('tasks:task_list')
@@ -112,10 +118,11 @@ def delete_task(request, task_id):
                 )
 
             # Log the activity
-            UserActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 action='Deleted task',
-                details=f'User {request.user.username} deleted task "{task_name}".'
+                details=f'User {request.user.username} deleted task "{task_name}".',
+                payload={'task_name': task_name}
             )
 
             return JsonResponse({'success': True, 'message': 'Task deleted successfully'})